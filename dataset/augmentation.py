@@ -0,0 +1,176 @@
+import math
+import torch
+from typing import Dict, List, Optional, Union
+from .build import AUGMENTATIONS, build_augmentation_from_cfg
+
+
+class BatchTransform:
+    """
+    Base class of the batched augmentations: a transform of a whole (B, k, C) batch of point clouds with
+    random parameters per sample, all drawn in one call from a generator on the device of the batch.
+    Only the xyz channels (the first three) are transformed.
+
+    :param config: Configuration with the optional key P, the probability that a sample is transformed.
+    """
+    def __init__(self, config) -> None:
+        self.p = config.get('P', 1.0)
+
+    def mask(self, points: torch.Tensor, generator: torch.Generator) -> Optional[torch.Tensor]:
+        """
+        Draw which samples of a batch are transformed.
+
+        :param points: The (B, k, C) batch.
+        :param generator: The random generator.
+        :return: A (B, 1, 1) float mask, or None when every sample is transformed.
+        """
+        if self.p >= 1:
+            return None
+        return (torch.rand(points.shape[0], 1, 1, device=points.device, generator=generator) < self.p).float()
+
+    def transform(self, xyz: torch.Tensor, generator: torch.Generator) -> torch.Tensor:
+        raise NotImplementedError
+
+    def __call__(self, points: torch.Tensor, generator: torch.Generator) -> torch.Tensor:
+        xyz = self.transform(points[..., :3], generator)
+        if points.shape[-1] == 3:
+            return xyz
+        return torch.cat([xyz, points[..., 3:]], dim=-1)
+
+
+@AUGMENTATIONS.register_module()
+class RandomScale(BatchTransform):
+    """
+    Scale every cloud by a random factor in [LOW, HIGH], per axis with ANISOTROPIC.
+    """
+    def __init__(self, config) -> None:
+        super().__init__(config)
+        self.low = config.get('LOW', 0.8)
+        self.high = config.get('HIGH', 1.25)
+        self.anisotropic = config.get('ANISOTROPIC', True)
+
+    def transform(self, xyz: torch.Tensor, generator: torch.Generator) -> torch.Tensor:
+        shape = (xyz.shape[0], 1, 3 if self.anisotropic else 1)
+        scale = torch.empty(shape, device=xyz.device).uniform_(self.low, self.high, generator=generator)
+        mask = self.mask(xyz, generator)
+        if mask is not None:
+            scale = 1 + mask * (scale - 1)
+        return xyz * scale
+
+
+@AUGMENTATIONS.register_module()
+class RandomRotate(BatchTransform):
+    """
+    Rotate every cloud around AXIS (x, y or z) by a random angle in [-MAX_ANGLE, MAX_ANGLE] degrees.
+    """
+    AXES = {'x': 0, 'y': 1, 'z': 2}
+
+    def __init__(self, config) -> None:
+        super().__init__(config)
+        axis = config.get('AXIS', 'y')
+        if axis not in self.AXES:
+            raise ValueError(f'Unsupported rotation axis {axis}. Supported axes: {list(self.AXES)}')
+        self.axis = self.AXES[axis]
+        self.max_angle = math.radians(config.get('MAX_ANGLE', 180))
+
+    def transform(self, xyz: torch.Tensor, generator: torch.Generator) -> torch.Tensor:
+        angle = torch.empty(xyz.shape[0], device=xyz.device).uniform_(-self.max_angle, self.max_angle,
+                                                                      generator=generator)
+        mask = self.mask(xyz, generator)
+        if mask is not None:
+            angle = angle * mask.view(-1)
+        cos, sin = torch.cos(angle), torch.sin(angle)
+        # (B, 3, 3) rotation matrices: identity on the axis, a 2D rotation of the two other coordinates.
+        i, j = [k for k in range(3) if k != self.axis]
+        rotation = torch.zeros(xyz.shape[0], 3, 3, device=xyz.device, dtype=xyz.dtype)
+        rotation[:, self.axis, self.axis] = 1
+        rotation[:, i, i] = cos
+        rotation[:, i, j] = -sin
+        rotation[:, j, i] = sin
+        rotation[:, j, j] = cos
+        return torch.bmm(xyz, rotation.transpose(1, 2))
+
+
+@AUGMENTATIONS.register_module()
+class RandomTranslate(BatchTransform):
+    """
+    Shift every cloud by a random offset in [-SHIFT, SHIFT] per axis.
+    """
+    def __init__(self, config) -> None:
+        super().__init__(config)
+        self.shift = config.get('SHIFT', 0.1)
+
+    def transform(self, xyz: torch.Tensor, generator: torch.Generator) -> torch.Tensor:
+        offset = torch.empty(xyz.shape[0], 1, 3, device=xyz.device).uniform_(-self.shift, self.shift,
+                                                                             generator=generator)
+        mask = self.mask(xyz, generator)
+        if mask is not None:
+            offset = offset * mask
+        return xyz + offset
+
+
+@AUGMENTATIONS.register_module()
+class RandomJitter(BatchTransform):
+    """
+    Add Gaussian noise with standard deviation SIGMA, clipped to [-CLIP, CLIP], to every point.
+    """
+    def __init__(self, config) -> None:
+        super().__init__(config)
+        self.sigma = config.get('SIGMA', 0.01)
+        self.clip = config.get('CLIP', 0.05)
+
+    def transform(self, xyz: torch.Tensor, generator: torch.Generator) -> torch.Tensor:
+        noise = torch.randn(xyz.shape, device=xyz.device, dtype=xyz.dtype, generator=generator)
+        noise = (noise * self.sigma).clamp_(-self.clip, self.clip)
+        mask = self.mask(xyz, generator)
+        if mask is not None:
+            noise = noise * mask
+        return xyz + noise
+
+
+class BatchAugmentation:
+    """
+    A pipeline of batched augmentations, applied in order to the collated batch, e.g. right after it
+    was moved to the GPU. The random parameters come from an own generator on the device, so they do
+    not depend on other users of the global generators (e.g. DataLoader seeding), and its state can be
+    checkpointed to resume the exact sequence.
+
+    :param transforms: The augmentations.
+    :param device: The device of the batches.
+    :param seed: Seed of the generator.
+    """
+    def __init__(self, transforms: List[BatchTransform], device: Union[str, torch.device] = 'cpu',
+                 seed: int = 0) -> None:
+        self.transforms = transforms
+        self.generator = torch.Generator(device=device)
+        self.generator.manual_seed(seed)
+
+    def __call__(self, points: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            points = points.float()
+            for transform in self.transforms:
+                points = transform(points, self.generator)
+        return points
+
+    def state_dict(self) -> Dict[str, torch.Tensor]:
+        return {'generator': self.generator.get_state()}
+
+    def load_state_dict(self, state_dict: Dict[str, torch.Tensor]) -> None:
+        self.generator.set_state(state_dict['generator'])
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({[type(transform).__name__ for transform in self.transforms]})'
+
+
+def build_augmentations(configs: Optional[List[dict]], device: Union[str, torch.device] = 'cpu',
+                        seed: int = 0) -> Optional[BatchAugmentation]:
+    """
+    Build the augmentation pipeline declared by the AUGMENTATION list of a dataset config.
+
+    :param configs: The augmentations, each a dict with its registered NAME and options.
+    :param device: The device of the batches.
+    :param seed: Seed of the generator, e.g. the seed of the run plus the rank.
+    :return: The pipeline, or None when no augmentation is configured.
+    """
+    if not configs:
+        return None
+    return BatchAugmentation([build_augmentation_from_cfg(config) for config in configs], device=device, seed=seed)
@@ -0,0 +1,132 @@
+import os
+import torch
+import torch.utils.data as data
+from typing import Dict, List, Optional
+from utils.logger import print_log
+
+
+class CollatedBatch(list):
+    """
+    The per-sample list a dataset's ``__getitems__`` hands to the DataLoader's collate function, carrying
+    the already collated batch along, so the collate function returns it without touching the samples.
+
+    :param samples: The per-sample tuples.
+    :param collated: The collated batch.
+    """
+    def __init__(self, samples: List[tuple], collated: list) -> None:
+        super().__init__(samples)
+        self.collated = collated
+
+
+class BatchBuffers:
+    """
+    A ring of reusable float32 batch buffers per process.
+
+    In a DataLoader worker the buffers live in shared memory. Every batch is written into the next slot,
+    so a worker no longer creates, fills and sends a fresh shared memory segment per batch: the main
+    process receives views of storages it has mapped before. Smaller batches (e.g. the last one) use
+    the leading rows of a slot.
+
+    A slot is overwritten ``size`` batches later, so a batch must not be used after that many later batches
+    of the same worker were produced. With the DataLoader keeping at most prefetch_factor batches per worker
+    in flight, ``prefetch_factor + 2`` slots leave the current batch and the previous one untouched; clone
+    a batch to keep it for longer.
+
+    :param size: The number of slots.
+    """
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._slots: List[torch.Tensor] = []
+        self._next = 0
+        self._pid = None
+
+    def __getstate__(self) -> dict:
+        # Workers allocate their own buffers.
+        return {'size': self.size, '_slots': [], '_next': 0, '_pid': None}
+
+    def next(self, shape: tuple) -> torch.Tensor:
+        """
+        Advance to the next slot.
+
+        :param shape: The (B, k, C) shape of the batch.
+        :return: A (B, k, C) view of the slot's buffer.
+        """
+        if self._pid != os.getpid():
+            self._slots, self._next, self._pid = [], 0, os.getpid()
+        slot = self._next
+        self._next = (self._next + 1) % self.size
+        if slot == len(self._slots):
+            self._slots.append(self._allocate(shape))
+        elif self._slots[slot].shape[0] < shape[0] or self._slots[slot].shape[1:] != shape[1:]:
+            self._slots[slot] = self._allocate(shape)
+        return self._slots[slot][:shape[0]]
+
+    @staticmethod
+    def _allocate(shape: tuple) -> torch.Tensor:
+        buffer = torch.empty(shape, dtype=torch.float32)
+        if data.get_worker_info() is not None:
+            buffer.share_memory_()
+        return buffer
+
+
+class DeviceTransfer:
+    """
+    Copies batches to the device, with ``pin`` asynchronously straight from reusable batch buffers.
+
+    With pin, the storages of received batches are registered as pinned memory in place (cudaHostRegister)
+    the first time they are seen, so ``non_blocking`` copies are truly asynchronous without the extra copy
+    into a pinned staging buffer that DataLoader(pin_memory=True) makes. Before a new copy is issued, the
+    copy of the previous batch is waited for, so a buffer is never rewritten while the GPU still reads it.
+
+    :param device: The target device.
+    :param pin: Whether to pin the batch storages, only used on CUDA devices.
+    :param max_registered: Registered storages kept; beyond this all are unregistered, e.g. after
+                           non-persistent workers restarted with new buffers.
+    :param logger: Optional logger name.
+    """
+    def __init__(self, device: torch.device, pin: bool = False, max_registered: int = 256,
+                 logger: Optional[str] = None) -> None:
+        self.device = device
+        self.max_registered = max_registered
+        self.logger = logger
+        self.enabled = pin and device.type == 'cuda'
+        # data_ptr -> storage, kept alive while registered.
+        self._registered: Dict[int, torch.UntypedStorage] = {}
+        self._event = None
+
+    def _register(self, tensor: torch.Tensor) -> None:
+        storage = tensor.untyped_storage()
+        if storage.data_ptr() in self._registered:
+            return
+        if len(self._registered) >= self.max_registered:
+            self.release()
+        cudart = torch.cuda.cudart()
+        if int(cudart.cudaHostRegister(storage.data_ptr(), storage.nbytes(), 0)) != 0:
+            print_log('[DATASET] Pinning batch buffers failed, copying from pageable memory', logger=self.logger)
+            self.enabled = False
+            return
+        self._registered[storage.data_ptr()] = storage
+
+    def release(self) -> None:
+        """
+        Unregister all registered storages.
+        """
+        if not self._registered:
+            return
+        if self._event is not None:
+            self._event.synchronize()
+        cudart = torch.cuda.cudart()
+        for ptr in self._registered:
+            cudart.cudaHostUnregister(ptr)
+        self._registered = {}
+
+    def __call__(self, tensor: torch.Tensor) -> torch.Tensor:
+        if not self.enabled:
+            return tensor.to(self.device, non_blocking=True)
+        if self._event is not None:
+            self._event.synchronize()
+        self._register(tensor)
+        result = tensor.to(self.device, non_blocking=True)
+        self._event = torch.cuda.Event()
+        self._event.record()
+        return result
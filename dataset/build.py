@@ -3,6 +3,17 @@ from utils import registry
 
 
 DATASETS = registry.Registry('dataset')
+# Dataset implementations are imported when a config first builds them.
+DATASETS.register_lazy('PartNet', 'dataset.part_net.ShapeNet')
+DATASETS.register_lazy('ShapeNet', 'dataset.part_net.ShapeNet')
+DATASETS.register_lazy('ShapeNetStream', 'dataset.part_net_stream.ShapeNetStream')
+
+AUGMENTATIONS = registry.Registry('augmentation')
+# Batched augmentations of collated batches, see dataset/augmentation.py.
+AUGMENTATIONS.register_lazy('RandomScale', 'dataset.augmentation.RandomScale')
+AUGMENTATIONS.register_lazy('RandomRotate', 'dataset.augmentation.RandomRotate')
+AUGMENTATIONS.register_lazy('RandomTranslate', 'dataset.augmentation.RandomTranslate')
+AUGMENTATIONS.register_lazy('RandomJitter', 'dataset.augmentation.RandomJitter')
 
 
 def build_dataset_from_cfg(cfg: Dict[str, Any], default_args: Optional[Dict[str, Any]] = None) -> Any:
@@ -17,5 +28,12 @@ def build_dataset_from_cfg(cfg: Dict[str, Any], default_args: Optional[Dict[str,
     return DATASETS.build(cfg, default_args=default_args)
 
 
+def build_augmentation_from_cfg(cfg: Dict[str, Any], default_args: Optional[Dict[str, Any]] = None) -> Any:
+    """
+    Build a batched augmentation, defined by the 'NAME' key in the cfg dictionary.
 
-
+    :param cfg: A dictionary containing the configuration for the augmentation.
+    :param default_args: Optional default arguments for building the augmentation.
+    :return: A constructed augmentation specified by the NAME key in the cfg dictionary.
+    """
+    return AUGMENTATIONS.build(cfg, default_args=default_args)
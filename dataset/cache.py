@@ -0,0 +1,255 @@
+import os
+import mmap
+import fcntl
+import atexit
+import random
+import tempfile
+import threading
+import numpy as np
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+
+_MAGIC = 0x53414d50434143  # 'SAMPCAC'
+_HEADER_FIELDS = 8  # magic, num_slots, slot_points, channels, num_keys, clock_hand, ready, filled slots
+_COUNTER_FIELDS = 4  # hits, misses, evictions, inserts
+
+
+class SharedSampleCache:
+    """
+    A fixed-budget cache of decoded float32 point clouds in shared memory.
+
+    The cache lives in a memory-mapped file (under /dev/shm when available). Every process that opens a
+    cache with the same name maps the same region, which covers forked DataLoader workers and the other
+    local ranks of a node. Memory is split into ``budget_bytes // slot_bytes`` slots of
+    ``slot_points`` rows each, and slots are reclaimed with the clock (second chance) algorithm.
+    Lookups and insertions are serialized with an flock on a lock file next to the region (plus a thread
+    lock, since reader threads of one process share the flock). A hit only pins its slot under the lock
+    and copies the rows out after releasing it; pinned slots are never evicted.
+
+    Training visits every sample once per epoch in random order, which makes any recency-based policy
+    thrash when the dataset does not fit. Once the cache is full a miss is therefore only admitted with
+    probability ``admission``, so a stable subset stays resident and the hit rate approaches
+    ``num_slots / num_keys`` instead of dropping to zero.
+
+    :param name: Name of the shared region. Processes using the same name share the cache.
+    :param num_keys: Number of distinct keys (samples). Keys are integers in [0, num_keys).
+    :param slot_points: Maximum number of points of a cached cloud.
+    :param channels: Number of channels per point.
+    :param budget_bytes: Memory budget for the cached point data.
+    :param persist: Keep the region after the creating process exits, so later runs start warm.
+    :param admission: Probability of admitting a miss once all slots are in use.
+    """
+    def __init__(self, name: str, num_keys: int, slot_points: int, channels: int = 3,
+                 budget_bytes: int = 4 * 1024 ** 3, persist: bool = False, admission: float = 0.05) -> None:
+        self.admission = admission
+        self.slot_points = slot_points
+        self.channels = channels
+        self.num_keys = num_keys
+        self.num_slots = max(1, min(num_keys, budget_bytes // (slot_points * channels * 4)))
+
+        shm_root = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+        self.path = os.path.join(shm_root, f'{name}.cache')
+        self.lock_path = f'{self.path}.lock'
+
+        self._lock_fd = None
+        self._lock_pid = None
+        self._thread_lock = None
+        self._mmap = None
+        self._create_or_attach()
+        if self._created and not persist:
+            atexit.register(self._unlink_at_exit, os.getpid())
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Total size of the shared region in bytes.
+        """
+        return (8 * (_HEADER_FIELDS + _COUNTER_FIELDS)
+                + 4 * self.num_keys
+                + 13 * self.num_slots
+                + 4 * self.num_slots * self.slot_points * self.channels)
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        # flock locks belong to the open file description, which a forked child shares with its
+        # parent. Reopen the lock file in every process so the lock really excludes other processes.
+        if self._lock_pid != os.getpid():
+            self._lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+            self._thread_lock = threading.Lock()
+            self._lock_pid = os.getpid()
+        with self._thread_lock:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _create_or_attach(self) -> None:
+        with self._locked():
+            self._created = not os.path.exists(self.path)
+            if not self._created and os.path.getsize(self.path) != self.nbytes:
+                # Stale region from a run with a different layout.
+                os.unlink(self.path)
+                self._created = True
+            file_fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                if self._created:
+                    os.ftruncate(file_fd, self.nbytes)
+                self._mmap = mmap.mmap(file_fd, self.nbytes, mmap.MAP_SHARED)
+            finally:
+                os.close(file_fd)
+            self._map_arrays()
+            if self._created:
+                self._header[:] = [_MAGIC, self.num_slots, self.slot_points, self.channels, self.num_keys, 0, 1, 0]
+                self._counters[:] = 0
+                self._key_to_slot[:] = -1
+                self._slot_key[:] = -1
+                self._slot_rows[:] = 0
+                self._slot_pins[:] = 0
+                self._slot_ref[:] = 0
+            elif self._header[0] != _MAGIC or self._header[6] != 1:
+                raise RuntimeError(f'Shared sample cache {self.path} is corrupt, remove it and retry')
+
+    def _map_arrays(self) -> None:
+        buffer, offset = self._mmap, 0
+
+        def view(dtype, count):
+            nonlocal offset
+            array = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+            offset += array.nbytes
+            return array
+
+        self._header = view(np.int64, _HEADER_FIELDS)
+        self._counters = view(np.int64, _COUNTER_FIELDS)
+        self._key_to_slot = view(np.int32, self.num_keys)
+        self._slot_key = view(np.int32, self.num_slots)
+        self._slot_rows = view(np.int32, self.num_slots)
+        # Readers copying out of a slot.
+        self._slot_pins = view(np.int32, self.num_slots)
+        self._slot_ref = view(np.uint8, self.num_slots)
+        self._data = view(np.float32, self.num_slots * self.slot_points * self.channels).reshape(
+            self.num_slots, self.slot_points, self.channels)
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        for key in ('_mmap', '_header', '_counters', '_key_to_slot', '_slot_key', '_slot_rows', '_slot_pins', '_slot_ref',
+                    '_data'):
+            state.pop(key, None)
+        state['_lock_fd'], state['_lock_pid'], state['_thread_lock'] = None, None, None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        # Spawned workers: attach to the existing region instead of copying it.
+        self.__dict__.update(state)
+        self._created = False
+        file_fd = os.open(self.path, os.O_RDWR)
+        try:
+            self._mmap = mmap.mmap(file_fd, self.nbytes, mmap.MAP_SHARED)
+        finally:
+            os.close(file_fd)
+        self._map_arrays()
+
+    def get(self, key: int, indices: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """
+        Look up a cached cloud.
+
+        :param key: The sample key.
+        :param indices: Optional row indices to gather; only these rows are copied out.
+        :return: A private copy of the cloud (or of the selected rows), or None on a miss.
+        """
+        with self._locked():
+            slot = self._key_to_slot[key]
+            if slot < 0:
+                self._counters[1] += 1
+                return None
+            self._counters[0] += 1
+            self._slot_ref[slot] = 1
+            self._slot_pins[slot] += 1
+            num_rows = self._slot_rows[slot]
+        try:
+            rows = self._data[slot, :num_rows]
+            return rows[indices] if indices is not None else rows.copy()
+        finally:
+            with self._locked():
+                self._slot_pins[slot] -= 1
+
+    def put(self, key: int, data: np.ndarray) -> bool:
+        """
+        Insert a cloud, evicting another one if the cache is full.
+
+        :param key: The sample key.
+        :param data: The (rows, channels) point cloud.
+        :return: Whether the cloud was cached. Clouds larger than a slot and rejected admissions are not cached.
+        """
+        if data.ndim != 2 or data.shape[0] > self.slot_points or data.shape[1] != self.channels:
+            return False
+        with self._locked():
+            if self._key_to_slot[key] >= 0:
+                return True
+            if self._header[7] >= self.num_slots and random.random() >= self.admission:
+                return False
+            slot = self._find_slot()
+            if slot < 0:
+                return False
+            old_key = self._slot_key[slot]
+            if old_key >= 0:
+                self._key_to_slot[old_key] = -1
+                self._counters[2] += 1
+            else:
+                self._header[7] += 1
+            self._data[slot, :len(data)] = data
+            self._slot_rows[slot] = len(data)
+            self._slot_key[slot] = key
+            self._slot_ref[slot] = 1
+            self._key_to_slot[key] = slot
+            self._counters[3] += 1
+            return True
+
+    def _find_slot(self) -> int:
+        # Clock sweep: skip (and clear) recently referenced slots, take the first free or unreferenced one
+        # that no reader has pinned. Two sweeps clear every reference, so -1 means all slots are pinned.
+        hand = int(self._header[5])
+        for _ in range(2 * self.num_slots):
+            slot = hand
+            hand = (hand + 1) % self.num_slots
+            if self._slot_pins[slot] > 0:
+                continue
+            if self._slot_key[slot] < 0 or not self._slot_ref[slot]:
+                self._header[5] = hand
+                return slot
+            self._slot_ref[slot] = 0
+        self._header[5] = hand
+        return -1
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Cache counters, aggregated over all processes sharing the cache.
+
+        :return: A dict with hits, misses, evictions, inserts, cached entries and slots.
+        """
+        hits, misses, evictions, inserts = (int(counter) for counter in self._counters)
+        return {
+            'hits': hits,
+            'misses': misses,
+            'evictions': evictions,
+            'inserts': inserts,
+            'entries': int(self._header[7]),
+            'slots': self.num_slots,
+        }
+
+    def unlink(self) -> None:
+        """
+        Remove the shared region. Processes that already mapped it keep working on their mapping.
+
+        The lock file is kept, so processes still using the region keep locking the same file.
+        """
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _unlink_at_exit(self, creator_pid: int) -> None:
+        # Forked children inherit atexit handlers; only the creating process removes the region.
+        if os.getpid() == creator_pid:
+            self.unlink()
@@ -0,0 +1,114 @@
+import os
+import numpy as np
+from typing import Dict, Sequence, Tuple
+from .io import IO
+
+
+def pack_strings(strings: Sequence[bytes]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pack strings into one byte buffer plus an offset array.
+
+    :param strings: The encoded strings.
+    :return: The (total_bytes,) uint8 buffer and the (n + 1,) int64 offsets;
+             string i is buffer[offsets[i]:offsets[i + 1]].
+    """
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    np.cumsum([len(string) for string in strings], out=offsets[1:])
+    return np.frombuffer(b''.join(strings), dtype=np.uint8).copy(), offsets
+
+
+class FileIndex:
+    """
+    Columnar index of the samples of a dataset.
+
+    A list of dicts holds several Python objects per sample, and DataLoader workers touch their reference
+    counts, so fork copy-on-write gradually duplicates all of them in every worker. This index keeps
+    everything in a handful of NumPy arrays instead: integer-coded taxonomy ids, and the model ids and
+    file paths packed into single byte buffers with offset arrays. Reading it never writes to the pages
+    holding the data, so worker memory stays flat regardless of the dataset size.
+
+    Indexing returns a dict with taxonomy_id, model_id and file_path, like the former ``file_list`` entries.
+    """
+    def __init__(self, taxonomy_codes: np.ndarray, taxonomy_names: np.ndarray, model_buffer: np.ndarray,
+                 model_offsets: np.ndarray, path_buffer: np.ndarray, path_offsets: np.ndarray) -> None:
+        self.taxonomy_codes = taxonomy_codes
+        self.taxonomy_names = taxonomy_names
+        self.model_buffer = model_buffer
+        self.model_offsets = model_offsets
+        self.path_buffer = path_buffer
+        self.path_offsets = path_offsets
+
+    @classmethod
+    def from_columns(cls, taxonomy_ids: Sequence[bytes], model_ids: Sequence[bytes],
+                     file_paths: Sequence[bytes]) -> 'FileIndex':
+        """
+        Build an index from per-sample columns.
+
+        :param taxonomy_ids: Encoded taxonomy id per sample.
+        :param model_ids: Encoded model id per sample.
+        :param file_paths: Encoded file path per sample.
+        :return: The index.
+        """
+        taxonomy_names, taxonomy_codes = np.unique(np.array(taxonomy_ids, dtype=np.bytes_), return_inverse=True)
+        code_dtype = np.uint16 if len(taxonomy_names) <= np.iinfo(np.uint16).max else np.int32
+        return cls(taxonomy_codes.astype(code_dtype).reshape(-1), taxonomy_names,
+                   *pack_strings(model_ids), *pack_strings(file_paths))
+
+    @classmethod
+    def from_lines(cls, lines: Sequence[str]) -> 'FileIndex':
+        """
+        Build an index from the lines of ``{subset}.txt`` files, i.e. ``taxonomy-model.ext`` paths
+        (``taxonomy-name.h5:row`` for samples in multi-sample .h5 files). Each line is parsed once.
+
+        :param lines: The lines.
+        :return: The index.
+        """
+        taxonomy_ids, model_ids, file_paths = [], [], []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            file_path, row = IO.split_row(line)
+            taxonomy_id, model_id = file_path.split('-', 1)
+            model_id = model_id.split('.', 1)[0]
+            taxonomy_ids.append(taxonomy_id.encode())
+            model_ids.append((model_id if row is None else f'{model_id}-{row}').encode())
+            file_paths.append(line.encode())
+        return cls.from_columns(taxonomy_ids, model_ids, file_paths)
+
+    def save(self, path: str) -> None:
+        """
+        Save the index as an .npz file. Written to a temporary file and renamed, so readers never see a partial file.
+
+        :param path: Output path.
+        """
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **self.__dict__)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'FileIndex':
+        """
+        Load an index saved with :meth:`save`.
+
+        :param path: Path of the .npz file.
+        :return: The index.
+        """
+        with np.load(path) as arrays:
+            return cls(**{key: arrays[key] for key in arrays.files})
+
+    def __len__(self) -> int:
+        return len(self.taxonomy_codes)
+
+    def taxonomy_id(self, idx: int) -> str:
+        return self.taxonomy_names[self.taxonomy_codes[idx]].decode()
+
+    def model_id(self, idx: int) -> str:
+        return self.model_buffer[self.model_offsets[idx]:self.model_offsets[idx + 1]].tobytes().decode()
+
+    def file_path(self, idx: int) -> str:
+        return self.path_buffer[self.path_offsets[idx]:self.path_offsets[idx + 1]].tobytes().decode()
+
+    def __getitem__(self, idx: int) -> Dict[str, str]:
+        return {'taxonomy_id': self.taxonomy_id(idx), 'model_id': self.model_id(idx), 'file_path': self.file_path(idx)}
@@ -1,60 +1,346 @@
 import os
-import h5py
+import hashlib
 import logging
+import threading
 import numpy as np
+from collections import OrderedDict
+from typing import TYPE_CHECKING, BinaryIO, Callable, List, Optional, Sequence, Tuple, Union
+from utils import profiling
+
+if TYPE_CHECKING:
+    # h5py is imported when the first .h5 file is opened, so other formats do not pay its import time.
+    import h5py
+
+
+Indices = Optional[Union[Sequence[int], np.ndarray]]
+
+PLY_TYPES = {
+    'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1',
+    'short': 'i2', 'int16': 'i2', 'ushort': 'u2', 'uint16': 'u2',
+    'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4',
+    'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8',
+}
+
+
+class H5HandlePool:
+    """
+    Per-process LRU pool of open, read-only HDF5 file handles.
+
+    Keeping files open avoids re-parsing the HDF5 metadata on every read. The pool remembers the
+    process that opened the handles: after a fork (e.g. in a DataLoader worker) the inherited handles
+    are dropped and files are reopened by the child, since HDF5 handles must not be shared across processes.
+
+    :param max_handles: Maximum number of files kept open at the same time.
+    """
+    def __init__(self, max_handles: int = 64) -> None:
+        self.max_handles = max_handles
+        self._handles: OrderedDict = OrderedDict()
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def get(self, file_path: str) -> 'h5py.File':
+        """
+        Get an open handle for a file, opening it if needed and evicting the least recently used handle.
+
+        :param file_path: Path to the HDF5 file.
+        :return: An open, read-only h5py.File.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked child: never touch the parent's handles, just forget them.
+                self._handles = OrderedDict()
+                self._pid = os.getpid()
+
+            handle = self._handles.get(file_path)
+            if handle is not None:
+                self._handles.move_to_end(file_path)
+                return handle
+
+            import h5py
+            handle = h5py.File(file_path, 'r')
+            self._handles[file_path] = handle
+            while len(self._handles) > self.max_handles:
+                _, evicted = self._handles.popitem(last=False)
+                evicted.close()
+            return handle
+
+    def close(self) -> None:
+        """
+        Close all handles opened by the current process.
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                for handle in self._handles.values():
+                    handle.close()
+            self._handles = OrderedDict()
+            self._pid = os.getpid()
 
 
 class IO:
     """
     Serves as a utility for reading data from files with different extensions:
-    Supported extensions: .npy, .h5, .txt
+    Supported extensions: .npy, .h5, .txt, .pts, .ply
+
+    Reads can be restricted to a subset of rows through ``indices``. Combined with ``mmap_mode`` for
+    ``.npy`` files (or the partial slicing of ``.h5`` datasets), only the requested rows are read
+    from disk instead of the whole file.
+
+    A single .h5 file may also hold many samples as one (num_samples, num_points, channels) dataset.
+    Such a sample is addressed by appending its row to the path, e.g. ``clouds.h5:12``.
+
+    Text and PLY files (the PartNet ``point_sample`` formats) are parsed once and converted to .npy,
+    either next to the source (``pts-10000.txt.npy``) or in a cache directory. Later reads load the
+    converted file (memory-mapped, gather-only) as long as it is newer than the source.
     """
 
+    h5_pool = H5HandlePool()
+    # Above this fraction of the spanned rows, one contiguous read plus an in-memory gather
+    # beats an HDF5 point selection.
+    h5_dense_read_ratio = 0.125
+    # Conversion cache for text/PLY files: disabled (False), next to the source (True) or a directory.
+    convert_cache: Union[bool, str] = True
+
+    @classmethod
+    def set_h5_pool_size(cls, max_handles: int) -> None:
+        """
+        Set the maximum number of HDF5 files kept open per process.
+
+        :param max_handles: Maximum number of open handles.
+        """
+        cls.h5_pool.max_handles = max_handles
+
+    @classmethod
+    def set_convert_cache(cls, convert_cache: Union[bool, str]) -> None:
+        """
+        Configure where parsed text/PLY files are cached as .npy.
+
+        :param convert_cache: False to disable, True to write next to the source, or a cache directory.
+        """
+        cls.convert_cache = convert_cache
+
+    @staticmethod
+    def split_row(file_path: str) -> Tuple[str, Optional[int]]:
+        """
+        Split an optional ``:row`` suffix from a file path.
+
+        :param file_path: Path, optionally followed by ``:row``.
+        :return: The bare path and the row (None if no row was given).
+        """
+        base, extension = os.path.splitext(file_path)
+        if ':' in extension:
+            extension, row = extension.split(':', 1)
+            return base + extension, int(row)
+        return file_path, None
+
     @classmethod
-    def get(cls, file_path: str):
+    @profiling.timed('io.get')
+    def get(cls, file_path: str, indices: Indices = None, mmap_mode: Optional[str] = None) -> np.ndarray:
+        """
+        Reads a file based on its extension.
+
+        :param file_path: Path to the file.
+        :param indices: Optional row indices to gather. Sorted indices give the best read locality and
+                        are required for .h5 files.
+        :param mmap_mode: Memory-map mode passed to np.load for .npy files (e.g. 'r'). Ignored otherwise.
+        :return: Data as a NumPy array.
+        """
+        file_path, row = cls.split_row(file_path)
         _, file_extension = os.path.splitext(file_path)
 
         try:
             if file_extension in ['.npy']:
-                return cls._read_npy(file_path)
+                return cls._read_npy(file_path, indices=indices, mmap_mode=mmap_mode)
             elif file_extension in ['.h5']:
-                return cls._read_h5(file_path)
+                return cls._read_h5(file_path, indices=indices, row=row)
+            elif file_extension in ['.txt', '.pts']:
+                return cls._read_converted(file_path, cls._read_txt, indices=indices, mmap_mode=mmap_mode)
+            elif file_extension in ['.ply']:
+                return cls._read_converted(file_path, cls._read_ply, indices=indices, mmap_mode=mmap_mode)
             else:
-                supported_extensions = ['.npy', '.h5']
-                raise Exception(f'Unsupported file extension {file_extension}.'
-                                f'Supported exstesions: {supported_extensions}')
-            
+                supported_extensions = ['.npy', '.h5', '.txt', '.pts', '.ply']
+                raise ValueError(f'Unsupported file extension {file_extension}. '
+                                 f'Supported extensions: {supported_extensions}')
+
         except Exception as e:
-            raise logging.error(f'Error occurred while reading {file_extension} file: {e}')
+            logging.error(f'Error occurred while reading {file_extension} file: {e}')
+            raise
 
-        
     @classmethod
-    def _read_npy(cls, file_path: str) -> np.ndarray:
+    def _read_npy(cls, file_path: str, indices: Indices = None, mmap_mode: Optional[str] = None) -> np.ndarray:
         """
         Reads a .npy file.
 
         :param file_path: Path to the .npy file.
+        :param indices: Optional row indices to gather.
+        :param mmap_mode: Memory-map mode passed to np.load. With a memory map only the pages holding
+                          the requested rows are touched.
         :return: Data as a NumPy array.
-        """ 
+        """
         try:
-            return np.load(file_path)
+            data = np.load(file_path, mmap_mode=mmap_mode)
+            if indices is not None:
+                # Fancy indexing copies the selected rows out of the memory map into a regular array.
+                return data[indices]
+            return data
         except Exception as e:
-            raise logging.error(f'Error while reading .npy file {e}')
-    
+            logging.error(f'Error while reading .npy file {e}')
+            raise
+
     @classmethod
-    def _read_h5(cls, file_path: str, dataset: str = 'data') -> np.ndarray:
+    def _read_h5(cls, file_path: str, dataset: str = 'data', indices: Indices = None,
+                 row: Optional[int] = None) -> np.ndarray:
         """
-        Reads a dataset from an HDF5 file.
+        Reads a dataset from an HDF5 file, using a pooled file handle.
 
         :param file_path: Path to the HDF5 file.
         :param dataset: Name of the dataset to be read from the file. Defaults to 'data'.
+        :param indices: Optional sorted, unique point indices. Only these rows are read from disk.
+        :param row: Optional sample row for files holding many samples in one dataset.
         :return: Data from the specified dataset as a NumPy array.
-        """        
+        """
         try:
-            with h5py.File(file_path, 'r') as f:
-                if dataset in f:
-                    return f[dataset][()]
-                else:
-                    raise KeyError(f'Dataset {dataset} not in the file')
+            f = cls.h5_pool.get(file_path)
+            if dataset not in f:
+                raise KeyError(f'Dataset {dataset} not in the file')
+            data = f[dataset]
+            prefix = () if row is None else (row,)
+            if indices is None:
+                return data[prefix + (slice(None),)] if prefix else data[()]
+
+            indices = np.asarray(indices)
+            if len(indices) == 0:
+                return np.empty((0,) + data.shape[len(prefix) + 1:], dtype=data.dtype)
+            start, stop = int(indices[0]), int(indices[-1]) + 1
+            if len(indices) >= cls.h5_dense_read_ratio * (stop - start):
+                return data[prefix + (slice(start, stop),)][indices - start]
+            return data[prefix + (indices,)]
         except Exception as e:
-            raise logging.error(f'Error while reading .h5 file: {e}')
+            logging.error(f'Error while reading .h5 file: {e}')
+            raise
+
+    @classmethod
+    def _converted_path(cls, file_path: str) -> Optional[str]:
+        """
+        Path of the .npy conversion of a text/PLY file, or None if the conversion cache is disabled.
+
+        :param file_path: Path to the source file.
+        :return: Path of the converted file.
+        """
+        if cls.convert_cache is False:
+            return None
+        if cls.convert_cache is True:
+            return f'{file_path}.npy'
+        source = os.path.abspath(file_path)
+        digest = hashlib.sha1(source.encode()).hexdigest()[:16]
+        return os.path.join(cls.convert_cache, f'{digest}-{os.path.basename(source)}.npy')
+
+    @classmethod
+    def _read_converted(cls, file_path: str, parser: Callable[[str], np.ndarray], indices: Indices = None,
+                        mmap_mode: Optional[str] = None) -> np.ndarray:
+        """
+        Reads a file that needs parsing, through the .npy conversion cache.
+
+        :param file_path: Path to the source file.
+        :param parser: Parses the source file into an array.
+        :param indices: Optional row indices to gather.
+        :param mmap_mode: Memory-map mode for reading the converted file.
+        :return: Data as a NumPy array.
+        """
+        converted_path = cls._converted_path(file_path)
+        if converted_path is not None:
+            try:
+                if os.stat(converted_path).st_mtime >= os.stat(file_path).st_mtime:
+                    return cls._read_npy(converted_path, indices=indices, mmap_mode=mmap_mode)
+            except FileNotFoundError:
+                pass
+
+        data = parser(file_path)
+        if converted_path is not None:
+            # Write to a process-unique temporary file and rename, so concurrent readers never see a partial file.
+            tmp_path = f'{converted_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            try:
+                os.makedirs(os.path.dirname(converted_path) or '.', exist_ok=True)
+                with open(tmp_path, 'wb') as f:
+                    np.save(f, data)
+                os.replace(tmp_path, converted_path)
+            except OSError as e:
+                logging.warning(f'Could not cache the conversion of {file_path}: {e}')
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        return data if indices is None else data[indices]
+
+    @classmethod
+    def _read_txt(cls, file_path: str) -> np.ndarray:
+        """
+        Reads a whitespace separated text file of numbers (PartNet .txt and .pts), one point per row.
+
+        Since NumPy 1.23 np.loadtxt is backed by a C parser; parsing straight to float32 is faster
+        than np.fromfile(sep=' ') or splitting the text in Python.
+
+        :param file_path: Path to the text file.
+        :return: Data as a (rows, columns) float32 array.
+        """
+        return np.loadtxt(file_path, dtype=np.float32, ndmin=2)
+
+    @classmethod
+    def _parse_ply_header(cls, f: BinaryIO) -> Tuple[str, List[Tuple[str, int, List[Tuple[str, str]]]]]:
+        """
+        Parse a PLY header, leaving the file positioned at the start of the body.
+
+        :param f: The PLY file opened in binary mode.
+        :return: The format and the elements as (name, count, [(property, type)]); list properties have
+                 the type 'list'.
+        """
+        if f.readline().strip() != b'ply':
+            raise ValueError('Not a PLY file')
+        ply_format, elements = None, []
+        for line in iter(f.readline, b''):
+            tokens = line.decode('ascii').split()
+            if not tokens or tokens[0] in ('comment', 'obj_info'):
+                continue
+            if tokens[0] == 'format':
+                ply_format = tokens[1]
+            elif tokens[0] == 'element':
+                elements.append((tokens[1], int(tokens[2]), []))
+            elif tokens[0] == 'property':
+                name, ply_type = (tokens[-1], 'list') if tokens[1] == 'list' else (tokens[2], tokens[1])
+                elements[-1][2].append((name, ply_type))
+            elif tokens[0] == 'end_header':
+                return ply_format, elements
+        raise ValueError('PLY header has no end_header')
+
+    @classmethod
+    def _read_ply(cls, file_path: str) -> np.ndarray:
+        """
+        Reads the vertex element of an ASCII or binary PLY file.
+
+        The header is parsed first, and the vertex data is then read in one call with a dtype built from it.
+
+        :param file_path: Path to the PLY file.
+        :return: The vertex properties (x, y, z, ...) as a (vertices, properties) float32 array.
+        """
+        with open(file_path, 'rb') as f:
+            ply_format, elements = cls._parse_ply_header(f)
+            byte_order = {'binary_little_endian': '<', 'binary_big_endian': '>', 'ascii': None}[ply_format]
+
+            for name, count, properties in elements:
+                if any(ply_type == 'list' for _, ply_type in properties):
+                    if name == 'vertex':
+                        raise ValueError('List properties in the vertex element are not supported')
+                    raise ValueError(f'Cannot skip element {name} with list properties before the vertices')
+
+                if byte_order is None:
+                    if name == 'vertex':
+                        values = np.fromfile(f, dtype=np.float32, count=count * len(properties), sep=' ')
+                        return values.reshape(count, len(properties))
+                    for _ in range(count):
+                        f.readline()
+                    continue
+
+                dtype = np.dtype([(prop, byte_order + PLY_TYPES[ply_type]) for prop, ply_type in properties])
+                if name == 'vertex':
+                    vertices = np.fromfile(f, dtype=dtype, count=count)
+                    return np.stack([vertices[prop].astype(np.float32) for prop, _ in properties], axis=1)
+                f.seek(count * dtype.itemsize, os.SEEK_CUR)
+
+        raise ValueError(f'{file_path} has no vertex element')
@@ -0,0 +1,173 @@
+import os
+import numpy as np
+from typing import Dict, Optional, Sequence
+from .io import IO
+from .file_index import FileIndex
+from utils.logger import print_log
+from utils import profiling
+
+
+SHARD_PATTERN = 'shard-{:05d}.npy'
+INDEX_PATTERN = '{}.index.npz'
+
+
+def write_packed_dataset(data_root: str, out_dir: str, subsets: Sequence[str] = ('train', 'test'),
+                         shard_size_mb: int = 1024, logger: Optional[str] = None) -> None:
+    """
+    Pack the per-sample files of a dataset into a few large float32 shards plus an offset index per subset.
+
+    Each shard is a regular (rows, channels) float32 .npy file holding the point clouds of many samples
+    back to back. For every subset an index file ``{subset}.index.npz`` stores, per sample, the shard it
+    lives in, its first row, its number of points, an integer-coded taxonomy id and its model id.
+
+    :param data_root: Root directory containing ``{subset}.txt`` and the sample files.
+    :param out_dir: Output directory for the shards and index files.
+    :param subsets: Subsets to pack. Each subset gets its own index; shards are shared.
+    :param shard_size_mb: Approximate maximum size of a single shard in megabytes.
+    :param logger: Optional logger name.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    shard_limit = shard_size_mb * 1024 * 1024
+    shard_id, pending, pending_rows = 0, [], 0
+
+    def flush() -> None:
+        nonlocal shard_id, pending, pending_rows
+        if not pending:
+            return
+        shard_path = os.path.join(out_dir, SHARD_PATTERN.format(shard_id))
+        np.save(shard_path, np.concatenate(pending, axis=0))
+        print_log(f'[PACK] Wrote {shard_path} ({pending_rows} points)', logger=logger)
+        shard_id, pending, pending_rows = shard_id + 1, [], 0
+
+    for subset in subsets:
+        with open(os.path.join(data_root, f'{subset}.txt'), 'r') as f:
+            file_index = FileIndex.from_lines(f.readlines())
+
+        shards = np.empty(len(file_index), dtype=np.uint32)
+        offsets = np.empty(len(file_index), dtype=np.uint64)
+        num_points = np.empty(len(file_index), dtype=np.uint32)
+
+        for i in range(len(file_index)):
+            data = np.ascontiguousarray(IO.get(os.path.join(data_root, file_index.file_path(i))), dtype=np.float32)
+            if pending and (pending_rows + len(data)) * data.shape[1] * 4 > shard_limit:
+                flush()
+            shards[i], offsets[i], num_points[i] = shard_id, pending_rows, len(data)
+            pending.append(data)
+            pending_rows += len(data)
+
+        model_ids = [file_index.model_id(i).encode() for i in range(len(file_index))]
+        np.savez(os.path.join(out_dir, INDEX_PATTERN.format(subset)),
+                 shard=shards,
+                 offset=offsets,
+                 num_points=num_points,
+                 taxonomy=file_index.taxonomy_codes,
+                 taxonomy_names=file_index.taxonomy_names,
+                 model_id=np.array(model_ids, dtype=np.bytes_))
+        print_log(f'[PACK] Indexed {len(file_index)} {subset} samples', logger=logger)
+
+    flush()
+
+
+class PackedShards:
+    """
+    Read-only view over a packed dataset written by :func:`write_packed_dataset`.
+
+    Shards are memory-mapped lazily on first access in each process, so the object is cheap to pickle
+    into DataLoader workers and every worker maps the shards exactly once.
+
+    :param root: Directory containing the shards and index files.
+    :param subsets: Index files to load, concatenated in the given order.
+    """
+    def __init__(self, root: str, subsets: Sequence[str]) -> None:
+        self.root = root
+        indices = [np.load(os.path.join(root, INDEX_PATTERN.format(subset))) for subset in subsets]
+
+        self.shard = np.concatenate([index['shard'] for index in indices])
+        self.offset = np.concatenate([index['offset'] for index in indices])
+        self.num_points = np.concatenate([index['num_points'] for index in indices])
+        self.model_id = np.concatenate([index['model_id'] for index in indices])
+
+        # Subsets may code taxonomies differently, so decode per index file before concatenating.
+        self.taxonomy_id = np.concatenate([index['taxonomy_names'][index['taxonomy']] for index in indices])
+        self._shards: Dict[int, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.offset)
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state['_shards'] = {}
+        return state
+
+    def _get_shard(self, shard_id: int) -> np.ndarray:
+        shard = self._shards.get(shard_id)
+        if shard is None:
+            shard = np.load(os.path.join(self.root, SHARD_PATTERN.format(shard_id)), mmap_mode='r')
+            self._shards[shard_id] = shard
+        return shard
+
+    @property
+    def channels(self) -> int:
+        """
+        Number of channels per point.
+        """
+        return self._get_shard(int(self.shard[0])).shape[1]
+
+    def file_index(self) -> FileIndex:
+        """
+        Describe the samples as a FileIndex, like ``ShapeNet.file_list``. The file path of a sample is its shard.
+
+        :return: The index.
+        """
+        return FileIndex.from_columns(self.taxonomy_id, self.model_id,
+                                      [SHARD_PATTERN.format(shard).encode() for shard in self.shard])
+
+    def get(self, idx: int, indices: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Read the points of a single sample.
+
+        :param idx: The index of the sample.
+        :param indices: Optional row indices (relative to the sample) to gather.
+        :return: The point cloud, or the selected rows of it.
+        """
+        shard = self._get_shard(int(self.shard[idx]))
+        start = int(self.offset[idx])
+        if indices is None:
+            return np.array(shard[start:start + int(self.num_points[idx])])
+        return shard[start + np.asarray(indices)]
+
+    @profiling.timed('packed.read_rows')
+    def read_rows(self, shard_id: int, start: int, stop: int) -> np.ndarray:
+        """
+        Read a contiguous range of rows of a shard with one sequential read.
+
+        :param shard_id: The shard.
+        :param start: First row.
+        :param stop: End row (exclusive).
+        :return: A private copy of the rows.
+        """
+        return np.array(self._get_shard(shard_id)[start:stop])
+
+    @profiling.timed('packed.get_batch')
+    def get_batch(self, idxs: Sequence[int], indices: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Gather the selected rows of many samples with one vectorized take per shard.
+
+        :param idxs: The indices of the samples.
+        :param indices: (B, k) row indices, relative to each sample.
+        :param out: Optional (B, k, C) float32 array to write into.
+        :return: The gathered (B, k, C) points.
+        """
+        idxs = np.asarray(idxs, dtype=np.int64)
+        rows = self.offset[idxs].astype(np.int64)[:, None] + indices
+        shard_ids = self.shard[idxs]
+        for shard_id in np.unique(shard_ids):
+            shard = self._get_shard(int(shard_id))
+            if out is None:
+                out = np.empty(indices.shape + shard.shape[1:], dtype=np.float32)
+            selected = np.flatnonzero(shard_ids == shard_id)
+            if len(selected) == len(idxs):
+                np.take(shard, rows.reshape(-1), axis=0, out=out.reshape(-1, shard.shape[1]))
+            else:
+                out[selected] = np.take(shard, rows[selected], axis=0)
+        return out
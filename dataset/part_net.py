@@ -1,12 +1,24 @@
 import os
 import torch
+import hashlib
+import logging
 import numpy as np
 import torch.utils.data as data
+from typing import List, Optional, Sequence, Tuple
 from .io import IO
+from .file_index import FileIndex
+from .packed import PackedShards
+from .cache import SharedSampleCache
+from .sampling import farthest_point_sample, find_fps_cache
+from .prefetch import ReadaheadPrefetcher
+from .batching import BatchBuffers, CollatedBatch
 from .build import DATASETS
 from utils.logger import print_log
+from utils.misc import user_cache_dir
+from utils import profiling
 
 
+@DATASETS.register_module(name='PartNet')
 @DATASETS.register_module()
 class ShapeNet(data.Dataset):
     """
@@ -24,33 +36,195 @@ class ShapeNet(data.Dataset):
 
         self.sample_points_num = config.npoint
         self.whole = config.get('whole', False)
+        # Memory-map .npy files so only the sampled rows are read from disk.
+        self.mmap_mode = 'r' if config.get('MMAP', True) else None
+        # 'files' reads one file per sample, 'packed' reads from shards written by write_packed_dataset.
+        self.backend = config.get('BACKEND', 'files')
+        self.packed = None
+        # Save the parsed file list for instant loading on later runs: True (user cache directory),
+        # a directory, or False.
+        self.file_index_cache = config.get('FILE_INDEX_CACHE', True)
+        IO.set_h5_pool_size(config.get('H5_POOL_SIZE', 64))
+        IO.set_convert_cache(config.get('CONVERT_CACHE', True))
 
         print_log(f'[DATASET] sample out {self.sample_points_num} points', logger='PartNet')
-        print_log(f'[DATASET] Open file {self.data_list_file}', logger='PartNet')
-        self._load_file_list()
+        if self.backend == 'packed':
+            self._load_packed_index(config.get('PACKED_PATH', os.path.join(self.data_root, 'packed')))
+        elif self.backend == 'files':
+            print_log(f'[DATASET] Open file {self.data_list_file}', logger='PartNet')
+            self._load_file_list()
+        else:
+            raise ValueError(f'Unsupported dataset backend {self.backend}. Supported backends: files, packed')
 
-        self.permutation = np.arange(self.npoints)
+        self.cache = self._build_cache(config.get('CACHE', {}))
+
+        readahead = config.get('READAHEAD', {})
+        self.prefetcher = None
+        if readahead.get('DEPTH', 0) > 0:
+            self.prefetcher = ReadaheadPrefetcher(self._load, self.select_indices,
+                                                  depth=readahead.get('DEPTH'), num_threads=readahead.get('THREADS', 4),
+                                                  capacity=len(self.file_list))
+
+        # 'random' draws uniform random points, 'fps' uses farthest point sampling.
+        self.sampling = config.get('SAMPLING', 'random')
+        self.fps_orderings = None
+        if self.sampling == 'fps':
+            self._load_fps_cache(config.get('FPS_CACHE', os.path.join(self.data_root, 'fps')))
+        elif self.sampling != 'random':
+            raise ValueError(f'Unsupported sampling mode {self.sampling}. Supported modes: random, fps')
+
+        # Batch output: integer-coded ids and reusable (optionally pinned) batch buffers, see __getitems__.
+        batch_config = config.get('BATCH', {})
+        self.coded_ids = batch_config.get('CODED_IDS', False)
+        buffers = batch_config.get('BUFFERS', 0)
+        self._auto_buffers = buffers == 'auto'
+        # With auto, batches are freshly allocated until set_prefetch_factor sizes the ring for the DataLoader.
+        self.batch_buffers = None
+        if buffers and not self._auto_buffers:
+            self.batch_buffers = BatchBuffers(int(buffers))
+        self._pin = batch_config.get('PIN', False)
+        if self._pin and not buffers:
+            raise ValueError('BATCH.PIN pins the reusable batch buffers in place and needs BATCH.BUFFERS')
+
+        # Lazily seeded per process, see the rng property.
+        self._rng = None
+        self._rng_pid = None
 
     def _load_file_list(self) -> None:
         """
-        Load the file list from data files.
-        """
-        with open(self.data_list_file, 'r') as f:
-            lines = f.readlines()
-        if self.whole:
-            with open(self.test_data_list_file, 'r') as f:
-                test_lines = f.readlines()
-            print_log(f'[DATASET] Open file {self.test_data_list_file}', logger='ShapeNet-55')
-            lines.extend(test_lines)
-        self.file_list = [
-            {
-                'taxonomy_id': line.split('-')[0],
-                'model_id': line.split('-')[1].split('.')[0],
-                'file_path': line.strip()
-            } for line in lines
-        ]
+        Load the file list from data files into a compact FileIndex.
+
+        With FILE_INDEX_CACHE the parsed index is saved in the user cache directory (or the configured
+        directory, never in the possibly shared and read-only DATA_PATH) and loaded directly on later runs,
+        as long as it is newer than the list files. An unwritable cache only logs a warning.
+        """
+        list_files = [self.data_list_file] + ([self.test_data_list_file] if self.whole else [])
+        index_path = None
+        if self.file_index_cache:
+            cache_dir = user_cache_dir('file_index') if self.file_index_cache is True else self.file_index_cache
+            key = hashlib.sha1('\n'.join(os.path.abspath(path) for path in list_files).encode()).hexdigest()[:16]
+            index_path = os.path.join(cache_dir, f'{key}-{self.subset}{"-whole" if self.whole else ""}.files.npz')
+        if index_path is not None and os.path.exists(index_path) and \
+                all(os.path.getmtime(index_path) >= os.path.getmtime(path) for path in list_files):
+            print_log(f'[DATASET] Load file index {index_path}', logger='ShapeNet-55')
+            self.file_list = FileIndex.load(index_path)
+        else:
+            lines = []
+            for path in list_files:
+                if path != self.data_list_file:
+                    print_log(f'[DATASET] Open file {path}', logger='ShapeNet-55')
+                with open(path, 'r') as f:
+                    lines.extend(f.readlines())
+            self.file_list = FileIndex.from_lines(lines)
+            if index_path is not None:
+                try:
+                    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+                    self.file_list.save(index_path)
+                except OSError as e:
+                    print_log(f'[DATASET] Could not save the file index to {index_path}: {e}',
+                              logger='ShapeNet-55', level=logging.WARNING)
         print_log(f'[DATASET] {len(self.file_list)} instances were loaded', logger='ShapeNet-55')
 
+    def _load_packed_index(self, packed_root: str) -> None:
+        """
+        Load the offset index of a packed dataset. The shards are memory-mapped on first access.
+
+        :param packed_root: Directory containing the shards and index files.
+        """
+        subsets = [self.subset, 'test'] if self.whole else [self.subset]
+        print_log(f'[DATASET] Open packed index {subsets} in {packed_root}', logger='PartNet')
+        self.packed = PackedShards(packed_root, subsets)
+        self.file_list = self.packed.file_index()
+        print_log(f'[DATASET] {len(self.file_list)} instances were loaded', logger='PartNet')
+
+    def _build_cache(self, cache_config) -> SharedSampleCache:
+        """
+        Build the optional shared-memory sample cache.
+
+        The cache name is derived from the dataset identity, so DataLoader workers and the other local
+        ranks that load the same data attach to the same region.
+
+        :param cache_config: The CACHE section of the dataset config.
+        :return: The cache, or None if caching is disabled.
+        """
+        if not cache_config.get('ENABLED', False):
+            return None
+        identity = f'{os.path.abspath(self.data_root)}|{self.backend}|{self.subset}|{self.whole}|{self.npoints}'
+        name = cache_config.get('NAME') or f'shapenet-{hashlib.sha1(identity.encode()).hexdigest()[:16]}'
+        cache = SharedSampleCache(name,
+                                  num_keys=len(self.file_list),
+                                  slot_points=self.npoints,
+                                  channels=cache_config.get('CHANNELS', 3),
+                                  budget_bytes=int(cache_config.get('BUDGET_MB', 4096) * 1024 ** 2),
+                                  persist=cache_config.get('PERSIST', False),
+                                  admission=cache_config.get('ADMISSION', 0.05))
+        print_log(f'[DATASET] Shared sample cache {cache.path}: {cache.num_slots} slots '
+                  f'({cache.nbytes / 1024 ** 2:.1f} MB)', logger='PartNet')
+        return cache
+
+    def _load_fps_cache(self, cache_dir: str) -> None:
+        """
+        Memory-map precomputed FPS orderings (see tools/precompute_fps.py), if available.
+
+        :param cache_dir: Directory holding the FPS caches.
+        """
+        path = find_fps_cache(cache_dir, self.subset, self.whole, self.sample_points_num)
+        if path is None:
+            print_log(f'[DATASET] No FPS cache in {cache_dir}, running FPS on the fly', logger='PartNet')
+            return
+        self.fps_orderings = np.load(path, mmap_mode='r')
+        if len(self.fps_orderings) != len(self.file_list):
+            raise ValueError(f'FPS cache {path} has {len(self.fps_orderings)} samples, '
+                             f'the dataset has {len(self.file_list)}')
+        print_log(f'[DATASET] Load FPS orderings from {path}', logger='PartNet')
+
+    def _read(self, idx: int, indices: np.ndarray = None) -> np.ndarray:
+        """
+        Read the points of a sample from the configured backend.
+
+        :param idx: The index of the data sample.
+        :param indices: Optional row indices to gather.
+        :return: The point cloud, or the selected rows of it.
+        """
+        if self.packed is not None:
+            return self.packed.get(idx, indices=indices)
+        file_path = os.path.join(self.data_root, self.file_list.file_path(idx))
+        return IO.get(file_path, indices=indices, mmap_mode=self.mmap_mode)
+
+    @profiling.timed('dataset.load')
+    def _load(self, idx: int, indices: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Load the selected rows of a sample, going through the shared cache when it is enabled.
+
+        On a cache miss the whole cloud is read and inserted, so later epochs can draw
+        different points from memory.
+
+        :param idx: The index of the data sample.
+        :param indices: Row indices to gather. If None, the whole cloud is loaded.
+        :return: The selected rows as a float32 array.
+        """
+        if self.cache is None:
+            data = self._read(idx, indices)
+        else:
+            data = self.cache.get(idx, indices)
+            if data is None:
+                cloud = np.asarray(self._read(idx), dtype=np.float32)
+                self.cache.put(idx, cloud)
+                data = cloud if indices is None else cloud[indices]
+        if data.dtype != np.float32 or not data.flags.writeable:
+            # Casts, and copies whole clouds out of read-only memory maps.
+            data = data.astype(np.float32)
+        return data
+
+    def cache_stats(self) -> dict:
+        """
+        Hit, miss and eviction counters of the shared sample cache.
+
+        :return: The counters, or an empty dict if caching is disabled.
+        """
+        return self.cache.stats() if self.cache is not None else {}
+
+    @profiling.timed('dataset.random_sample')
     def random_sample(self, pc: np.ndarray, num: int) -> np.ndarray:
         """
         Randomly sample points from a point cloud.
@@ -59,21 +233,235 @@ class ShapeNet(data.Dataset):
         :param num: The number of points to sample.
         :return: The sampled points.
         """
-        np.random.shuffle(self.permutation)
-        return pc[self.permutation[:num]]
+        return pc[self.sample_indices(num, len(pc))]
+
+    @property
+    def rng(self) -> np.random.Generator:
+        """
+        The random generator of the current process.
 
+        It is (re)created on first use in every process. DataLoader workers are seeded from
+        ``worker_info.seed`` (the loader's base seed plus the worker id), the main process from
+        ``torch.initial_seed()``. Every worker therefore draws a different, reproducible stream,
+        instead of inheriting a copy of the global NumPy state through fork.
+        """
+        if self._rng_pid != os.getpid():
+            worker_info = data.get_worker_info()
+            seed = worker_info.seed if worker_info is not None else torch.initial_seed()
+            self._rng = np.random.default_rng(seed)
+            self._rng_pid = os.getpid()
+        return self._rng
+
+    def num_points(self, idx: int) -> int:
+        """
+        Number of points stored for a sample.
+
+        :param idx: The index of the data sample.
+        :return: The point count from the packed index, or N_POINTS for per-file samples.
+        """
+        return int(self.packed.num_points[idx]) if self.packed is not None else self.npoints
+
+    @profiling.timed('dataset.sample_indices')
+    def sample_indices(self, num: int, num_points: Optional[int] = None) -> np.ndarray:
+        """
+        Draw the row indices of a random subset of points, without replacement.
+
+        Only ``num`` indices are drawn (no shuffle of all points). The indices are sorted, so they can be
+        used for partial reads from memory-mapped or HDF5 files, which require (or benefit from)
+        increasing row order.
+
+        :param num: The number of points to sample.
+        :param num_points: The number of points to sample from. Defaults to N_POINTS.
+        :return: Sorted row indices of the sampled points.
+        """
+        num_points = self.npoints if num_points is None else num_points
+        if num >= num_points:
+            return np.arange(num_points)
+        indices = self.rng.choice(num_points, size=num, replace=False, shuffle=False)
+        indices.sort()
+        return indices
+
+    def select_indices(self, idx: int) -> Optional[np.ndarray]:
+        """
+        Sorted row indices to read for a sample under the configured sampling mode.
+
+        :param idx: The index of the data sample.
+        :return: The row indices, or None when FPS has to run on the whole cloud (no FPS cache).
+        """
+        if self.sampling == 'fps':
+            if self.fps_orderings is None:
+                return None
+            # The first k entries of an FPS ordering are the FPS selection of k points.
+            return np.sort(self.fps_orderings[idx, :self.sample_points_num].astype(np.int64))
+        return self.sample_indices(self.sample_points_num, self.num_points(idx))
+
+    @property
+    def pin_batches(self) -> bool:
+        """
+        Whether batches are written into reusable buffers that are pinned in place (BATCH.PIN).
+        """
+        return self._pin and self.batch_buffers is not None
+
+    def set_prefetch_factor(self, prefetch_factor: int) -> None:
+        """
+        Size the reusable batch buffers (BATCH.BUFFERS: auto) for the prefetch_factor of the DataLoader.
+
+        :param prefetch_factor: Batches in flight per worker.
+        """
+        if self._auto_buffers:
+            self.batch_buffers = BatchBuffers(prefetch_factor + 2)
+
+    def _new_batch(self, shape: tuple) -> torch.Tensor:
+        if self.batch_buffers is not None:
+            return self.batch_buffers.next(shape)
+        batch = torch.empty(shape, dtype=torch.float32)
+        if data.get_worker_info() is not None:
+            # Same as default_collate: build the batch in shared memory so it is not copied again when
+            # it is sent to the main process.
+            batch.share_memory_()
+        return batch
+
+    @property
+    def taxonomy_names(self) -> List[str]:
+        """
+        The lookup table of the taxonomy codes: taxonomy_names[code] is the taxonomy id.
+        """
+        return [name.decode() for name in self.file_list.taxonomy_names]
+
+    def decode_ids(self, taxonomy_codes: Sequence[int], model_codes: Sequence[int]) -> Tuple[List[str], List[str]]:
+        """
+        Decode the integer-coded ids of a batch (BATCH.CODED_IDS) into the taxonomy and model ids.
+
+        :param taxonomy_codes: The taxonomy codes, indices into taxonomy_names.
+        :param model_codes: The model codes, which are the dataset indices of the samples.
+        :return: The taxonomy ids and the model ids.
+        """
+        names = self.taxonomy_names
+        return ([names[int(code)] for code in taxonomy_codes],
+                [self.file_list.model_id(int(code)) for code in model_codes])
+
+    @profiling.timed('dataset.fps')
+    def _fps_batch(self, clouds: List[np.ndarray]) -> torch.Tensor:
+        """
+        Run farthest point sampling on whole clouds, all at once.
+
+        :param clouds: The whole point clouds.
+        :return: A (B, k, C) tensor with the selected points.
+        """
+        starts = torch.from_numpy(self.rng.integers(0, [len(cloud) for cloud in clouds]))
+        if len({cloud.shape for cloud in clouds}) == 1:
+            stacked = torch.from_numpy(np.stack(clouds))
+            selected = farthest_point_sample(stacked, self.sample_points_num, starts)
+            batch = self._new_batch(selected.shape + stacked.shape[2:])
+            return torch.gather(stacked, 1, selected.unsqueeze(-1).expand(-1, -1, stacked.shape[2]), out=batch)
+        selected = [torch.from_numpy(cloud)[farthest_point_sample(torch.from_numpy(cloud), self.sample_points_num,
+                                                                  starts[i:i + 1])]
+                    for i, cloud in enumerate(clouds)]
+        batch = self._new_batch((len(clouds),) + selected[0].shape)
+        return torch.stack(selected, out=batch)
+
+    @property
+    def fps_on_the_fly(self) -> bool:
+        """
+        Whether FPS runs at load time on whole clouds, because no FPS cache is available.
+        """
+        return self.sampling == 'fps' and self.fps_orderings is None
+
+    def _fetch(self, idxs: List[int]) -> List[np.ndarray]:
+        """
+        Load the sampled rows of samples (whole clouds when FPS runs on the fly), through the
+        read-ahead prefetcher when it is enabled.
+
+        :param idxs: The indices of the data samples.
+        :return: The loaded float32 arrays.
+        """
+        if self.prefetcher is not None:
+            return self.prefetcher.get_many(idxs)
+        return [self._load(idx, self.select_indices(idx)) for idx in idxs]
+
+    def set_index_order(self, order: List[int], batch_size: int = 1) -> None:
+        """
+        Announce the sample order of the next epoch to the read-ahead prefetcher.
+
+        Call this before iterating the DataLoader, e.g. with ``list(sampler)`` after ``sampler.set_epoch``.
+        The order is shared with the workers, so running persistent workers pick it up at their next batch.
+
+        :param order: The upcoming sample indices.
+        :param batch_size: The DataLoader batch size.
+        """
+        if self.prefetcher is not None:
+            self.prefetcher.set_order(order, batch_size)
+
+    @profiling.timed('dataset.getitem')
     def __getitem__(self, idx: int) -> tuple:
         """
         Get a data sample given its index.
 
         :param idx: The index of the data sample.
-        :return: A tuple containing the taxonomy ID, model ID, and the data.
+        :return: A tuple containing the taxonomy ID, model ID, and the data. With BATCH.CODED_IDS, the
+                 taxonomy code and the sample index instead of the IDs, see decode_ids.
+        """
+        # Gather only the sampled rows instead of loading the whole point cloud.
+        rows = self._fetch([idx])[0]
+        data = self._fps_batch([rows])[0] if self.fps_on_the_fly else torch.from_numpy(rows)
+        if self.coded_ids:
+            return int(self.file_list.taxonomy_codes[idx]), idx, data
+        return self.file_list.taxonomy_id(idx), self.file_list.model_id(idx), data
+
+    @profiling.timed('dataset.getitems')
+    def __getitems__(self, idxs: List[int]) -> List[tuple]:
+        """
+        Get a batch of data samples. Used by the DataLoader instead of one __getitem__ call per sample.
+
+        All samples are written into one preallocated (B, k, C) tensor, with BATCH.BUFFERS into the next
+        of the reusable buffers (see BatchBuffers). The returned point tensors are views of it, and the
+        list carries the collated batch, which ``collate_fn`` hands on without stacking. With
+        BATCH.CODED_IDS the ids are (B,) int64 arrays of codes (see decode_ids) instead of lists of strings.
+
+        :param idxs: The indices of the data samples.
+        :return: A list of (taxonomy ID, model ID, data) tuples.
+        """
+        if self.packed is not None and self.cache is None and self.prefetcher is None and not self.fps_on_the_fly:
+            # Packed shards are memory-mapped: gather all rows with one vectorized take per shard.
+            indices = np.stack([self.select_indices(idx) for idx in idxs])
+            batch = self._new_batch(indices.shape + (self.packed.channels,))
+            self.packed.get_batch(idxs, indices, out=batch.numpy())
+        else:
+            rows = self._fetch(idxs)
+            if self.fps_on_the_fly:
+                batch = self._fps_batch(rows)
+            else:
+                batch = self._new_batch((len(rows),) + rows[0].shape)
+                np.stack(rows, out=batch.numpy())
+
+        profiling.count('dataset.samples', len(idxs))
+        if self.coded_ids:
+            # NumPy arrays are pickled inline; tensors would each be sent as another shared memory segment.
+            taxonomy_ids = self.file_list.taxonomy_codes[idxs].astype(np.int64)
+            model_ids = np.asarray(idxs, dtype=np.int64)
+            samples = [(code, idx, batch[i]) for i, (code, idx) in enumerate(zip(taxonomy_ids.tolist(), idxs))]
+        else:
+            taxonomy_ids = [self.file_list.taxonomy_id(idx) for idx in idxs]
+            model_ids = [self.file_list.model_id(idx) for idx in idxs]
+            samples = [(taxonomy_ids[i], model_ids[i], batch[i]) for i in range(len(idxs))]
+        return CollatedBatch(samples, [taxonomy_ids, model_ids, batch])
+
+    @staticmethod
+    @profiling.timed('dataset.collate')
+    def collate_fn(batch: List[tuple]) -> list:
+        """
+        Collate samples into a batch, without copying anything when they come from __getitems__.
+
+        :param batch: A list of (taxonomy ID, model ID, data) tuples.
+        :return: A list of taxonomy IDs, model IDs and a (B, k, C) tensor, like default_collate. Integer-coded
+                 ids are returned as (B,) int64 arrays.
         """
-        sample = self.file_list[idx]
-        data = IO.get(os.path.join(self.data_root, sample['file_path'])).astype(np.float32)
-        data = self.random_sample(data, self.sample_points_num)
-        data = torch.from_numpy(data).float()
-        return sample['taxonomy_id'], sample['model_id'], data
+        if isinstance(batch, CollatedBatch):
+            return batch.collated
+        taxonomy_ids, model_ids, points = zip(*batch)
+        if isinstance(taxonomy_ids[0], int):
+            return [np.array(taxonomy_ids, dtype=np.int64), np.array(model_ids, dtype=np.int64), torch.stack(points)]
+        return [list(taxonomy_ids), list(model_ids), torch.stack(points)]
 
     def __len__(self) -> int:
         """
@@ -0,0 +1,150 @@
+import os
+import torch
+import numpy as np
+import torch.distributed as dist
+import torch.utils.data as data
+from typing import Iterator, List, Tuple
+from .build import DATASETS
+from .packed import PackedShards
+from utils.logger import print_log
+
+
+@DATASETS.register_module()
+class ShapeNetStream(data.IterableDataset):
+    """
+    Streaming variant of ShapeNet over a packed dataset (see tools/pack_dataset.py).
+
+    The samples are cut, in storage order, into blocks of BLOCK_SIZE samples. Every epoch the blocks are
+    shuffled and dealt out as disjoint, equally sized slices to the ranks, and each rank's slice is split
+    again over its DataLoader workers. Every process therefore only reads its own part of the shards, in
+    long sequential runs. Samples are mixed with a shuffle buffer of SHUFFLE_BUFFER samples.
+
+    The rank and world size are taken from ``rank``/``world_size`` in the config, else from an initialized
+    process group, else from the RANK/WORLD_SIZE environment variables.
+
+    :param config: Configuration object with dataset parameters.
+    """
+    def __init__(self, config) -> None:
+        self.data_root = config.DATA_PATH
+        self.subset = config.subset  # train, test, val
+        self.whole = config.get('whole', False)
+        self.sample_points_num = config.npoint
+        self.shuffle_buffer = config.get('SHUFFLE_BUFFER', 1024)
+        self.block_size = config.get('BLOCK_SIZE', 256)
+        self.seed = config.get('seed', 0)
+        self.rank, self.world_size = self._get_dist_info(config)
+        # In shared memory, so persistent DataLoader workers see the epoch set after they started.
+        self._epoch = torch.zeros(1, dtype=torch.int64).share_memory_()
+
+        packed_root = config.get('PACKED_PATH', os.path.join(self.data_root, 'packed'))
+        subsets = [self.subset, 'test'] if self.whole else [self.subset]
+        self.packed = PackedShards(packed_root, subsets)
+        # Sample indices in storage order.
+        self.storage_order = np.lexsort((self.packed.offset, self.packed.shard))
+
+        print_log(f'[DATASET] Stream {len(self.packed)} instances of {subsets} from {packed_root}, '
+                  f'rank {self.rank}/{self.world_size} gets {len(self)}', logger='PartNet')
+
+    @staticmethod
+    def _get_dist_info(config) -> Tuple[int, int]:
+        if 'rank' in config and 'world_size' in config:
+            return config.rank, config.world_size
+        if dist.is_available() and dist.is_initialized():
+            return dist.get_rank(), dist.get_world_size()
+        return int(os.environ.get('RANK', 0)), int(os.environ.get('WORLD_SIZE', 1))
+
+    @property
+    def epoch(self) -> int:
+        return int(self._epoch[0])
+
+    def set_epoch(self, epoch: int) -> None:
+        """
+        Set the epoch, which changes the block assignment and shuffling. Call before iterating the
+        DataLoader; running (persistent) workers pick it up when their next epoch starts.
+
+        :param epoch: The epoch number.
+        """
+        self._epoch[0] = epoch
+
+    def __len__(self) -> int:
+        """
+        Number of samples this rank yields per epoch. Every rank yields the same number.
+        """
+        return len(self.packed) // self.world_size
+
+    def _worker_samples(self, epoch: int) -> np.ndarray:
+        """
+        The samples of the current rank and worker for an epoch, in read order.
+
+        :param epoch: The epoch number.
+        :return: Sample indices.
+        """
+        rng = np.random.default_rng([self.seed, epoch])
+        blocks = [self.storage_order[begin:begin + self.block_size]
+                  for begin in range(0, len(self.storage_order), self.block_size)]
+        samples = np.concatenate([blocks[i] for i in rng.permutation(len(blocks))])
+
+        per_rank = len(self)
+        rank_samples = samples[self.rank * per_rank:(self.rank + 1) * per_rank]
+
+        worker_info = data.get_worker_info()
+        if worker_info is None:
+            return rank_samples
+        return np.array_split(rank_samples, worker_info.num_workers)[worker_info.id]
+
+    def _runs(self, samples: np.ndarray) -> Iterator[List[int]]:
+        # Group samples that are stored back to back, so each group is read with one sequential read.
+        run = []
+        for idx in samples:
+            if run:
+                last = run[-1]
+                if (self.packed.shard[idx] != self.packed.shard[last]
+                        or self.packed.offset[idx] != self.packed.offset[last] + self.packed.num_points[last]
+                        or len(run) >= self.block_size):
+                    yield run
+                    run = []
+            run.append(int(idx))
+        if run:
+            yield run
+
+    def _read_samples(self, samples: np.ndarray, rng: np.random.Generator) -> Iterator[tuple]:
+        for run in self._runs(samples):
+            start = int(self.packed.offset[run[0]])
+            rows = self.packed.read_rows(int(self.packed.shard[run[0]]), start,
+                                         int(self.packed.offset[run[-1]] + self.packed.num_points[run[-1]]))
+            for idx in run:
+                begin, num_points = int(self.packed.offset[idx]) - start, int(self.packed.num_points[idx])
+                if self.sample_points_num < num_points:
+                    indices = rng.choice(num_points, size=self.sample_points_num, replace=False, shuffle=False)
+                    indices.sort()
+                else:
+                    indices = np.arange(num_points)
+                yield (self.packed.taxonomy_id[idx].decode(), self.packed.model_id[idx].decode(),
+                       torch.from_numpy(rows[begin + indices]))
+
+    def __iter__(self) -> Iterator[tuple]:
+        """
+        Iterate over the samples of the current rank and worker.
+
+        :return: An iterator of (taxonomy ID, model ID, data) tuples.
+        """
+        worker_info = data.get_worker_info()
+        worker_id = worker_info.id if worker_info is not None else 0
+        epoch = self.epoch
+        rng = np.random.default_rng([self.seed, epoch, self.rank, worker_id])
+
+        samples = self._read_samples(self._worker_samples(epoch), rng)
+        if self.shuffle_buffer <= 1:
+            yield from samples
+            return
+
+        buffer = []
+        for sample in samples:
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(sample)
+                continue
+            i = rng.integers(len(buffer))
+            buffer[i], sample = sample, buffer[i]
+            yield sample
+        rng.shuffle(buffer)
+        yield from buffer
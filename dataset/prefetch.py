@@ -0,0 +1,150 @@
+import os
+import torch
+import numpy as np
+import torch.utils.data as data
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence
+
+
+class ReadaheadPrefetcher:
+    """
+    Issues the reads of upcoming samples on a small thread pool, so file and network latency overlap
+    with the work of the calling process.
+
+    Reads are split in two steps: ``prepare_fn(idx)`` runs in the calling thread when a sample is
+    scheduled (e.g. to draw its random point indices, keeping random streams deterministic), and
+    ``load_fn(idx, prepared)`` runs on the pool. At most ``depth`` samples are in flight or waiting.
+
+    The upcoming order is given with :meth:`set_order`. Inside a DataLoader worker only the batches
+    that worker will receive (round robin over the workers) are read ahead. With ``capacity``, the order
+    is kept in shared memory, so workers that are already running (persistent workers) pick up a new
+    order at their next batch.
+
+    :param load_fn: Loads a sample given its index and the output of prepare_fn.
+    :param prepare_fn: Prepares the load of a sample in the calling thread.
+    :param depth: Maximum number of samples read ahead.
+    :param num_threads: Number of reader threads.
+    :param capacity: Maximum length of an order shared with running workers, e.g. the dataset length;
+                     0 only passes the order to workers when they are started.
+    """
+    def __init__(self, load_fn: Callable[[int, Any], Any], prepare_fn: Callable[[int], Any],
+                 depth: int = 64, num_threads: int = 4, capacity: int = 0) -> None:
+        self.load_fn = load_fn
+        self.prepare_fn = prepare_fn
+        self.depth = depth
+        self.num_threads = num_threads
+        # [version, length, batch size, order...]; the version is odd while the order is written.
+        self._shared = torch.zeros(3 + capacity, dtype=torch.int64).share_memory_() if capacity > 0 else None
+        self._version = 0
+
+        self._order: Optional[np.ndarray] = None
+        self._batch_size = 1
+        self._stream: Optional[np.ndarray] = None
+        self._stream_stale = True
+        self._cursor = 0
+        self._pending: OrderedDict = OrderedDict()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pid = None
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state.update(_pool=None, _pid=None, _pending=OrderedDict(), _stream=None, _stream_stale=True)
+        return state
+
+    def _ensure_process(self) -> None:
+        # Threads do not survive a fork: every process starts its own pool and read-ahead stream.
+        if self._pid != os.getpid():
+            self._pool = ThreadPoolExecutor(max_workers=self.num_threads, thread_name_prefix='readahead')
+            self._pending = OrderedDict()
+            self._stream_stale = True
+            self._pid = os.getpid()
+        if self._shared is not None and int(self._shared[0]) != self._version:
+            self._read_shared_order()
+        if self._stream_stale:
+            self._stream = self._own_stream()
+            self._cursor = 0
+            self._stream_stale = False
+
+    def set_order(self, order: Sequence[int], batch_size: int = 1) -> None:
+        """
+        Set the order in which samples will be requested, typically ``list(sampler)`` for the next epoch.
+
+        :param order: The upcoming sample indices.
+        :param batch_size: The DataLoader batch size, used to work out which batches each worker gets.
+        """
+        self._order = np.asarray(order, dtype=np.int64)
+        self._batch_size = batch_size
+        self._stream_stale = True
+        if self._shared is not None:
+            if len(self._order) > len(self._shared) - 3:
+                raise ValueError(f'Order of {len(self._order)} samples exceeds the capacity {len(self._shared) - 3}')
+            self._shared[0] += 1
+            self._shared[1] = len(self._order)
+            self._shared[2] = batch_size
+            self._shared[3:3 + len(self._order)] = torch.from_numpy(self._order)
+            self._shared[0] += 1
+            self._version = int(self._shared[0])
+
+    def _read_shared_order(self) -> None:
+        version = int(self._shared[0])
+        if version % 2:
+            # Being written; read it at the next call.
+            return
+        length, batch_size = int(self._shared[1]), int(self._shared[2])
+        order = self._shared[3:3 + length].numpy().copy()
+        if int(self._shared[0]) != version:
+            return
+        self._order, self._batch_size, self._version = order, batch_size, version
+        self._stream_stale = True
+
+    def _own_stream(self) -> Optional[np.ndarray]:
+        if self._order is None:
+            return None
+        worker_info = data.get_worker_info()
+        if worker_info is None:
+            return self._order
+        batches = [self._order[begin:begin + self._batch_size]
+                   for begin in range(0, len(self._order), self._batch_size)]
+        own = batches[worker_info.id::worker_info.num_workers]
+        return np.concatenate(own) if own else np.empty(0, dtype=np.int64)
+
+    def _submit(self, idx: int) -> None:
+        if idx in self._pending or len(self._pending) >= self.depth:
+            return
+        prepared = self.prepare_fn(idx)
+        self._pending[idx] = self._pool.submit(self.load_fn, idx, prepared)
+
+    def _advance(self, idxs: Sequence[int]) -> None:
+        if self._stream is None:
+            return
+        # Move the cursor past the requested samples, then top the queue up from the upcoming stream.
+        window = self._stream[self._cursor:self._cursor + self.depth + len(idxs)]
+        hits = np.flatnonzero(np.isin(window, idxs))
+        if len(hits):
+            self._cursor += int(hits[-1]) + 1
+        # Drop reads the stream has moved past, so they cannot block the queue.
+        upcoming = set(self._stream[self._cursor:self._cursor + self.depth].tolist())
+        for idx in [idx for idx in self._pending if idx not in upcoming]:
+            self._pending.pop(idx).cancel()
+        ahead = self._cursor
+        while len(self._pending) < self.depth and ahead < len(self._stream):
+            self._submit(int(self._stream[ahead]))
+            ahead += 1
+
+    def get_many(self, idxs: Sequence[int]) -> List[Any]:
+        """
+        Get loaded samples. Samples that were not read ahead are loaded now, concurrently.
+
+        :param idxs: The indices of the samples.
+        :return: The outputs of load_fn, in the order of idxs.
+        """
+        self._ensure_process()
+        futures: List[Future] = []
+        for idx in idxs:
+            future = self._pending.pop(idx, None)
+            if future is None:
+                future = self._pool.submit(self.load_fn, idx, self.prepare_fn(idx))
+            futures.append(future)
+        self._advance(idxs)
+        return [future.result() for future in futures]
@@ -0,0 +1,35 @@
+import itertools
+import torch.utils.data as data
+from typing import Iterator
+
+
+class ResumableSampler(data.Sampler):
+    """
+    Wraps a sampler with a deterministic order per epoch (e.g. a DistributedSampler) so an epoch can be
+    resumed in the middle: after :meth:`skip`, the next iteration leaves out the samples that were
+    already consumed, without loading them.
+
+    :param sampler: The wrapped sampler.
+    """
+    def __init__(self, sampler: data.Sampler) -> None:
+        self.sampler = sampler
+        self._skip = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        if hasattr(self.sampler, 'set_epoch'):
+            self.sampler.set_epoch(epoch)
+
+    def skip(self, num_samples: int) -> None:
+        """
+        Skip the first samples of the next iteration only.
+
+        :param num_samples: The number of samples to skip, e.g. consumed batches times the batch size.
+        """
+        self._skip = num_samples
+
+    def __iter__(self) -> Iterator[int]:
+        skip, self._skip = self._skip, 0
+        return itertools.islice(iter(self.sampler), skip, None)
+
+    def __len__(self) -> int:
+        return max(len(self.sampler) - self._skip, 0)
@@ -0,0 +1,109 @@
+import os
+import torch
+import numpy as np
+from typing import Optional
+from utils.logger import print_log
+
+
+def farthest_point_sample(points: torch.Tensor, num: int, start: Optional[torch.Tensor] = None) -> torch.Tensor:
+    """
+    Farthest point sampling on a batch of point clouds.
+
+    The loop runs over the ``num`` selected points only; every step updates the distances of all points
+    of all clouds at once, so the cost is ``num`` vectorized (B, N) operations.
+
+    :param points: (B, N, C) or (N, C) point clouds. Only the first three channels are used.
+    :param num: The number of points to select.
+    :param start: Optional (B,) indices of the first selected point per cloud. Defaults to point 0.
+    :return: (B, num) or (num,) indices, in selection order.
+    """
+    unbatched = points.dim() == 2
+    if unbatched:
+        points = points.unsqueeze(0)
+    xyz = points[..., :3].float()
+    batch_size, num_points, _ = xyz.shape
+    num = min(num, num_points)
+
+    selected = torch.empty((batch_size, num), dtype=torch.long, device=xyz.device)
+    distances = torch.full((batch_size, num_points), float('inf'), device=xyz.device)
+    farthest = torch.zeros(batch_size, dtype=torch.long, device=xyz.device) if start is None else start.to(xyz.device)
+    batch_index = torch.arange(batch_size, device=xyz.device)
+
+    for i in range(num):
+        selected[:, i] = farthest
+        centroid = xyz[batch_index, farthest].unsqueeze(1)
+        torch.minimum(distances, ((xyz - centroid) ** 2).sum(-1), out=distances)
+        farthest = distances.argmax(-1)
+
+    return selected[0] if unbatched else selected
+
+
+def fps_cache_path(cache_dir: str, subset: str, whole: bool, num: int) -> str:
+    """
+    Path of the cached FPS orderings of a subset.
+
+    :param cache_dir: Directory holding the FPS caches.
+    :param subset: The dataset subset (train, test, val).
+    :param whole: Whether the subset includes the test split.
+    :param num: Length of the cached orderings.
+    :return: Path of the .npy cache file.
+    """
+    return os.path.join(cache_dir, f'fps-{subset}{"-whole" if whole else ""}-{num}.npy')
+
+
+def find_fps_cache(cache_dir: str, subset: str, whole: bool, num: int) -> Optional[str]:
+    """
+    Find the shortest cached ordering that has at least ``num`` points.
+
+    :param cache_dir: Directory holding the FPS caches.
+    :param subset: The dataset subset (train, test, val).
+    :param whole: Whether the subset includes the test split.
+    :param num: The number of points needed.
+    :return: The path of a usable cache file, or None.
+    """
+    if not os.path.isdir(cache_dir):
+        return None
+    prefix = os.path.basename(fps_cache_path(cache_dir, subset, whole, 0))[:-len('0.npy')]
+    lengths = [int(name[len(prefix):-len('.npy')]) for name in os.listdir(cache_dir)
+               if name.startswith(prefix) and name[len(prefix):-len('.npy')].isdigit()]
+    lengths = [length for length in lengths if length >= num]
+    return fps_cache_path(cache_dir, subset, whole, min(lengths)) if lengths else None
+
+
+def build_fps_cache(dataset, num: int, cache_dir: str, batch_size: int = 32, device: str = 'cpu',
+                    logger: Optional[str] = None) -> str:
+    """
+    Precompute the FPS ordering of every sample of a dataset and store it on disk.
+
+    Because an FPS ordering is greedy, its first k entries are the FPS selection of k points for any
+    k <= num. At training time taking a prefix of a cached ordering therefore costs the same as random sampling.
+
+    :param dataset: A ShapeNet dataset.
+    :param num: Length of the stored orderings.
+    :param cache_dir: Output directory.
+    :param batch_size: Number of clouds processed per FPS call.
+    :param device: Device to run FPS on.
+    :param logger: Optional logger name.
+    :return: Path of the written cache file.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    orderings = None
+
+    for begin in range(0, len(dataset), batch_size):
+        idxs = range(begin, min(begin + batch_size, len(dataset)))
+        clouds = [torch.from_numpy(dataset._load(idx)) for idx in idxs]
+        if len({len(cloud) for cloud in clouds}) == 1:
+            ordering = farthest_point_sample(torch.stack(clouds).to(device), num).cpu().numpy()
+        else:
+            ordering = np.stack([farthest_point_sample(cloud.to(device), num).cpu().numpy() for cloud in clouds])
+
+        if orderings is None:
+            dtype = np.int16 if max(len(cloud) for cloud in clouds) <= np.iinfo(np.int16).max else np.int32
+            orderings = np.empty((len(dataset), ordering.shape[1]), dtype=dtype)
+        orderings[begin:begin + len(ordering)] = ordering
+        print_log(f'[FPS] {begin + len(ordering)}/{len(dataset)} samples', logger=logger)
+
+    path = fps_cache_path(cache_dir, dataset.subset, dataset.whole, num)
+    np.save(path, orderings)
+    print_log(f'[FPS] Saved orderings to {path}', logger=logger)
+    return path
@@ -1,47 +1,54 @@
+import os
 import time
-import torch
 
 from utils import parser
-from utils.config import *
-from utils.logger import *
-from utils.misc import set_random_seed, initialize_wandb
-from tools.model_trainer import fine_tune, pre_train
-from tools.model_tester import test
+from utils.config import get_cfg, log_args_to_file, log_config_to_file
+from utils.logger import get_root_logger
+from utils.misc import set_random_seed, initialize_metrics
+from utils import profiling
 
 
 def main():
-    # args
+    # args (parsed before any heavy import, so --help and invalid arguments return immediately)
     args = parser.get_args()
+    import torch
+    from utils.dist_utils import init_dist, destroy_dist
+    # distributed (before the logger, which only writes the log file on rank 0)
+    init_dist(args, backend=args.dist_backend)
     # logger
     time_stamp = time.strftime('%Y%m%d_%H%M%S', time.localtime())
     log_file = os.path.join(args.experiment_path, f'{time_stamp}.log')
-    logger = get_root_logger(log_file=log_file, name=args.log_name)
+    logger = get_root_logger(log_file=log_file, name=args.log_name, use_queue=True)
     # config
     config = get_cfg(args=args, logger=logger)
     # CUDA
     args.use_gpu = True if config['device']['name'] == 'cuda' and torch.cuda.is_available() else False
     torch.backends.cudnn.benchmark = args.use_gpu
-    # Weights and Biases
-    initialize_wandb(args=args, config=config, project_name='Deep Learning Project')
+    # metrics (Weights and Biases and a local metrics.jsonl)
+    metrics = initialize_metrics(args=args, config=config, project_name='Deep Learning Project', logger=logger)
     # log
     log_args_to_file(args=args, logger=logger)
     log_config_to_file(cfg=config, pre='config', logger=logger)
     # random seed 
-    set_random_seed(logger=logger, seed=args.seed + args.local_rank, deterministic=args.deterministic)
+    set_random_seed(logger=logger, seed=args.seed + args.rank, deterministic=args.deterministic)
+    # profiling (before the DataLoader workers start, so they profile too)
+    if args.profile:
+        profiling.enable(os.path.join(args.experiment_path, 'profile'))
     
     # run 
     if args.test:
-        test()
+        from tools.model_tester import test
+        test(args, config, logger=logger, metrics=metrics)
     else:
-        if args.finetune_model:
-            fine_tune()
+        from tools.model_trainer import fine_tune, pre_train
+        if args.finetune:
+            fine_tune(args, config, logger=logger, metrics=metrics)
         else:
-            pre_train()
+            pre_train(args, config, logger=logger, metrics=metrics)
+    # final summary, once the DataLoader workers have exited and written their last profiles
+    profiling.report(logger)
+    destroy_dist()
 
 
-
-
-    
-
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,22 @@
+from typing import Optional, Dict, Any
+from utils import registry
+
+
+MODELS = registry.Registry('models')
+
+
+def build_model_from_cfg(cfg: Dict[str, Any], default_args: Optional[Dict[str, Any]] = None) -> Any:
+    """
+    Build a model, defined by the 'NAME' key in the cfg dictionary.
+
+    Models are ``torch.nn.Module`` classes registered with ``@MODELS.register_module()`` (or lazily with
+    ``MODELS.register_lazy``). In training mode their forward takes a (B, N, 3) batch of point clouds and
+    returns the scalar loss, computed with the loss named by the 'loss' key of cfg. For evaluation they must
+    also define ``predict(points)``, returning a dict of per-sample (B, ...) outputs: the 'loss' and, for
+    the cdl1/cdl2 metrics, the 'reconstruction' (see tools/model_tester.py).
+
+    :param cfg: A dictionary containing the configuration for the model.
+    :param default_args: Optional default arguments for building the model.
+    :return: A constructed model specified by the NAME key in the cfg dictionary.
+    """
+    return MODELS.build(cfg, default_args=default_args)
@@ -0,0 +1,157 @@
+import torch
+import numpy as np
+
+from typing import Tuple
+
+
+def _nearest(x: torch.Tensor, y: torch.Tensor, budget_bytes: int) -> torch.Tensor:
+    """
+    Index of the nearest point of y for every point of x.
+
+    The (B, N, M) distance matrix is never materialized: rows of x are processed in tiles whose
+    distance block fits in budget_bytes.
+
+    :param x: (B, N, 3) points.
+    :param y: (B, M, 3) points.
+    :param budget_bytes: Memory budget of a distance tile.
+    :return: (B, N) indices into y.
+    """
+    batch_size, num_x, _ = x.shape
+    num_y = y.shape[1]
+    # A tile holds the distance block and the temporaries of min().
+    rows = max(1, budget_bytes // (2 * batch_size * num_y * x.element_size()))
+    y_t = y.transpose(1, 2)
+    y_sq = (y * y).sum(-1).unsqueeze(1)
+    indices = torch.empty((batch_size, num_x), dtype=torch.long, device=x.device)
+    for begin in range(0, num_x, rows):
+        x_tile = x[:, begin:begin + rows]
+        # |x|^2 is the same for a whole row, so it does not change the argmin.
+        distances = torch.baddbmm(y_sq, x_tile, y_t, alpha=-2)
+        indices[:, begin:begin + rows] = distances.argmin(-1)
+    return indices
+
+
+def _gather(points: torch.Tensor, indices: torch.Tensor) -> torch.Tensor:
+    return points.gather(1, indices.unsqueeze(-1).expand(-1, -1, points.shape[-1]))
+
+
+class ChamferFunction(torch.autograd.Function):
+    """
+    Squared nearest-neighbour distances in both directions, with a backward pass that only needs the
+    nearest-neighbour indices, so neither direction keeps a (B, N, M) tensor for autograd.
+    """
+    @staticmethod
+    def forward(ctx, xyz1: torch.Tensor, xyz2: torch.Tensor, budget_bytes: int) -> Tuple[torch.Tensor, torch.Tensor]:
+        idx1 = _nearest(xyz1, xyz2, budget_bytes)
+        idx2 = _nearest(xyz2, xyz1, budget_bytes)
+        # Exact distances from the indices; the expanded form used to find them can cancel badly.
+        dist1 = ((xyz1 - _gather(xyz2, idx1)) ** 2).sum(-1)
+        dist2 = ((xyz2 - _gather(xyz1, idx2)) ** 2).sum(-1)
+        ctx.save_for_backward(xyz1, xyz2, idx1, idx2)
+        ctx.mark_non_differentiable(idx1, idx2)
+        return dist1, dist2
+
+    @staticmethod
+    def backward(ctx, grad_dist1: torch.Tensor, grad_dist2: torch.Tensor):
+        xyz1, xyz2, idx1, idx2 = ctx.saved_tensors
+        diff1 = 2 * grad_dist1.unsqueeze(-1) * (xyz1 - _gather(xyz2, idx1))
+        diff2 = 2 * grad_dist2.unsqueeze(-1) * (xyz2 - _gather(xyz1, idx2))
+        grad_xyz1 = diff1.scatter_add(1, idx2.unsqueeze(-1).expand_as(diff2), -diff2)
+        grad_xyz2 = diff2.scatter_add(1, idx1.unsqueeze(-1).expand_as(diff1), -diff1)
+        return grad_xyz1, grad_xyz2, None
+
+
+def chamfer_distance(xyz1: torch.Tensor, xyz2: torch.Tensor, budget_mb: float = 256) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Squared distance of every point to its nearest neighbour in the other cloud, computed in tiles
+    within a memory budget. Runs in float32, also under autocast.
+
+    :param xyz1: (B, N, 3) point clouds.
+    :param xyz2: (B, M, 3) point clouds.
+    :param budget_mb: Memory budget of the distance tiles.
+    :return: (B, N) and (B, M) squared distances.
+    """
+    with torch.autocast(device_type=xyz1.device.type, enabled=False):
+        return ChamferFunction.apply(xyz1.float().contiguous(), xyz2.float().contiguous(), int(budget_mb * 2 ** 20))
+
+
+def chamfer_distance_kdtree(xyz1: torch.Tensor, xyz2: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Squared nearest-neighbour distances with scipy KD-trees, for large clouds without gradients,
+    e.g. at evaluation time. Needs scipy.
+
+    :param xyz1: (B, N, 3) point clouds.
+    :param xyz2: (B, M, 3) point clouds.
+    :return: (B, N) and (B, M) squared distances, on the device of xyz1.
+    """
+    from scipy.spatial import cKDTree
+
+    clouds1 = xyz1.detach().float().cpu().numpy()
+    clouds2 = xyz2.detach().float().cpu().numpy()
+    dist1 = np.stack([cKDTree(b).query(a, workers=-1)[0] for a, b in zip(clouds1, clouds2)])
+    dist2 = np.stack([cKDTree(a).query(b, workers=-1)[0] for a, b in zip(clouds1, clouds2)])
+    return (torch.from_numpy(dist1 ** 2).float().to(xyz1.device),
+            torch.from_numpy(dist2 ** 2).float().to(xyz1.device))
+
+
+class ChamferDistance(torch.nn.Module):
+    """
+    Memory-bounded Chamfer distance between two batches of point clouds.
+
+    :param budget_mb: Memory budget of the distance tiles, see chamfer_distance.
+    :param reduction: 'mean' for a scalar over the batch, or 'none' for one value per cloud.
+    :param kdtree: Use scipy KD-trees when no gradient is needed and scipy is installed.
+    """
+    def __init__(self, budget_mb: float = 256, reduction: str = 'mean', kdtree: bool = False) -> None:
+        super().__init__()
+        self.budget_mb = budget_mb
+        self.reduction = reduction
+        self.kdtree = kdtree
+
+    def distances(self, xyz1: torch.Tensor, xyz2: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        if self.kdtree and not (torch.is_grad_enabled() and (xyz1.requires_grad or xyz2.requires_grad)):
+            try:
+                return chamfer_distance_kdtree(xyz1, xyz2)
+            except ImportError:
+                self.kdtree = False
+        return chamfer_distance(xyz1, xyz2, self.budget_mb)
+
+    def reduce(self, value: torch.Tensor) -> torch.Tensor:
+        return value.mean() if self.reduction == 'mean' else value
+
+
+class ChamferDistanceL2(ChamferDistance):
+    """
+    L2 Chamfer distance (cdl2): mean squared nearest-neighbour distance in both directions, summed.
+    """
+    def forward(self, xyz1: torch.Tensor, xyz2: torch.Tensor) -> torch.Tensor:
+        dist1, dist2 = self.distances(xyz1, xyz2)
+        return self.reduce(dist1.mean(1) + dist2.mean(1))
+
+
+class ChamferDistanceL1(ChamferDistance):
+    """
+    L1 Chamfer distance (cdl1): mean nearest-neighbour distance in both directions, averaged.
+    """
+    def forward(self, xyz1: torch.Tensor, xyz2: torch.Tensor) -> torch.Tensor:
+        dist1, dist2 = self.distances(xyz1, xyz2)
+        # The clamp keeps the gradient of sqrt finite for coinciding points.
+        dist1, dist2 = dist1.clamp_min(1e-12).sqrt(), dist2.clamp_min(1e-12).sqrt()
+        return self.reduce((dist1.mean(1) + dist2.mean(1)) / 2)
+
+
+# Losses selected by the 'loss' key of model configs.
+LOSSES = {'cdl1': ChamferDistanceL1, 'cdl2': ChamferDistanceL2}
+
+
+def build_loss(name: str, **kwargs) -> ChamferDistance:
+    """
+    Build a loss by name, e.g. the 'loss' key of a model config.
+
+    :param name: cdl1 or cdl2.
+    :param kwargs: Arguments of the loss, e.g. budget_mb.
+    :return: The loss module.
+    """
+    if name not in LOSSES:
+        raise NotImplementedError(f'Unknown loss {name}, expected one of {list(LOSSES)}')
+    return LOSSES[name](**kwargs)
@@ -0,0 +1,52 @@
+import pytest
+import torch
+
+from models.chamfer import ChamferFunction, chamfer_distance
+
+
+# A tile of 2 rows for (2, 24, 3) against (2, 40, 3) float64 clouds, so every direction spans many tiles.
+BUDGET_BYTES = 2 * 2 * 2 * 40 * 8
+
+
+def _clouds(dtype: torch.dtype = torch.float64):
+    generator = torch.Generator().manual_seed(0)
+    xyz1 = torch.randn(2, 24, 3, generator=generator, dtype=dtype)
+    xyz2 = torch.randn(2, 40, 3, generator=generator, dtype=dtype)
+    return xyz1, xyz2
+
+
+def _dense(xyz1: torch.Tensor, xyz2: torch.Tensor):
+    distances = torch.cdist(xyz1, xyz2) ** 2
+    return distances.min(2).values, distances.min(1).values
+
+
+def test_forward_matches_dense_reference():
+    xyz1, xyz2 = _clouds()
+    dist1, dist2 = ChamferFunction.apply(xyz1, xyz2, BUDGET_BYTES)
+    expected1, expected2 = _dense(xyz1, xyz2)
+    torch.testing.assert_close(dist1, expected1)
+    torch.testing.assert_close(dist2, expected2)
+
+
+def test_float32_entry_point_matches_dense_reference():
+    xyz1, xyz2 = _clouds(torch.float32)
+    dist1, dist2 = chamfer_distance(xyz1, xyz2, budget_mb=BUDGET_BYTES / 2 ** 20)
+    expected1, expected2 = _dense(xyz1.double(), xyz2.double())
+    torch.testing.assert_close(dist1, expected1.float(), rtol=1e-5, atol=1e-6)
+    torch.testing.assert_close(dist2, expected2.float(), rtol=1e-5, atol=1e-6)
+
+
+def test_gradcheck():
+    xyz1, xyz2 = (x.requires_grad_() for x in _clouds())
+    assert torch.autograd.gradcheck(lambda a, b: ChamferFunction.apply(a, b, BUDGET_BYTES), (xyz1, xyz2))
+
+
+@pytest.mark.parametrize('weights', [(1.0, 1.0), (0.3, 2.0)])
+def test_gradient_matches_dense_reference(weights):
+    xyz1, xyz2 = (x.requires_grad_() for x in _clouds())
+    dist1, dist2 = ChamferFunction.apply(xyz1, xyz2, BUDGET_BYTES)
+    grads = torch.autograd.grad(weights[0] * dist1.sum() + weights[1] * dist2.sum(), (xyz1, xyz2))
+    expected1, expected2 = _dense(xyz1, xyz2)
+    expected = torch.autograd.grad(weights[0] * expected1.sum() + weights[1] * expected2.sum(), (xyz1, xyz2))
+    for grad, reference in zip(grads, expected):
+        torch.testing.assert_close(grad, reference)
@@ -0,0 +1,137 @@
+import os
+import socket
+import types
+
+import numpy as np
+import pytest
+import torch
+import torch.multiprocessing as mp
+from easydict import EasyDict
+
+from models.build import MODELS
+from utils.checkpoint import CheckpointManager, LATEST_FILE
+
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAIL_AT = 5
+
+
+@MODELS.register_module(force=True)
+class NoisyToy(torch.nn.Module):
+    """
+    A model whose loss draws from the global torch RNG, so the final weights depend on every rank's RNG stream.
+    """
+    def __init__(self, config) -> None:
+        super().__init__()
+        self.lin = torch.nn.Linear(3, 3)
+        self.fail_at = config.get('fail_at', 0)
+        self.calls = 0
+
+    def forward(self, points: torch.Tensor) -> torch.Tensor:
+        self.calls += 1
+        if self.calls == self.fail_at:
+            raise KeyboardInterrupt
+        return ((self.lin(points + 0.1 * torch.randn_like(points)) - points) ** 2).mean()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _make_dataset(root: str, num_samples: int = 16, num_points: int = 64) -> None:
+    rng = np.random.default_rng(0)
+    names = [f'02691156-m{i}.npy' for i in range(num_samples)]
+    for name in names:
+        np.save(os.path.join(root, name), rng.standard_normal((num_points, 3), dtype=np.float32))
+    with open(os.path.join(root, 'train.txt'), 'w') as f:
+        f.writelines(f'{name}\n' for name in names)
+
+
+def _train(rank: int, world_size: int, port: int, data_path: str, experiment_path: str, fail_at: int) -> None:
+    os.chdir(REPO)
+    os.environ.update(MASTER_ADDR='127.0.0.1', MASTER_PORT=str(port), RANK=str(rank),
+                      WORLD_SIZE=str(world_size), LOCAL_RANK=str(rank))
+    from utils.config import cfg_from_yaml_file
+    from utils.dist_utils import destroy_dist, init_dist
+    from utils.misc import set_random_seed
+    from tools.model_trainer import pre_train
+
+    args = types.SimpleNamespace(local_rank=rank, use_gpu=False, experiment_path=experiment_path, seed=0,
+                                 start_at_ckpnt=None,
+                                 resume_training=os.path.exists(os.path.join(experiment_path, 'checkpoints', LATEST_FILE)))
+    init_dist(args, backend='gloo')
+    set_random_seed(logger=None, seed=args.seed + rank)
+    config = cfg_from_yaml_file('cfgs/train.yaml', cache_dir=None)
+    config.dataset.train.update(DATA_PATH=data_path, N_POINTS=64, npoint=64, FILE_INDEX_CACHE=False)
+    config.model = EasyDict(NAME='NoisyToy', fail_at=fail_at)
+    config.training.update(max_epoch=2, batch_size=2, grad_accumulation=1, val_freq=0, precision='fp32')
+    config.dataloader.num_workers = 0
+    config.checkpoint = EasyDict(every_n_steps=1, keep_last=2, sharded=False)
+    try:
+        pre_train(args, config)
+    except KeyboardInterrupt:
+        pass
+    destroy_dist()
+
+
+def _final_weights(experiment_path: str) -> dict:
+    manager = CheckpointManager(os.path.join(experiment_path, 'checkpoints'))
+    return torch.load(manager.latest(), map_location='cpu', weights_only=False)['base_model']
+
+
+def test_distributed_resume_matches_uninterrupted_run(tmp_path):
+    data_path = tmp_path / 'data'
+    data_path.mkdir()
+    _make_dataset(str(data_path))
+    reference, resumed = str(tmp_path / 'reference'), str(tmp_path / 'resumed')
+
+    mp.spawn(_train, args=(2, _free_port(), str(data_path), reference, 0), nprocs=2)
+    mp.spawn(_train, args=(2, _free_port(), str(data_path), resumed, FAIL_AT), nprocs=2)
+    state = torch.load(CheckpointManager(os.path.join(resumed, 'checkpoints')).latest(), weights_only=False)
+    assert len(state['rng']) == 2
+    assert not torch.equal(state['rng'][0]['torch'], state['rng'][1]['torch'])
+    assert len(state['augment']) == 2
+    mp.spawn(_train, args=(2, _free_port(), str(data_path), resumed, 0), nprocs=2)
+
+    expected, actual = _final_weights(reference), _final_weights(resumed)
+    for key in expected:
+        assert torch.equal(expected[key], actual[key]), key
+
+
+def test_sharded_latest_waits_for_all_shards(tmp_path):
+    rank0 = CheckpointManager(str(tmp_path), sharded=True, rank=0, world_size=2, shard_timeout=0.2)
+    rank1 = CheckpointManager(str(tmp_path), sharded=True, rank=1, world_size=2)
+
+    rank0.save({'value': 0}, epoch=0, step=1)
+    rank0.wait()
+    assert not os.path.exists(tmp_path / LATEST_FILE)
+    assert rank0.latest() is None
+
+    rank1.save({'value': 1}, epoch=0, step=1)
+    rank1.wait()
+    assert rank0.latest() == str(tmp_path / 'ckpt-e0-s1-rank0.pth')
+    assert rank1.latest() == str(tmp_path / 'ckpt-e0-s1-rank1.pth')
+
+
+def test_sharded_latest_falls_back_to_complete_checkpoint(tmp_path):
+    rank0 = CheckpointManager(str(tmp_path), sharded=True, rank=0, world_size=2, shard_timeout=0.2)
+    rank1 = CheckpointManager(str(tmp_path), sharded=True, rank=1, world_size=2)
+    rank1.save({'value': 1}, epoch=0, step=1)
+    rank0.save({'value': 0}, epoch=0, step=1)
+    rank0.wait()
+    rank1.wait()
+    assert (tmp_path / LATEST_FILE).read_text().strip() == 'ckpt-e0-s1'
+
+    # Rank 1 dies before writing its shard of step 2.
+    rank0.save({'value': 0}, epoch=0, step=2)
+    rank0.wait()
+    (tmp_path / LATEST_FILE).write_text('ckpt-e0-s2\n')
+    assert rank0.latest() == str(tmp_path / 'ckpt-e0-s1-rank0.pth')
+    assert rank1.latest() == str(tmp_path / 'ckpt-e0-s1-rank1.pth')
+
+
+@pytest.mark.parametrize('sharded', [False, True])
+def test_latest_is_none_without_checkpoints(tmp_path, sharded):
+    assert CheckpointManager(str(tmp_path), sharded=sharded, world_size=2).latest() is None
@@ -0,0 +1,25 @@
+from utils.config import cfg_from_yaml_file
+
+
+def test_snapshot_depends_on_the_working_directory(tmp_path, monkeypatch):
+    # base.yaml is resolved against the working directory, as it does not exist next to train.yaml.
+    (tmp_path / 'cfgs').mkdir()
+    (tmp_path / 'cfgs' / 'train.yaml').write_text('_base_: base.yaml\nname: train\n')
+    for name in ('a', 'b'):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / 'base.yaml').write_text(f'value: {name}\n')
+    cfg_file, cache_dir = str(tmp_path / 'cfgs' / 'train.yaml'), str(tmp_path / 'cache')
+
+    for name in ('a', 'b', 'a'):
+        monkeypatch.chdir(tmp_path / name)
+        cfg = cfg_from_yaml_file(cfg_file, cache_dir=cache_dir)
+        assert cfg == {'value': name, 'name': 'train'}
+
+
+def test_snapshot_is_invalidated_by_an_edited_base(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'base.yaml').write_text('value: 1\n')
+    (tmp_path / 'train.yaml').write_text('section: {_base_: base.yaml, other: 2}\n')
+    assert cfg_from_yaml_file('train.yaml', cache_dir='cache').section == {'value': 1, 'other': 2}
+    (tmp_path / 'base.yaml').write_text('value: 3\n')
+    assert cfg_from_yaml_file('train.yaml', cache_dir='cache').section == {'value': 3, 'other': 2}
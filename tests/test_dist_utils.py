@@ -0,0 +1,74 @@
+import copy
+import os
+import socket
+import types
+
+import torch
+import torch.multiprocessing as mp
+from easydict import EasyDict
+
+from utils.dist_utils import all_reduce_sum, broadcast_object, destroy_dist, get_dist_info, init_dist, wrap_ddp
+
+
+WORLD_SIZE = 2
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _shard(rank: int):
+    generator = torch.Generator().manual_seed(rank)
+    return torch.randn(4, 3, generator=generator), torch.randn(4, 2, generator=generator)
+
+
+def _worker(rank: int, port: int) -> None:
+    os.environ.update(MASTER_ADDR='127.0.0.1', MASTER_PORT=str(port), RANK=str(rank),
+                      WORLD_SIZE=str(WORLD_SIZE), LOCAL_RANK=str(rank))
+    args = types.SimpleNamespace(local_rank=0)
+    init_dist(args, backend='gloo')
+    try:
+        assert args.distributed and (args.rank, args.world_size, args.local_rank) == (rank, WORLD_SIZE, rank)
+        assert get_dist_info() == (rank, WORLD_SIZE)
+
+        tensor = torch.full((3,), float(rank + 1))
+        assert all_reduce_sum(tensor) is tensor
+        assert torch.equal(tensor, torch.full((3,), 3.0))
+
+        assert broadcast_object({'rank': rank} if rank == 0 else None) == {'rank': 0}
+        assert broadcast_object(f'from {rank}', src=1) == 'from 1'
+
+        # One DDP step on this rank's shard equals one step on both shards in a single process.
+        torch.manual_seed(rank)  # DDP broadcasts rank 0's initial weights
+        model = torch.nn.Linear(3, 2)
+        reference = copy.deepcopy(broadcast_object(model if rank == 0 else None))
+        ddp_model = wrap_ddp(model, args, EasyDict(bucket_cap_mb=1))
+        optimizer = torch.optim.SGD(ddp_model.parameters(), lr=0.1)
+        inputs, targets = _shard(rank)
+        torch.nn.functional.mse_loss(ddp_model(inputs), targets).backward()
+        optimizer.step()
+
+        reference_optimizer = torch.optim.SGD(reference.parameters(), lr=0.1)
+        losses = [torch.nn.functional.mse_loss(reference(x), y) for x, y in map(_shard, range(WORLD_SIZE))]
+        (sum(losses) / WORLD_SIZE).backward()
+        reference_optimizer.step()
+        for param, expected in zip(model.parameters(), reference.parameters()):
+            torch.testing.assert_close(param, expected)
+    finally:
+        destroy_dist()
+
+
+def test_single_process_is_not_distributed(monkeypatch):
+    monkeypatch.delenv('WORLD_SIZE', raising=False)
+    args = types.SimpleNamespace(local_rank=0)
+    init_dist(args)
+    assert not args.distributed and get_dist_info() == (0, 1)
+    tensor = torch.ones(2)
+    assert torch.equal(all_reduce_sum(tensor), torch.ones(2))
+    assert broadcast_object('x') == 'x'
+
+
+def test_two_gloo_ranks():
+    mp.spawn(_worker, args=(_free_port(),), nprocs=WORLD_SIZE)
@@ -0,0 +1,27 @@
+import h5py
+import numpy as np
+import pytest
+
+from dataset.io import IO
+
+
+@pytest.fixture
+def h5_file(tmp_path):
+    path = str(tmp_path / 'points.h5')
+    with h5py.File(path, 'w') as f:
+        f['data'] = np.arange(2 * 10 * 3, dtype=np.float32).reshape(2, 10, 3)
+    yield path
+    IO.h5_pool.close()
+
+
+@pytest.mark.parametrize('indices', [[1, 2, 3, 5], [0, 9], list(range(10))])
+def test_read_h5_indices(h5_file, indices):
+    expected = np.arange(2 * 10 * 3, dtype=np.float32).reshape(2, 10, 3)[1, indices]
+    np.testing.assert_array_equal(IO.get(f'{h5_file}:1', indices=indices), expected)
+
+
+@pytest.mark.parametrize('row', ['', ':0'])
+def test_read_h5_empty_indices(h5_file, row):
+    data = IO.get(h5_file + row, indices=np.array([], dtype=np.int64))
+    assert data.dtype == np.float32
+    assert data.shape == ((0, 10, 3) if row == '' else (0, 3))
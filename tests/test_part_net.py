@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from easydict import EasyDict
+
+from dataset.part_net import ShapeNet
+
+
+@pytest.fixture
+def data_root(tmp_path):
+    rng = np.random.default_rng(0)
+    names = [f'02691156-m{i}.npy' for i in range(4)]
+    for name in names:
+        np.save(tmp_path / name, rng.standard_normal((16, 3), dtype=np.float32))
+    (tmp_path / 'train.txt').write_text(''.join(f'{name}\n' for name in names))
+    return str(tmp_path)
+
+
+def _shapenet(data_root: str, **batch) -> ShapeNet:
+    return ShapeNet(EasyDict(DATA_PATH=data_root, N_POINTS=16, npoint=8, subset='train', FILE_INDEX_CACHE=False,
+                             BATCH=batch))
+
+
+def test_auto_buffers_wait_for_the_prefetch_factor(data_root):
+    dataset = _shapenet(data_root, BUFFERS='auto', PIN=True)
+    assert dataset.batch_buffers is None and not dataset.pin_batches
+    assert dataset.__getitems__([0, 1]).collated[-1].shape == (2, 8, 3)
+
+    dataset.set_prefetch_factor(2)
+    assert dataset.batch_buffers.size == 4 and dataset.pin_batches
+
+
+def test_fixed_buffers_are_used_from_the_start(data_root):
+    dataset = _shapenet(data_root, BUFFERS=3)
+    assert dataset.batch_buffers.size == 3
+    dataset.set_prefetch_factor(2)
+    assert dataset.batch_buffers.size == 3
+
+
+def test_pin_needs_buffers(data_root):
+    with pytest.raises(ValueError):
+        _shapenet(data_root, PIN=True)
@@ -0,0 +1,36 @@
+import os
+
+import numpy as np
+import torch.utils.data as data
+from easydict import EasyDict
+
+from dataset.packed import write_packed_dataset
+from dataset.part_net_stream import ShapeNetStream
+
+
+def _stream(tmp_path) -> ShapeNetStream:
+    rng = np.random.default_rng(0)
+    names = [f'02691156-m{i}.npy' for i in range(32)]
+    for name in names:
+        np.save(tmp_path / name, rng.standard_normal((8, 3), dtype=np.float32))
+    (tmp_path / 'train.txt').write_text(''.join(f'{name}\n' for name in names))
+    write_packed_dataset(str(tmp_path), str(tmp_path / 'packed'), subsets=['train'])
+    return ShapeNetStream(EasyDict(DATA_PATH=str(tmp_path), subset='train', npoint=8, BLOCK_SIZE=4,
+                                   SHUFFLE_BUFFER=4, rank=0, world_size=1))
+
+
+def _epoch(loader: data.DataLoader, epoch: int) -> list:
+    loader.dataset.set_epoch(epoch)
+    return [model_id for _, model_ids, _ in loader for model_id in model_ids]
+
+
+def test_persistent_workers_follow_the_epoch(tmp_path):
+    dataset = _stream(tmp_path)
+    persistent = data.DataLoader(dataset, batch_size=4, num_workers=2, persistent_workers=True)
+    fresh = data.DataLoader(dataset, batch_size=4, num_workers=2)
+
+    epochs = [_epoch(persistent, epoch) for epoch in range(3)]
+    assert epochs[0] != epochs[1] != epochs[2]
+    for epoch, model_ids in enumerate(epochs):
+        assert model_ids == _epoch(fresh, epoch)
+        assert sorted(model_ids) == sorted(f'm{i}' for i in range(32))
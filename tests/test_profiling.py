@@ -0,0 +1,41 @@
+import importlib
+import json
+import threading
+
+from utils import profiling
+
+
+def test_environment_does_not_enable_profiling(monkeypatch, tmp_path):
+    monkeypatch.setenv(profiling.PROFILE_DIR_ENV, str(tmp_path))
+    try:
+        assert not importlib.reload(profiling).is_enabled()
+    finally:
+        monkeypatch.delenv(profiling.PROFILE_DIR_ENV)
+        importlib.reload(profiling)
+
+
+def test_threads_record_every_call(monkeypatch, tmp_path):
+    monkeypatch.delenv(profiling.PROFILE_DIR_ENV, raising=False)
+    profiling.enable(str(tmp_path))
+    try:
+        @profiling.timed('io.get')
+        def read():
+            profiling.count('samples')
+
+        def run():
+            for _ in range(2000):
+                read()
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        profiling.publish()
+        with open(tmp_path / 'rank0-main.json') as f:
+            profile = json.load(f)
+        assert profile['timers']['io.get'][0] == 8000
+        assert profile['counters']['samples'] == 8000
+    finally:
+        monkeypatch.delenv(profiling.PROFILE_DIR_ENV, raising=False)
+        importlib.reload(profiling)
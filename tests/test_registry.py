@@ -0,0 +1,45 @@
+from utils.registry import Registry
+
+
+class A:
+    pass
+
+
+class B:
+    pass
+
+
+def test_child_of_empty_parent_is_attached():
+    parent = Registry('parent', scope='parent')
+    child = Registry('kid', parent=parent, scope='kid')
+    assert parent.children['kid'] is child
+    assert child.build_func is parent.build_func
+
+    child.register_module(module=B)
+    assert parent.get('kid.B') is B
+    assert child.get('parent.B') is None
+
+
+def test_lookup_cache_invalidated_on_forced_registration():
+    parent = Registry('parent', scope='parent')
+    child = Registry('kid', parent=parent, scope='kid')
+    parent.register_module(module=A)
+    assert child.get('A') is A
+
+    class NewA:
+        pass
+
+    parent.register_module(name='A', force=True, module=NewA)
+    assert child.get('A') is NewA
+    assert parent.get('A') is NewA
+
+
+def test_lookup_cache_invalidated_when_child_shadows_parent():
+    parent = Registry('parent', scope='parent')
+    child = Registry('kid', parent=parent, scope='kid')
+    parent.register_module(module=A)
+    assert child.get('A') is A
+
+    child.register_module(name='A', module=B)
+    assert child.get('A') is B
+    assert parent.get('A') is A
@@ -0,0 +1,192 @@
+import gc
+import os
+import json
+import time
+import socket
+import hashlib
+import argparse
+import torch.utils.data as data
+
+from typing import Any, Dict, List, Optional
+from utils.logger import print_log
+from utils.misc import child_pids, memory_mb
+from utils.dist_utils import broadcast_object, get_dist_info
+from dataset.build import build_dataset_from_cfg
+from tools import builder
+
+
+# A trial whose throughput drops this far below the best one ends the search over num_workers.
+TOLERANCE = 0.05
+# Batches between memory samples of a trial.
+MEMORY_EVERY = 5
+
+
+def _config_hash(config: Dict[str, Any], world_size: int) -> str:
+    # Everything that changes the cost of loading a batch, or the candidates tried.
+    key = {'dataset': config.dataset.train, 'dataloader': config.get('dataloader', {}),
+           'batch_size': config.training.batch_size, 'autotune': config.get('autotune', {}),
+           'world_size': world_size}
+    return hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def _loader_memory_mb() -> float:
+    # The main process and its DataLoader workers, with shared pages split between them.
+    return memory_mb(os.getpid()) + sum(memory_mb(pid) for pid in child_pids())
+
+
+def run_trial(args: argparse.Namespace, config: Dict[str, Any], dataset: data.Dataset, num_workers: int,
+              prefetch_factor: int, batch_size: int, warmup_batches: int, trial_batches: int,
+              deadline: float) -> Dict[str, Any]:
+    """
+    Time a DataLoader over the training split with one setting: warmup_batches are skipped (worker start-up,
+    first reads), then the samples/sec over the next trial_batches are measured. Epochs are repeated when
+    the split is shorter than the trial.
+
+    :param args: The arguments from the command line.
+    :param config: The training configuration.
+    :param dataset: The training dataset, shared by all trials.
+    :param num_workers: DataLoader worker processes.
+    :param prefetch_factor: Batches loaded in advance per worker.
+    :param batch_size: Samples per batch.
+    :param warmup_batches: Batches before the timing starts.
+    :param trial_batches: Timed batches.
+    :param deadline: time.monotonic() value at which the trial is abandoned.
+    :return: The setting plus its samples_per_sec and peak memory_mb, and complete=False when it was abandoned.
+    """
+    dataloader_config = {**config.get('dataloader', {}), 'num_workers': num_workers,
+                         'prefetch_factor': prefetch_factor, 'persistent_workers': True}
+    sampler, dataloader = builder.dataset_builder(args, config.dataset.train, dataloader_config, batch_size,
+                                                  shuffle=True, drop_last=True, dataset=dataset)
+    result = {'num_workers': num_workers, 'prefetch_factor': prefetch_factor, 'batch_size': batch_size,
+              'samples_per_sec': 0.0, 'memory_mb': 0.0, 'complete': False}
+    if len(dataloader) == 0:
+        return result
+
+    batch, batches, samples, epoch, start = None, 0, 0, 0, None
+    while batches < warmup_batches + trial_batches and time.monotonic() < deadline:
+        if sampler is not None:
+            sampler.set_epoch(epoch)
+            if getattr(dataset, 'prefetcher', None) is not None:
+                dataset.set_index_order(list(sampler), batch_size)
+        for batch in dataloader:
+            batches += 1
+            if start is None and batches > warmup_batches:
+                start = time.perf_counter()
+            if start is not None:
+                samples += len(batch[-1])
+            if batches % MEMORY_EVERY == 0:
+                result['memory_mb'] = max(result['memory_mb'], _loader_memory_mb())
+            if batches >= warmup_batches + trial_batches or time.monotonic() >= deadline:
+                break
+        epoch += 1
+    if start is not None and batches >= warmup_batches + trial_batches:
+        result['samples_per_sec'] = samples / (time.perf_counter() - start)
+        result['memory_mb'] = max(result['memory_mb'], _loader_memory_mb())
+        result['complete'] = True
+
+    # Shut the persistent workers down before the next trial starts its own.
+    del batch, dataloader
+    gc.collect()
+    return result
+
+
+def search(args: argparse.Namespace, config: Dict[str, Any], logger: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Search the DataLoader settings with the best samples/sec within the memory cap, one parameter at a time:
+    num_workers (ascending, until the memory cap is exceeded or throughput drops), then prefetch_factor for
+    the best worker count, then batch_size. Trials that exceed the cap, or do not complete before the
+    time budget runs out, are not eligible.
+
+    :param args: The arguments from the command line.
+    :param config: The training configuration.
+    :param logger: Optional logger name.
+    :return: The best setting (the configured one when no trial completed) and all trials.
+    """
+    autotune_config = config.get('autotune', {})
+    dataloader_config = config.get('dataloader', {})
+    memory_cap_mb = autotune_config.get('memory_cap_mb', 16384)
+    warmup_batches = autotune_config.get('warmup_batches', 5)
+    trial_batches = autotune_config.get('trial_batches', 20)
+    deadline = time.monotonic() + autotune_config.get('budget_s', 120)
+    best = {'num_workers': dataloader_config.get('num_workers', 0),
+            'prefetch_factor': dataloader_config.get('prefetch_factor', 2),
+            'batch_size': config.training.batch_size, 'samples_per_sec': 0.0}
+    trials: List[Dict[str, Any]] = []
+    dataset = build_dataset_from_cfg(config.dataset.train)
+
+    def trial(**setting) -> Optional[Dict[str, Any]]:
+        if time.monotonic() >= deadline:
+            return None
+        setting = {**best, **setting}
+        result = run_trial(args, config, dataset, setting['num_workers'], setting['prefetch_factor'],
+                           setting['batch_size'], warmup_batches, trial_batches, deadline)
+        result['eligible'] = result['complete'] and result['memory_mb'] <= memory_cap_mb
+        trials.append(result)
+        print_log(f'[AUTOTUNE] num_workers={result["num_workers"]} prefetch_factor={result["prefetch_factor"]} '
+                  f'batch_size={result["batch_size"]}: {result["samples_per_sec"]:.1f} samples/s, '
+                  f'{result["memory_mb"]:.0f} MB' + ('' if result['complete'] else ', out of time') +
+                  ('' if result['memory_mb'] <= memory_cap_mb else ', over the memory cap'), logger=logger)
+        if result['eligible'] and result['samples_per_sec'] > best['samples_per_sec']:
+            best.update({key: result[key] for key in best})
+        return result
+
+    for num_workers in sorted(autotune_config.get('num_workers', [0, 2, 4, 8])):
+        result = trial(num_workers=num_workers)
+        if result is None or not result['eligible'] or \
+                result['samples_per_sec'] < (1 - TOLERANCE) * best['samples_per_sec']:
+            break
+    if best['samples_per_sec'] == 0:
+        print_log('[AUTOTUNE] No setting completed within the budget and memory cap, keeping the configured one',
+                  logger=logger)
+        return {**best, 'trials': trials}
+    if best['num_workers'] > 0:
+        for prefetch_factor in sorted(autotune_config.get('prefetch_factor', [])):
+            if prefetch_factor != best['prefetch_factor'] and trial(prefetch_factor=prefetch_factor) is None:
+                break
+    for batch_size in sorted(autotune_config.get('batch_size', [])):
+        if batch_size != best['batch_size'] and trial(batch_size=batch_size) is None:
+            break
+    return {**best, 'trials': trials}
+
+
+def autotune_dataloader(args: argparse.Namespace, config: Dict[str, Any], logger: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Tune num_workers, prefetch_factor and batch_size of the training DataLoader and write the result into
+    the ``dataloader`` and ``training`` sections of config.
+
+    The search (see search) is configured by the ``autotune`` section: budget_s, warmup_batches,
+    trial_batches, memory_cap_mb (main process plus workers, proportional set size) and the candidate
+    num_workers, prefetch_factor and batch_size lists; an empty batch_size list keeps the configured one.
+    The result is cached in ``autotune/{host}-{config hash}.json`` in the experiment directory, so later
+    runs with the same host and config skip the search. In distributed runs rank 0 searches, timing
+    its own shard, and all ranks use its result.
+
+    :param args: The arguments from the command line.
+    :param config: The training configuration, updated in place.
+    :param logger: Optional logger name.
+    :return: The chosen setting.
+    """
+    rank, world_size = get_dist_info()
+    cache_path = os.path.join(args.experiment_path, 'autotune',
+                              f'{socket.gethostname()}-{_config_hash(config, world_size)}.json')
+    result = None
+    if rank == 0:
+        if os.path.exists(cache_path):
+            with open(cache_path, 'r') as f:
+                result = json.load(f)
+            print_log(f'[AUTOTUNE] Using the cached DataLoader settings from {cache_path}', logger=logger)
+        else:
+            result = search(args, config, logger=logger)
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp_path = f'{cache_path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(result, f, indent=2)
+            os.replace(tmp_path, cache_path)
+    result = broadcast_object(result)
+
+    config.dataloader = {**config.get('dataloader', {}), 'num_workers': result['num_workers'],
+                         'prefetch_factor': result['prefetch_factor']}
+    config.training.batch_size = result['batch_size']
+    print_log(f'[AUTOTUNE] num_workers={result["num_workers"]} prefetch_factor={result["prefetch_factor"]} '
+              f'batch_size={result["batch_size"]} ({result["samples_per_sec"]:.1f} samples/s)', logger=logger)
+    return {key: result[key] for key in ('num_workers', 'prefetch_factor', 'batch_size', 'samples_per_sec')}
@@ -0,0 +1,142 @@
+import json
+import time
+import torch
+import argparse
+import importlib.util
+import numpy as np
+import multiprocessing as mp
+from typing import Dict, List
+from models.chamfer import chamfer_distance, chamfer_distance_kdtree
+
+
+def dense_chamfer(xyz1: torch.Tensor, xyz2: torch.Tensor) -> torch.Tensor:
+    """
+    Reference L2 Chamfer distance with the full (B, N, M) distance matrix.
+    """
+    distances = torch.cdist(xyz1, xyz2) ** 2
+    return distances.min(2)[0].mean(1) + distances.min(1)[0].mean(1)
+
+
+def chunked_chamfer(xyz1: torch.Tensor, xyz2: torch.Tensor, budget_mb: float) -> torch.Tensor:
+    dist1, dist2 = chamfer_distance(xyz1, xyz2, budget_mb)
+    return dist1.mean(1) + dist2.mean(1)
+
+
+def kdtree_chamfer(xyz1: torch.Tensor, xyz2: torch.Tensor) -> torch.Tensor:
+    dist1, dist2 = chamfer_distance_kdtree(xyz1, xyz2)
+    return dist1.mean(1) + dist2.mean(1)
+
+
+def proc_status_mb(field: str) -> float:
+    """
+    A memory field of /proc/self/status (e.g. VmRSS, VmHWM) in megabytes.
+    """
+    with open('/proc/self/status', 'r') as f:
+        for line in f:
+            if line.startswith(f'{field}:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _run_trial(trial: Dict, queue: mp.Queue) -> None:
+    device = torch.device(trial['device'])
+    generator = torch.Generator().manual_seed(0)
+    xyz1 = torch.randn(trial['batch_size'], trial['num_points'], 3, generator=generator).to(device)
+    xyz2 = torch.randn(trial['batch_size'], trial['num_points'], 3, generator=generator).to(device)
+    backward = trial['method'] != 'kdtree'
+    xyz1.requires_grad_(backward)
+
+    def step():
+        if trial['method'] == 'dense':
+            loss = dense_chamfer(xyz1, xyz2).mean()
+        elif trial['method'] == 'chunked':
+            loss = chunked_chamfer(xyz1, xyz2, trial['budget_mb']).mean()
+        else:
+            loss = kdtree_chamfer(xyz1, xyz2).mean()
+        if backward:
+            loss.backward()
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+
+    baseline_mb = proc_status_mb('VmRSS')
+    if device.type == 'cuda':
+        torch.cuda.reset_peak_memory_stats()
+        baseline_mb = torch.cuda.memory_allocated() / 2 ** 20
+    step()
+    times = []
+    for _ in range(trial['repeats']):
+        start = time.perf_counter()
+        step()
+        times.append((time.perf_counter() - start) * 1e3)
+    if device.type == 'cuda':
+        peak_mb = torch.cuda.max_memory_allocated() / 2 ** 20 - baseline_mb
+    else:
+        peak_mb = proc_status_mb('VmHWM') - baseline_mb
+    queue.put({**trial, 'ms_p50': float(np.percentile(times, 50)), 'ms_min': float(np.min(times)),
+               'peak_mb': peak_mb, 'backward': backward})
+
+
+def run_trial(trial: Dict) -> Dict:
+    """
+    Run one configuration in a fresh process, so peak memory is measured per configuration.
+
+    :param trial: The trial settings.
+    :return: The settings plus the time per forward (and backward) pass and the peak memory.
+    """
+    context = mp.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_run_trial, args=(trial, queue))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        return {**trial, 'error': f'exit code {process.exitcode}'}
+    return queue.get()
+
+
+def main():
+    """
+    Compare the dense, chunked and KD-tree Chamfer distances across point counts and batch sizes:
+    time per forward + backward pass (forward only for the KD-tree) and peak memory above the inputs.
+
+    Usage: python -m tools.benchmark_chamfer --num_points 1024 4096 10000 --batch_sizes 8 32 --output chamfer.json
+    """
+    parser = argparse.ArgumentParser(description='Chamfer distance micro-benchmark')
+    parser.add_argument('--methods', type=str, nargs='+', default=['dense', 'chunked', 'kdtree'],
+                        choices=['dense', 'chunked', 'kdtree'])
+    parser.add_argument('--num_points', type=int, nargs='+', default=[1024, 4096, 10000])
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[8, 32])
+    parser.add_argument('--budget_mb', type=float, default=256, help='Tile budget of the chunked version')
+    parser.add_argument('--max_dense_mb', type=float, default=8192,
+                        help='Skip dense runs whose distance matrix would exceed this')
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--output', type=str, default=None, help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    results: List[Dict] = []
+    for num_points in args.num_points:
+        for batch_size in args.batch_sizes:
+            for method in args.methods:
+                matrix_mb = batch_size * num_points * num_points * 4 / 2 ** 20
+                if method == 'dense' and matrix_mb > args.max_dense_mb:
+                    print(f'{method:>8} B={batch_size} N={num_points}: skipped, needs {matrix_mb:.0f} MB')
+                    continue
+                if method == 'kdtree' and importlib.util.find_spec('scipy') is None:
+                    print(f'{method:>8} B={batch_size} N={num_points}: skipped, needs scipy')
+                    continue
+                result = run_trial({'method': method, 'batch_size': batch_size, 'num_points': num_points,
+                                    'budget_mb': args.budget_mb, 'device': args.device, 'repeats': args.repeats})
+                if 'error' in result:
+                    print(f'{method:>8} B={batch_size} N={num_points}: failed ({result["error"]})')
+                else:
+                    print(f'{method:>8} B={batch_size} N={num_points}: {result["ms_p50"]:.1f} ms, '
+                          f'peak {result["peak_mb"]:.0f} MB')
+                results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
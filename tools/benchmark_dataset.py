@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import h5py
+import torch
+import queue
+import argparse
+import numpy as np
+import multiprocessing as mp
+from easydict import EasyDict
+from typing import Dict, List
+from dataset.part_net import ShapeNet
+from dataset.packed import write_packed_dataset
+from utils.misc import child_pids, peak_rss_mb
+
+
+# Backends compared by the benchmark: dataset layout plus ShapeNet config overrides.
+BACKENDS = {
+    'npy': ('npy', {}),
+    'npy-nommap': ('npy', {'MMAP': False}),
+    'h5': ('h5', {}),
+    'packed': ('npy', {'BACKEND': 'packed'}),
+    'npy-cache': ('npy', {'CACHE': {'ENABLED': True, 'BUDGET_MB': 4096}}),
+    'npy-readahead': ('npy', {'READAHEAD': {'DEPTH': 64, 'THREADS': 4}}),
+    'packed-buffers': ('npy', {'BACKEND': 'packed', 'BATCH': {'CODED_IDS': True, 'BUFFERS': 'auto'}}),
+}
+
+
+def generate_dataset(root: str, num_samples: int, num_points: int, test_fraction: float = 0.1,
+                     seed: int = 0) -> None:
+    """
+    Generate a synthetic dataset with the PartNet layout: ``{taxonomy}-{model}`` files listed in
+    train.txt/test.txt. The same clouds are written as .npy under ``root/npy`` and as .h5 under
+    ``root/h5``, and ``root/npy/packed`` holds the packed shards.
+
+    :param root: Output directory.
+    :param num_samples: Number of point clouds.
+    :param num_points: Points per cloud.
+    :param test_fraction: Fraction of the samples listed in test.txt.
+    :param seed: Random seed.
+    """
+    rng = np.random.default_rng(seed)
+    taxonomies = [f'{taxonomy:08d}' for taxonomy in rng.integers(2_000_000, 5_000_000, size=24)]
+    names = [f'{taxonomies[i % len(taxonomies)]}-{i:06d}' for i in range(num_samples)]
+    num_test = int(num_samples * test_fraction)
+
+    for extension in ('npy', 'h5'):
+        os.makedirs(os.path.join(root, extension), exist_ok=True)
+        for subset, subset_names in (('train', names[num_test:]), ('test', names[:num_test])):
+            with open(os.path.join(root, extension, f'{subset}.txt'), 'w') as f:
+                f.writelines(f'{name}.{extension}\n' for name in subset_names)
+
+    for name in names:
+        cloud = rng.standard_normal((num_points, 3), dtype=np.float32)
+        np.save(os.path.join(root, 'npy', f'{name}.npy'), cloud)
+        with h5py.File(os.path.join(root, 'h5', f'{name}.h5'), 'w') as f:
+            f.create_dataset('data', data=cloud)
+
+    write_packed_dataset(os.path.join(root, 'npy'), os.path.join(root, 'npy', 'packed'))
+
+
+def _run_trial(trial: Dict, results: mp.Queue) -> None:
+    layout, overrides = BACKENDS[trial['backend']]
+    config = EasyDict({'DATA_PATH': os.path.join(trial['data_path'], layout), 'N_POINTS': trial['num_points'],
+                       'subset': 'train', 'npoint': trial['npoint'], **overrides})
+    if 'CACHE' in overrides:
+        config.CACHE.NAME = 'benchmark-dataset'
+    dataset = ShapeNet(config)
+    # The shuffled order of every epoch, both followed by the loader and announced to the read-ahead.
+    order: List[int] = []
+    loader = torch.utils.data.DataLoader(dataset, batch_size=trial['batch_size'], sampler=order,
+                                         num_workers=trial['num_workers'], collate_fn=ShapeNet.collate_fn,
+                                         persistent_workers=trial['num_workers'] > 0)
+
+    epoch_results, worker_rss = [], [0.0]
+    for _ in range(trial['epochs']):
+        order[:] = torch.randperm(len(dataset)).tolist()
+        dataset.set_index_order(order, trial['batch_size'])
+        loader_iter = iter(loader)
+        latencies, samples = [], 0
+        start = last = time.perf_counter()
+        for _, _, points in loader_iter:
+            now = time.perf_counter()
+            latencies.append((now - last) / len(points))
+            samples += len(points)
+            last = now
+        elapsed = time.perf_counter() - start
+        # Persistent workers are still alive here; the RSS peak of a process ends with it.
+        worker_rss.extend(peak_rss_mb(pid) for pid in child_pids())
+        latencies = np.array(latencies[1:] or latencies) * 1e3
+        epoch_results.append({
+            'samples_per_sec': samples / elapsed,
+            'latency_ms_p50': float(np.percentile(latencies, 50)),
+            'latency_ms_p90': float(np.percentile(latencies, 90)),
+            'latency_ms_p99': float(np.percentile(latencies, 99)),
+        })
+    cache_stats = dataset.cache_stats()
+    del loader_iter, loader
+    if dataset.cache is not None:
+        dataset.cache.unlink()
+
+    results.put({
+        **trial,
+        'epoch_results': epoch_results,
+        'peak_rss_mb': peak_rss_mb(os.getpid()),
+        'peak_worker_rss_mb': max(worker_rss) if trial['num_workers'] > 0 else 0.0,
+        'cache': cache_stats,
+    })
+
+
+def run_trial(trial: Dict) -> Dict:
+    """
+    Run one benchmark configuration in a fresh process, so peak RSS is measured per configuration.
+
+    :param trial: The trial settings.
+    :return: The settings plus per-epoch throughput, latency percentiles and peak RSS.
+    :raises RuntimeError: If the trial process dies without a result.
+    """
+    context = mp.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=_run_trial, args=(trial, results))
+    process.start()
+    while True:
+        try:
+            result = results.get(timeout=1.0)
+            break
+        except queue.Empty:
+            if process.is_alive():
+                continue
+        # The result may have arrived just before the process exited.
+        try:
+            result = results.get(timeout=1.0)
+            break
+        except queue.Empty:
+            raise RuntimeError(f'Benchmark trial {trial} died with exit code {process.exitcode}') from None
+    process.join()
+    return result
+
+
+def main():
+    """
+    Benchmark ShapeNet data loading across IO backends, num_workers values and batch sizes.
+
+    Usage: python -m tools.benchmark_dataset --data_path /tmp/bench --generate --output bench.json
+    """
+    parser = argparse.ArgumentParser(description='Dataset throughput benchmark')
+    parser.add_argument('--data_path', type=str, required=True, help='Root of the synthetic dataset')
+    parser.add_argument('--generate', action='store_true', help='Generate the synthetic dataset first')
+    parser.add_argument('--num_samples', type=int, default=512, help='Number of generated clouds')
+    parser.add_argument('--num_points', type=int, default=10000, help='Points per generated cloud')
+    parser.add_argument('--npoint', type=int, default=1024, help='Points sampled per cloud')
+    parser.add_argument('--backends', type=str, nargs='+', default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument('--num_workers', type=int, nargs='+', default=[0, 2])
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[32])
+    parser.add_argument('--epochs', type=int, default=2, help='Epochs per configuration (cache effects show from epoch 2)')
+    parser.add_argument('--output', type=str, default=None, help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    if args.generate:
+        generate_dataset(args.data_path, args.num_samples, args.num_points)
+
+    results: List[Dict] = []
+    for backend in args.backends:
+        for num_workers in args.num_workers:
+            for batch_size in args.batch_sizes:
+                result = run_trial({'data_path': args.data_path, 'backend': backend, 'num_workers': num_workers,
+                                    'batch_size': batch_size, 'num_points': args.num_points,
+                                    'npoint': args.npoint, 'epochs': args.epochs})
+                last = result['epoch_results'][-1]
+                print(f'{backend:>14} workers={num_workers} batch={batch_size}: '
+                      f'{last["samples_per_sec"]:.1f} samples/s, p50 {last["latency_ms_p50"]:.3f} ms, '
+                      f'p99 {last["latency_ms_p99"]:.3f} ms, peak RSS {result["peak_rss_mb"]:.0f} MB '
+                      f'(workers {result["peak_worker_rss_mb"]:.0f} MB)')
+                results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
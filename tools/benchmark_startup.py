@@ -0,0 +1,112 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import numpy as np
+from typing import Dict, List, Tuple
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Startup paths measured by the benchmark: command line arguments after the interpreter, plus the heavy
+# modules that path must not import.
+SCENARIOS = {
+    'help': (['main.py', '--help'], ['torch', 'wandb', 'h5py']),
+    'import-main': (['-c', 'import main'], ['torch', 'wandb', 'h5py']),
+    'import-config': (['-c', 'import utils.config, utils.logger'], ['torch', 'wandb', 'h5py']),
+    'import-io': (['-c', 'import dataset.io'], ['torch', 'wandb', 'h5py']),
+}
+
+
+def parse_importtime(stderr: str) -> Tuple[Dict[str, float], List[Tuple[str, float]]]:
+    """
+    Parse the output of ``python -X importtime``.
+
+    :param stderr: The stderr of the process.
+    :return: Cumulative import time in ms per imported module, and the (module, ms) of the
+             top-level imports, slowest first.
+    """
+    modules, top_level = {}, []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        module = name.strip()
+        modules[module] = int(cumulative) / 1e3
+        if not name[1:].startswith(' '):
+            top_level.append((module, modules[module]))
+    return modules, sorted(top_level, key=lambda item: -item[1])
+
+
+def run_scenario(name: str, repeats: int) -> Dict:
+    """
+    Run one startup path in fresh interpreters and measure it.
+
+    :param name: The scenario name, a key of SCENARIOS.
+    :param repeats: Number of runs. Wall times are reported as percentiles over the runs.
+    :return: Wall time percentiles, the import breakdown of the last run, and the forbidden modules it loaded.
+    """
+    argv, forbidden = SCENARIOS[name]
+    wall_ms = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, '-X', 'importtime', *argv], cwd=REPO_ROOT,
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        wall_ms.append((time.perf_counter() - start) * 1e3)
+    modules, top_level = parse_importtime(process.stderr)
+    return {
+        'scenario': name,
+        'argv': argv,
+        'returncode': process.returncode,
+        'wall_ms_p50': float(np.percentile(wall_ms, 50)),
+        'wall_ms_max': float(np.max(wall_ms)),
+        'import_ms': sum(ms for _, ms in top_level),
+        'top_level_imports': [{'module': module, 'ms': ms} for module, ms in top_level],
+        'forbidden_imports': [module for module in forbidden if module in modules],
+    }
+
+
+def main():
+    """
+    Benchmark the import time of the entry point and the utils, and check that heavy dependencies
+    (torch, wandb, h5py) stay off the startup path.
+
+    Exits with status 1 when a forbidden module is imported or a scenario exceeds --budget_ms.
+
+    Usage: python -m tools.benchmark_startup --output startup.json
+    """
+    parser = argparse.ArgumentParser(description='Startup time benchmark')
+    parser.add_argument('--scenarios', type=str, nargs='+', default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument('--repeats', type=int, default=5, help='Runs per scenario')
+    parser.add_argument('--top', type=int, default=8, help='Number of slowest imports printed per scenario')
+    parser.add_argument('--budget_ms', type=float, default=None, help='Fail when the median wall time exceeds this')
+    parser.add_argument('--output', type=str, default=None, help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    results, failed = [], False
+    for name in args.scenarios:
+        result = run_scenario(name, args.repeats)
+        print(f'{name:>14}: {result["wall_ms_p50"]:.1f} ms wall (p50), {result["import_ms"]:.1f} ms imports')
+        for item in result['top_level_imports'][:args.top]:
+            print(f'{"":>16}{item["ms"]:8.1f} ms  {item["module"]}')
+        if result['returncode'] != 0:
+            print(f'{"":>16}exited with status {result["returncode"]}')
+            failed = True
+        if result['forbidden_imports']:
+            print(f'{"":>16}imports {", ".join(result["forbidden_imports"])} at startup')
+            failed = True
+        if args.budget_ms is not None and result['wall_ms_p50'] > args.budget_ms:
+            print(f'{"":>16}exceeds the budget of {args.budget_ms:.1f} ms')
+            failed = True
+        results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
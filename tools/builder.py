@@ -0,0 +1,104 @@
+import torch
+import argparse
+import torch.utils.data as data
+
+from typing import Any, Dict, Optional, Tuple
+from dataset.build import build_dataset_from_cfg
+from dataset.sampler import ResumableSampler
+from models.build import build_model_from_cfg
+from utils.dist_utils import get_dist_info
+from utils import profiling
+
+
+def dataset_builder(args: argparse.Namespace, config: Dict[str, Any], dataloader_config: Dict[str, Any],
+                    batch_size: int, shuffle: bool, drop_last: bool = False,
+                    dataset: Optional[data.Dataset] = None) -> Tuple[Optional[data.Sampler], data.DataLoader]:
+    """
+    Build a dataset with build_dataset_from_cfg and wrap it in a DataLoader.
+
+    The DataLoader options are read from dataloader_config (the ``dataloader`` section of the training config):
+    num_workers, persistent_workers, prefetch_factor and pin_memory. The last three only apply when they
+    can: with worker processes, and pin_memory only when a GPU is used and the dataset does not pin its
+    own batch buffers (BATCH.PIN). Datasets with ``set_prefetch_factor`` size their reusable batch
+    buffers for the prefetch_factor.
+
+    Samples are drawn by a DistributedSampler seeded with args.seed, so the order of every epoch is
+    deterministic and all ranks agree on the shuffle; in distributed runs every rank reads its own shard.
+    Call ``sampler.set_epoch`` every epoch. The sampler is wrapped in a ResumableSampler, so an
+    interrupted epoch can be resumed at its next batch. Iterable datasets shard themselves.
+
+    :param args: The arguments from the command line.
+    :param config: The dataset configuration.
+    :param dataloader_config: The DataLoader options.
+    :param batch_size: Samples per batch.
+    :param shuffle: Whether to shuffle the samples every epoch. Ignored for iterable datasets.
+    :param drop_last: Whether to drop the last incomplete batch.
+    :param dataset: Optional dataset built from config before, e.g. to try several DataLoader settings.
+    :return: The sampler (None for iterable datasets) and the DataLoader.
+    """
+    if dataset is None:
+        dataset = build_dataset_from_cfg(config)
+    num_workers = dataloader_config.get('num_workers', 0)
+
+    sampler = None
+    if not isinstance(dataset, data.IterableDataset):
+        rank, world_size = get_dist_info()
+        sampler = ResumableSampler(data.DistributedSampler(dataset, num_replicas=world_size, rank=rank, shuffle=shuffle,
+                                                           seed=args.seed, drop_last=drop_last))
+
+    loader_kwargs = {}
+    if num_workers > 0:
+        loader_kwargs['persistent_workers'] = dataloader_config.get('persistent_workers', True)
+        loader_kwargs['prefetch_factor'] = dataloader_config.get('prefetch_factor', 2)
+        if profiling.is_enabled():
+            loader_kwargs['worker_init_fn'] = profiling.worker_init
+    if hasattr(dataset, 'set_prefetch_factor'):
+        dataset.set_prefetch_factor(loader_kwargs.get('prefetch_factor', 0))
+    pin_memory = (dataloader_config.get('pin_memory', True) and args.use_gpu
+                  and not getattr(dataset, 'pin_batches', False))
+    dataloader = data.DataLoader(dataset,
+                                 batch_size=batch_size,
+                                 sampler=sampler,
+                                 num_workers=num_workers,
+                                 collate_fn=getattr(dataset, 'collate_fn', None),
+                                 pin_memory=pin_memory,
+                                 drop_last=drop_last,
+                                 **loader_kwargs)
+    return sampler, dataloader
+
+
+def model_builder(config: Dict[str, Any]) -> torch.nn.Module:
+    """
+    Build the model described by the ``model`` section of the training config.
+
+    :param config: The model configuration.
+    :return: The model.
+    """
+    return build_model_from_cfg(config)
+
+
+def build_opti_sche(base_model: torch.nn.Module, config: Dict[str, Any]) -> Tuple[torch.optim.Optimizer, Any]:
+    """
+    Build the optimizer and learning rate scheduler from the ``optimizer`` and ``scheduler`` sections
+    of the training config. The types name classes of torch.optim and torch.optim.lr_scheduler; CosLR
+    is a cosine schedule over kwargs.epochs epochs. The scheduler is stepped once per epoch.
+
+    :param base_model: The model to optimize.
+    :param config: The training configuration.
+    :return: The optimizer and the scheduler.
+    """
+    opti_config = config.optimizer
+    optimizer_class = getattr(torch.optim, opti_config.type, None)
+    if optimizer_class is None:
+        raise NotImplementedError(f'Unknown optimizer {opti_config.type}')
+    optimizer = optimizer_class(base_model.parameters(), **opti_config.kwargs)
+
+    sche_config = config.scheduler
+    if sche_config.type == 'CosLR':
+        scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=sche_config.kwargs.epochs)
+    else:
+        scheduler_class = getattr(torch.optim.lr_scheduler, sche_config.type, None)
+        if scheduler_class is None:
+            raise NotImplementedError(f'Unknown scheduler {sche_config.type}')
+        scheduler = scheduler_class(optimizer, **sche_config.kwargs)
+    return optimizer, scheduler
@@ -1,4 +1,262 @@
+import os
+import glob
+import json
+import torch
+import hashlib
+import argparse
+import numpy as np
+import torch.utils.data as data
 
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from utils.logger import print_log
+from utils.metrics import MetricsLogger
+from utils.checkpoint import CheckpointManager
+from utils.dist_utils import all_reduce_sum, get_dist_info
+from dataset.build import build_dataset_from_cfg
+from tools import builder
+from tools.model_trainer import autocast, get_device
+from models.chamfer import ChamferDistanceL1, ChamferDistanceL2
 
-def test():
-    pass
\ No newline at end of file
+
+# Per-sample evaluation metrics: name -> fn(outputs, points) returning a (B,) tensor, where outputs holds
+# the per-sample outputs of the model for the (B, N, 3) batch points.
+EVAL_METRICS: Dict[str, Callable[[Dict[str, torch.Tensor], torch.Tensor], torch.Tensor]] = {}
+# The model outputs every metric reads: name -> output keys.
+METRIC_OUTPUTS: Dict[str, Sequence[str]] = {}
+
+
+def register_metric(name: str, outputs: Sequence[str] = ('loss',)):
+    """
+    Decorator registering a per-sample evaluation metric, selected by name in evaluation.metrics.
+
+    :param name: The metric name.
+    :param outputs: The keys of the model outputs the metric reads.
+    """
+    def register(fn):
+        EVAL_METRICS[name] = fn
+        METRIC_OUTPUTS[name] = tuple(outputs)
+        return fn
+    return register
+
+
+def check_outputs(metric_names: List[str], outputs: Dict[str, torch.Tensor]) -> None:
+    """
+    Check that the model outputs hold everything the selected metrics read.
+
+    :param metric_names: The metric names.
+    :param outputs: The outputs of predict.
+    """
+    for name in metric_names:
+        missing = [key for key in METRIC_OUTPUTS[name] if key not in outputs]
+        if missing:
+            raise ValueError(f'Metric {name} needs the model outputs {missing}, but predict returned {sorted(outputs)}')
+
+
+@register_metric('loss')
+def loss_metric(outputs: Dict[str, torch.Tensor], points: torch.Tensor) -> torch.Tensor:
+    return outputs['loss']
+
+
+# Chamfer distances of the reconstruction to the input; KD-trees when scipy is installed.
+_CDL1 = ChamferDistanceL1(reduction='none', kdtree=True)
+_CDL2 = ChamferDistanceL2(reduction='none', kdtree=True)
+
+
+@register_metric('cdl1', outputs=('reconstruction',))
+def cdl1_metric(outputs: Dict[str, torch.Tensor], points: torch.Tensor) -> torch.Tensor:
+    return _CDL1(outputs['reconstruction'], points)
+
+
+@register_metric('cdl2', outputs=('reconstruction',))
+def cdl2_metric(outputs: Dict[str, torch.Tensor], points: torch.Tensor) -> torch.Tensor:
+    return _CDL2(outputs['reconstruction'], points)
+
+
+def predict(model: torch.nn.Module, points: torch.Tensor) -> Dict[str, torch.Tensor]:
+    """
+    Per-sample outputs of a model for a batch, from its ``predict(points)``: a dict of (B, ...) tensors with
+    the per-sample 'loss' and, for the Chamfer metrics, the (B, M, 3) 'reconstruction'. Evaluated models
+    must define predict, so a whole batch is evaluated in one forward pass.
+
+    :param model: The model, in eval mode.
+    :param points: (B, N, 3) point clouds.
+    :return: The outputs.
+    """
+    if not hasattr(model, 'predict'):
+        raise TypeError(f'{type(model).__name__} has no predict(points) method returning per-sample outputs, '
+                        f'which evaluation needs')
+    return model.predict(points)
+
+
+def config_hash(config: Dict[str, Any]) -> str:
+    """
+    sha1 of a configuration section, e.g. the dataset config of the evaluated split.
+    """
+    return hashlib.sha1(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def file_hash(path: str) -> str:
+    """
+    sha1 of the content of a file.
+    """
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+class EvalCache:
+    """
+    Per-sample evaluation results of one checkpoint on one dataset split: the model outputs
+    ('output/<key>') and metric values ('metric/<name>') of every evaluated sample, by dataset index.
+
+    Results are appended as chunk files with a unique name per rank, so ranks write concurrently
+    without coordination; a later chunk overrides the fields it contains.
+
+    :param directory: Directory of the cache, specific to the checkpoint and split.
+    :param rank: Rank of the process, part of the chunk names.
+    """
+    def __init__(self, directory: str, rank: int = 0) -> None:
+        self.directory = directory
+        self.rank = rank
+        self.records: Dict[int, Dict[str, np.ndarray]] = {}
+        os.makedirs(directory, exist_ok=True)
+        self._num_chunks = 0
+        for path in sorted(glob.glob(os.path.join(directory, 'chunk-*.npz')), key=os.path.getmtime):
+            with np.load(path) as chunk:
+                fields = [key for key in chunk.files if key != 'index']
+                columns = {key: chunk[key] for key in fields}
+                for i, idx in enumerate(chunk['index'].tolist()):
+                    self.records.setdefault(idx, {}).update({key: columns[key][i] for key in fields})
+
+    def has(self, idx: int, prefix: str) -> bool:
+        return any(key.startswith(prefix) for key in self.records.get(idx, {}))
+
+    def get(self, idxs: List[int], prefix: str) -> Dict[str, np.ndarray]:
+        """
+        Stack the fields with a prefix of several samples.
+
+        :param idxs: The dataset indices.
+        :param prefix: 'output/' or 'metric/'.
+        :return: (len(idxs), ...) arrays by field name without prefix.
+        """
+        keys = [key for key in self.records[idxs[0]] if key.startswith(prefix)]
+        return {key[len(prefix):]: np.stack([self.records[idx][key] for idx in idxs]) for key in keys}
+
+    def add(self, idxs: List[int], fields: Dict[str, np.ndarray]) -> None:
+        """
+        Store fields of several samples, in memory and as a new chunk file.
+
+        :param idxs: The dataset indices.
+        :param fields: (len(idxs), ...) arrays by full field name.
+        """
+        for i, idx in enumerate(idxs):
+            self.records.setdefault(idx, {}).update({key: value[i] for key, value in fields.items()})
+        path = os.path.join(self.directory, f'chunk-{os.getpid()}-{self.rank}-{self._num_chunks:06d}.npz')
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, index=np.asarray(idxs, dtype=np.int64), **fields)
+        os.replace(tmp_path, path)
+        self._num_chunks += 1
+
+
+def test(args: argparse.Namespace, config: Dict[str, Any], logger: Optional[str] = None,
+         metrics: Optional[MetricsLogger] = None) -> Dict[str, float]:
+    """
+    Evaluate a checkpoint on the test split.
+
+    The checkpoint is args.eval_at_ckpnt, or else the newest one of the experiment. The ``evaluation``
+    section sets batch_size, num_workers, the metrics (names of EVAL_METRICS) and cache. Every rank
+    evaluates its share of the samples under torch.inference_mode in DataLoader worker processes, and
+    the per-rank sums are merged with an all-reduce.
+
+    The model must define ``predict``, see predict.
+
+    With cache, per-sample outputs and metric values are stored in
+    ``eval_cache/<checkpoint sha1>/<split>-<dataset config sha1>`` in the experiment directory, so a
+    changed dataset config (e.g. npoint, SAMPLING, N_POINTS) is evaluated from scratch. Samples with cached values are not loaded again, and metrics added later
+    are computed from the cached outputs without forward passes. Such metrics do read the samples again,
+    so the split should be sampled deterministically (e.g. SAMPLING: fps, or npoint >= N_POINTS).
+
+    :param args: The arguments from the command line.
+    :param config: The training configuration.
+    :param logger: Optional logger name.
+    :param metrics: Optional MetricsLogger for the results.
+    :return: The mean of every metric over the split.
+    """
+    eval_config = config.get('evaluation', {})
+    metric_names = eval_config.get('metrics', ['loss'])
+    unknown = [name for name in metric_names if name not in EVAL_METRICS]
+    if unknown:
+        raise ValueError(f'Unknown evaluation metrics {unknown}, expected names of {list(EVAL_METRICS)}')
+    batch_size = eval_config.get('batch_size', 128)
+    precision = config.training.get('precision', 'bf16')
+    device = get_device(args, config)
+    rank, world_size = get_dist_info()
+
+    # model
+    checkpoint_path = args.eval_at_ckpnt or CheckpointManager(os.path.join(args.experiment_path, 'checkpoints'),
+                                                              rank=rank, logger=logger).latest()
+    if checkpoint_path is None:
+        raise FileNotFoundError('No checkpoint to evaluate, pass one with --eval_at_ckpnt')
+    state = torch.load(checkpoint_path, map_location='cpu', weights_only=False)
+    base_model = builder.model_builder(config.model)
+    base_model.load_state_dict(state.get('base_model', state))
+    base_model.to(device).eval()
+
+    # data: this rank's share of the samples, minus the ones with all metrics cached
+    dataset = build_dataset_from_cfg(config.dataset.test)
+    indices = list(range(rank, len(dataset), world_size))
+    cache = None
+    if eval_config.get('cache', True):
+        split = f'{config.dataset.test.subset}-{config_hash(config.dataset.test)[:16]}'
+        cache = EvalCache(os.path.join(args.experiment_path, 'eval_cache', file_hash(checkpoint_path), split),
+                          rank=rank)
+    todo = [idx for idx in indices
+            if cache is None or not all(f'metric/{name}' in cache.records.get(idx, {}) for name in metric_names)]
+    print_log(f'[TEST] Evaluating {checkpoint_path} on {len(dataset)} samples, {len(indices) - len(todo)} '
+              f'of this rank\'s {len(indices)} cached', logger=logger)
+
+    # Sums of the metrics over this rank's samples, and the number of samples.
+    totals = torch.zeros(len(metric_names) + 1, dtype=torch.float64)
+    todo_set = set(todo)
+    cached = [idx for idx in indices if idx not in todo_set]
+    if cached:
+        values = cache.get(cached, 'metric/')
+        totals[:-1] += torch.tensor([float(values[name].sum()) for name in metric_names], dtype=torch.float64)
+        totals[-1] += len(cached)
+
+    num_workers = eval_config.get('num_workers', config.get('dataloader', {}).get('num_workers', 0))
+    dataloader = data.DataLoader(dataset, batch_size=batch_size, sampler=todo, num_workers=num_workers,
+                                 collate_fn=getattr(dataset, 'collate_fn', None),
+                                 pin_memory=args.use_gpu)
+    with torch.inference_mode():
+        for batch, (_, _, points) in enumerate(dataloader):
+            idxs = todo[batch * batch_size:(batch + 1) * batch_size]
+            points = points.to(device, non_blocking=True)
+            fields = {}
+            if cache is not None and all(cache.has(idx, 'output/') for idx in idxs):
+                outputs = {key: torch.from_numpy(value).to(device) for key, value in cache.get(idxs, 'output/').items()}
+            else:
+                with autocast(device, precision):
+                    outputs = predict(base_model, points)
+                outputs = {key: value.float() for key, value in outputs.items()}
+                fields.update({f'output/{key}': value.cpu().numpy() for key, value in outputs.items()})
+            check_outputs(metric_names, outputs)
+
+            values = torch.stack([EVAL_METRICS[name](outputs, points).double().cpu() for name in metric_names], dim=1)
+            fields.update({f'metric/{name}': values[:, i].numpy() for i, name in enumerate(metric_names)})
+            totals[:-1] += values.sum(0)
+            totals[-1] += len(idxs)
+            if cache is not None:
+                cache.add(idxs, fields)
+
+    totals = all_reduce_sum(totals.to(device)).cpu()
+    results = {name: (totals[i] / max(totals[-1], 1)).item() for i, name in enumerate(metric_names)}
+    print_log(f'[TEST] {int(totals[-1])} samples: ' + ', '.join(f'{name} {value:.6f}' for name, value in results.items()),
+              logger=logger)
+    if metrics is not None:
+        metrics.log({f'test/{name}': value for name, value in results.items()}, step=state.get('step', 0))
+        metrics.close()
+    return results
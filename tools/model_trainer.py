@@ -1,7 +1,308 @@
+import os
+import time
+import torch
+import random
+import numpy as np
+import argparse
+import contextlib
 
+from typing import Any, Dict, Optional
+from utils.logger import print_log
+from utils import profiling
+from utils.metrics import MetricsLogger
+from utils.dist_utils import all_gather_object, all_reduce_sum, get_dist_info, wrap_ddp
+from utils.checkpoint import CheckpointManager, capture_rng_state, restore_rng_state
+from tools import builder
+from tools.autotune import autotune_dataloader
+from dataset.augmentation import build_augmentations
+from dataset.batching import DeviceTransfer
 
-def pre_train():
-    pass
 
-def fine_tune():
-    pass
\ No newline at end of file
+def get_device(args: argparse.Namespace, config: Dict[str, Any]) -> torch.device:
+    """
+    Get the device to run on: in distributed runs the GPU of the local rank, else the one set in the
+    ``device`` section of the config.
+
+    :param args: The arguments from the command line.
+    :param config: The training configuration.
+    :return: The device.
+    """
+    if args.use_gpu:
+        if getattr(args, 'distributed', False):
+            return torch.device('cuda', args.local_rank)
+        return torch.device('cuda', config.device.get('device_id', 0))
+    return torch.device('cpu')
+
+
+def autocast(device: torch.device, precision: str):
+    """
+    Autocast context for the forward pass. bf16 runs under autocast on CUDA and CPU alike, fp32 disables it.
+
+    :param device: The device of the model.
+    :param precision: bf16 or fp32.
+    :return: The autocast context manager.
+    """
+    return torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=precision == 'bf16')
+
+
+def validate(model: torch.nn.Module, dataloader, device: torch.device, precision: str) -> float:
+    """
+    Compute the mean loss over a dataset, over all ranks in distributed runs.
+
+    :param model: The model.
+    :param dataloader: The DataLoader of the validation split.
+    :param device: The device of the model.
+    :param precision: bf16 or fp32.
+    :return: The mean loss.
+    """
+    model.eval()
+    # Sum of the losses and number of samples.
+    totals = torch.zeros(2, device=device)
+    with torch.inference_mode():
+        for _, _, points in dataloader:
+            points = points.to(device, non_blocking=True)
+            with autocast(device, precision):
+                loss = model(points)
+            totals[0] += loss.float() * len(points)
+            totals[1] += len(points)
+    model.train()
+    total, count = all_reduce_sum(totals).tolist()
+    return total / max(count, 1)
+
+
+def run_net(args: argparse.Namespace, config: Dict[str, Any], logger: Optional[str] = None,
+            metrics: Optional[MetricsLogger] = None, finetune: bool = False) -> None:
+    """
+    Train the model described by the config.
+
+    The ``training`` section sets max_epoch, the per-process batch_size, grad_accumulation (batches per
+    optimizer step), grad_clip, precision (bf16 or fp32; bf16 autocast also runs on CPU), compile
+    (torch.compile) and val_freq (epochs between validations, 0 disables). The ``dataloader`` section
+    tunes the DataLoaders, see builder.dataset_builder. The AUGMENTATION list of the training split is
+    applied to every batch after it was moved to the device, see dataset.augmentation. Throughput is
+    logged every epoch as steps/sec (optimizer steps) and samples/sec, the latter summed over all ranks.
+
+    In distributed runs (see utils.dist_utils.init_dist) the model is wrapped in DistributedDataParallel,
+    tuned by the ``distributed`` section, and gradients are only synchronized on the last batch of each
+    accumulation window.
+
+    Checkpoints are written in the background to ``checkpoints`` in the experiment directory at the end
+    of every epoch and, with checkpoint.every_n_steps, every n optimizer steps (see CheckpointManager).
+    They hold the model, optimizer and scheduler states, the RNG and augmentation states of every rank and
+    the position in the epoch:
+    --resume_training continues from the newest one, --start_at_ckpnt from a given one, at the next batch.
+
+    With --autotune or autotune.enabled, num_workers, prefetch_factor and batch_size are first tuned by
+    timed DataLoader trials, see tools.autotune.
+
+    With --profile, the wait for batches, host-to-device copies, forward, backward and optimizer steps are
+    timed (see utils.profiling) and summarized every --profile_every steps; --profile_trace_steps also
+    records a Chrome trace to ``trace-rank{rank}.json`` in the experiment directory.
+
+    :param args: The arguments from the command line.
+    :param config: The training configuration.
+    :param logger: Optional logger name.
+    :param metrics: Optional MetricsLogger for per-step metrics.
+    :param finetune: Initialize the model from the weights in args.start_at_ckpnt.
+    """
+    if getattr(args, 'autotune', False) or config.get('autotune', {}).get('enabled', False):
+        autotune_dataloader(args, config, logger=logger)
+    train_config = config.training
+    checkpoint_config = config.get('checkpoint', {})
+    every_n_steps = checkpoint_config.get('every_n_steps', 0)
+    dataloader_config = config.get('dataloader', {})
+    accumulation = train_config.get('grad_accumulation', 1)
+    precision = train_config.get('precision', 'bf16')
+    val_freq = train_config.get('val_freq', 1)
+    device = get_device(args, config)
+    rank, world_size = get_dist_info()
+
+    # data
+    train_sampler, train_dataloader = builder.dataset_builder(args, config.dataset.train, dataloader_config,
+                                                  train_config.batch_size, shuffle=True, drop_last=True)
+    transfer = DeviceTransfer(device, pin=getattr(train_dataloader.dataset, 'pin_batches', False), logger=logger)
+    augment = build_augmentations(config.dataset.train.get('AUGMENTATION'), device=device,
+                                  seed=getattr(args, 'seed', 0) + rank)
+    if augment is not None:
+        print_log(f'[TRAIN] Augmenting batches with {augment}', logger=logger)
+    val_dataloader = None
+    if val_freq > 0 and config.dataset.get('val'):
+        _, val_dataloader = builder.dataset_builder(args, config.dataset.val, dataloader_config,
+                                                    train_config.batch_size, shuffle=False)
+
+    # model
+    base_model = builder.model_builder(config.model)
+    if finetune:
+        if not args.start_at_ckpnt:
+            raise ValueError('Fine-tuning needs the pretrained weights, pass them with --start_at_ckpnt')
+        state_dict = torch.load(args.start_at_ckpnt, map_location='cpu', weights_only=False)
+        missing, unexpected = base_model.load_state_dict(state_dict.get('base_model', state_dict), strict=False)
+        print_log(f'[TRAIN] Loaded pretrained weights from {args.start_at_ckpnt} '
+                  f'({len(missing)} missing, {len(unexpected)} unexpected keys)', logger=logger)
+    base_model.to(device)
+    model = base_model
+    if getattr(args, 'distributed', False):
+        model = wrap_ddp(base_model, args, config.get('distributed', {}))
+    if train_config.get('compile', False):
+        model = torch.compile(model)
+    optimizer, scheduler = builder.build_opti_sche(base_model, config)
+
+    # checkpoints
+    checkpoints = CheckpointManager(os.path.join(args.experiment_path, 'checkpoints'),
+                                    keep_last=checkpoint_config.get('keep_last', 3),
+                                    sharded=checkpoint_config.get('sharded', False), rank=rank,
+                                    world_size=world_size, logger=logger)
+
+    def rank_state(saved: Any) -> Any:
+        # The state of this rank: a single-file checkpoint holds the states of all ranks as a list by rank,
+        # a shard only its own. None when it is not there, e.g. after changing the number of processes.
+        if isinstance(saved, list):
+            return saved[rank] if len(saved) == world_size else None
+        return saved if checkpoints.sharded or rank == 0 else None
+
+    start_epoch, start_batch, global_step = 0, 0, 0
+    if args.resume_training or (args.start_at_ckpnt and not finetune):
+        state = checkpoints.load(None if args.resume_training else args.start_at_ckpnt)
+        base_model.load_state_dict(state['base_model'])
+        optimizer.load_state_dict(state['optimizer'])
+        scheduler.load_state_dict(state['scheduler'])
+        start_epoch, start_batch, global_step = state['epoch'], state['batch'], state['step']
+        rng_state = rank_state(state['rng'])
+        augment_state = rank_state(state.get('augment'))
+        # Without a saved state, streams distinct per rank and resume point.
+        seed = getattr(args, 'seed', 0) + rank + world_size * (global_step + 1)
+        if rng_state is not None:
+            restore_rng_state(rng_state)
+        else:
+            print_log(f'[TRAIN] No RNG state of rank {rank} in the checkpoint, seeding with {seed}', logger=logger)
+            random.seed(seed)
+            np.random.seed(seed)
+            torch.manual_seed(seed)
+        if augment is not None:
+            if augment_state is not None:
+                augment.load_state_dict(augment_state)
+            else:
+                augment.generator.manual_seed(seed)
+        print_log(f'[TRAIN] Resuming at epoch {start_epoch}, batch {start_batch}, step {global_step}', logger=logger)
+
+    def save_checkpoint(epoch: int, batch: int) -> None:
+        # (epoch, batch) is the position of the next batch to train on. The RNG and augmentation states
+        # differ per rank: a single-file checkpoint gathers them from all ranks.
+        rng_state = capture_rng_state()
+        augment_state = augment.state_dict() if augment is not None else None
+        if not checkpoints.sharded:
+            rng_state, augment_state = all_gather_object(rng_state), all_gather_object(augment_state)
+        checkpoints.save({'base_model': base_model.state_dict(), 'optimizer': optimizer.state_dict(),
+                          'scheduler': scheduler.state_dict(), 'rng': rng_state, 'augment': augment_state,
+                          'epoch': epoch, 'batch': batch, 'step': global_step}, epoch=epoch, step=global_step)
+
+    # profiling; on CUDA the stages synchronize, so asynchronous kernels are attributed to their stage
+    sync = torch.cuda.synchronize if device.type == 'cuda' else None
+    profile_every = getattr(args, 'profile_every', 100)
+    trace = None
+    if profiling.is_enabled() and getattr(args, 'profile_trace_steps', 0) > 0:
+        trace = profiling.trace_profiler(os.path.join(args.experiment_path, f'trace-rank{rank}.json'),
+                                         args.profile_trace_steps, cuda=device.type == 'cuda', logger=logger)
+        trace.start()
+
+    print_log(f'[TRAIN] {len(train_dataloader.dataset)} training samples, batch size {train_config.batch_size} '
+              f'x {accumulation} accumulation x {world_size} processes, {precision} on {device}', logger=logger)
+
+    model.train()
+    for epoch in range(start_epoch, train_config.max_epoch):
+        if hasattr(train_sampler, 'set_epoch'):
+            train_sampler.set_epoch(epoch)
+        if hasattr(train_dataloader.dataset, 'set_epoch'):
+            train_dataloader.dataset.set_epoch(epoch)
+        # Batches of this epoch that were trained on before the run was resumed.
+        # Iterable datasets cannot skip batches and restart the epoch.
+        skipped = start_batch if epoch == start_epoch and train_sampler is not None else 0
+        if train_sampler is not None and getattr(train_dataloader.dataset, 'prefetcher', None) is not None:
+            # The read-ahead of the dataset needs the order of the batches still to come.
+            train_dataloader.dataset.set_index_order(list(train_sampler)[skipped * train_config.batch_size:],
+                                                     train_config.batch_size)
+        if skipped:
+            train_sampler.skip(skipped * train_config.batch_size)
+        epoch_start = time.perf_counter()
+        num_batches = skipped + len(train_dataloader)
+        steps, samples, loss_sum = 0, 0, torch.zeros((), device=device)
+        optimizer.zero_grad(set_to_none=True)
+
+        for idx, (_, _, points) in enumerate(profiling.iterate('train.data_wait', train_dataloader), start=skipped):
+            with profiling.timer('train.to_device', sync):
+                points = transfer(points)
+            if augment is not None:
+                with profiling.timer('train.augment', sync):
+                    points = augment(points)
+            update = (idx + 1) % accumulation == 0 or idx + 1 == num_batches
+            # Skip the gradient all-reduce of DDP on batches that do not end an accumulation window.
+            sync_context = model.no_sync() if hasattr(model, 'no_sync') and not update else contextlib.nullcontext()
+            with sync_context:
+                with profiling.timer('train.forward', sync), autocast(device, precision):
+                    loss = model(points)
+                with profiling.timer('train.backward', sync):
+                    (loss / accumulation).backward()
+            loss_sum += loss.detach().float()
+            samples += len(points)
+            if trace is not None:
+                trace.step()
+
+            if update:
+                with profiling.timer('train.optimizer', sync):
+                    if train_config.get('grad_clip'):
+                        torch.nn.utils.clip_grad_norm_(base_model.parameters(), train_config.grad_clip)
+                    optimizer.step()
+                    optimizer.zero_grad(set_to_none=True)
+                steps += 1
+                global_step += 1
+                if metrics is not None:
+                    metrics.log({'train/loss': loss.detach(), 'train/lr': optimizer.param_groups[0]['lr']},
+                                step=global_step)
+                if every_n_steps and global_step % every_n_steps == 0 and idx + 1 < num_batches:
+                    save_checkpoint(epoch, idx + 1)
+                if profiling.is_enabled() and global_step % profile_every == 0:
+                    profiling.report(logger)
+        scheduler.step()
+
+        elapsed = time.perf_counter() - epoch_start
+        # Sum of the mean batch losses, number of batches and number of samples over all ranks.
+        totals = all_reduce_sum(torch.stack([loss_sum, torch.tensor(float(num_batches - skipped), device=device),
+                                             torch.tensor(float(samples), device=device)])).tolist()
+        epoch_loss, samples = totals[0] / max(totals[1], 1), int(totals[2])
+        print_log(f'[TRAIN] Epoch {epoch} loss {epoch_loss:.6f}, {steps / elapsed:.2f} steps/sec, '
+                  f'{samples / elapsed:.1f} samples/sec ({elapsed:.1f} s)', logger=logger)
+        if metrics is not None:
+            metrics.log({'epoch/loss': epoch_loss, 'epoch/steps_per_sec': steps / elapsed,
+                         'epoch/samples_per_sec': samples / elapsed}, step=global_step)
+            metrics.reduce(global_step)
+
+        if val_dataloader is not None and (epoch + 1) % val_freq == 0:
+            val_loss = validate(model, val_dataloader, device, precision)
+            print_log(f'[VALIDATION] Epoch {epoch} loss {val_loss:.6f}', logger=logger)
+            if metrics is not None:
+                metrics.log({'val/loss': val_loss}, step=global_step)
+                metrics.reduce(global_step)
+
+        save_checkpoint(epoch + 1, 0)
+
+    checkpoints.wait()
+    if trace is not None:
+        trace.stop()
+    if metrics is not None:
+        metrics.close()
+
+
+def pre_train(args: argparse.Namespace, config: Dict[str, Any], logger: Optional[str] = None,
+              metrics: Optional[MetricsLogger] = None) -> None:
+    """
+    Pre-train a model from scratch, see run_net.
+    """
+    run_net(args, config, logger=logger, metrics=metrics)
+
+
+def fine_tune(args: argparse.Namespace, config: Dict[str, Any], logger: Optional[str] = None,
+              metrics: Optional[MetricsLogger] = None) -> None:
+    """
+    Fine-tune a pre-trained model, loaded from args.start_at_ckpnt, see run_net.
+    """
+    run_net(args, config, logger=logger, metrics=metrics, finetune=True)
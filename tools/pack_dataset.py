@@ -0,0 +1,22 @@
+import argparse
+from dataset.packed import write_packed_dataset
+
+
+def main():
+    """
+    Pack a per-file dataset into float32 shards plus an offset index, for use with ``BACKEND: packed``.
+
+    Usage: python -m tools.pack_dataset --data_path <DATA_PATH> --out <DATA_PATH>/packed
+    """
+    parser = argparse.ArgumentParser(description='Pack a dataset into contiguous float32 shards')
+    parser.add_argument('--data_path', type=str, required=True, help='Dataset root containing the {subset}.txt files')
+    parser.add_argument('--out', type=str, required=True, help='Output directory for the shards and index files')
+    parser.add_argument('--subsets', type=str, nargs='+', default=['train', 'test'], help='Subsets to pack')
+    parser.add_argument('--shard_size_mb', type=int, default=1024, help='Approximate maximum size of a shard in MB')
+    args = parser.parse_args()
+
+    write_packed_dataset(args.data_path, args.out, subsets=args.subsets, shard_size_mb=args.shard_size_mb)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+import os
+import argparse
+from dataset.build import build_dataset_from_cfg
+from dataset.sampling import build_fps_cache
+from utils.config import cfg_from_yaml_file
+
+
+def main():
+    """
+    Precompute farthest point sampling orderings for a dataset subset, for use with ``SAMPLING: fps``.
+
+    Usage: python -m tools.precompute_fps --config cfgs/dataset_cfgs/part_net.yaml --subset train --num 2048
+    """
+    parser = argparse.ArgumentParser(description='Precompute FPS orderings of a dataset')
+    parser.add_argument('--config', type=str, required=True, help='Dataset YAML configuration file')
+    parser.add_argument('--subset', type=str, default='train', help='Subset to process (train, test, val)')
+    parser.add_argument('--num', type=int, required=True, help='Length of the stored orderings')
+    parser.add_argument('--whole', action='store_true', help='Include the test split, as with whole: True')
+    parser.add_argument('--cache_dir', type=str, default=None, help='Output directory. Defaults to FPS_CACHE')
+    parser.add_argument('--batch_size', type=int, default=32, help='Number of clouds per FPS call')
+    parser.add_argument('--device', type=str, default='cpu', help='Device to run FPS on')
+    args = parser.parse_args()
+
+    config = cfg_from_yaml_file(args.config)
+    config.subset = args.subset
+    config.npoint = args.num
+    config.whole = args.whole
+    config.SAMPLING = 'random'
+    config.CACHE = {}
+    dataset = build_dataset_from_cfg(config)
+
+    cache_dir = args.cache_dir or config.get('FPS_CACHE', os.path.join(config.DATA_PATH, 'fps'))
+    build_fps_cache(dataset, args.num, cache_dir, batch_size=args.batch_size, device=args.device)
+
+
+if __name__ == '__main__':
+    main()
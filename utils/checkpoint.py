@@ -0,0 +1,213 @@
+import os
+import re
+import copy
+import random
+import atexit
+import time
+import threading
+import torch
+import numpy as np
+
+from typing import Any, Dict, List, Optional
+from .logger import print_log
+
+
+CHECKPOINT_PATTERN = re.compile(r'^ckpt-e(\d+)-s(\d+)(?:-rank(\d+))?\.pth$')
+LATEST_FILE = 'latest'
+
+
+def to_cpu(obj: Any) -> Any:
+    """
+    Copy a (nested) state to CPU memory: tensors are copied, everything else is deep-copied, so later
+    training steps cannot change the copy.
+
+    :param obj: A state dict or any nesting of dicts, lists and tuples.
+    :return: The copy.
+    """
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return {key: to_cpu(val) for key, val in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(to_cpu(val) for val in obj)
+    return copy.deepcopy(obj)
+
+
+def capture_rng_state() -> Dict[str, Any]:
+    """
+    Capture the Python, NumPy, torch and CUDA random number generator states of the current process.
+    """
+    state = {'python': random.getstate(), 'numpy': np.random.get_state(), 'torch': torch.get_rng_state()}
+    if torch.cuda.is_available() and torch.cuda.is_initialized():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def restore_rng_state(state: Dict[str, Any]) -> None:
+    """
+    Restore random number generator states captured with capture_rng_state.
+    """
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+class CheckpointManager:
+    """
+    Saves training checkpoints without stalling the training loop.
+
+    :meth:`save` copies the state to CPU memory and returns; a background thread writes it with
+    ``torch.save`` to a temporary file that is renamed into place, so a crash never leaves a partial
+    checkpoint. At most one write is in flight: a save waits for the previous write first. The newest
+    ``keep_last`` checkpoints are kept, and the ``latest`` file names the newest one.
+
+    Only rank 0 writes, unless ``sharded`` is set: then every rank writes its own file
+    (``ckpt-e{epoch}-s{step}-rank{rank}.pth``) with its own state, e.g. its RNG state, and rank 0 only
+    advances ``latest`` once the shards of all ranks exist.
+
+    :param directory: Directory of the checkpoints.
+    :param keep_last: Number of checkpoints kept, 0 keeps all.
+    :param sharded: Whether every rank writes its own file.
+    :param rank: Rank of the process.
+    :param world_size: Number of processes, the shards of a sharded checkpoint.
+    :param shard_timeout: Seconds rank 0 waits for the shards of the other ranks before it gives up
+                          advancing ``latest`` for a checkpoint.
+    :param logger: Optional logger name.
+    """
+    def __init__(self, directory: str, keep_last: int = 3, sharded: bool = False, rank: int = 0,
+                 world_size: int = 1, shard_timeout: float = 600.0, logger: Optional[str] = None) -> None:
+        self.directory = directory
+        self.keep_last = keep_last
+        self.sharded = sharded
+        self.rank = rank
+        self.world_size = world_size
+        self.shard_timeout = shard_timeout
+        self.logger = logger
+        self._thread: Optional[threading.Thread] = None
+        self._error: Optional[BaseException] = None
+        os.makedirs(directory, exist_ok=True)
+        atexit.register(self.wait)
+
+    @property
+    def writes(self) -> bool:
+        return self.sharded or self.rank == 0
+
+    def _file_name(self, epoch: int, step: int) -> str:
+        suffix = f'-rank{self.rank}' if self.sharded else ''
+        return f'ckpt-e{epoch}-s{step}{suffix}.pth'
+
+    def _files(self, name: str) -> List[str]:
+        # Paths of all files of a checkpoint: one, or one shard per rank.
+        if not self.sharded:
+            return [os.path.join(self.directory, f'{name}.pth')]
+        return [os.path.join(self.directory, f'{name}-rank{rank}.pth') for rank in range(self.world_size)]
+
+    def _complete(self, name: str) -> bool:
+        return all(os.path.exists(path) for path in self._files(name))
+
+    def _wait_for_shards(self, name: str) -> bool:
+        # A file-system barrier: the writer thread must not join the collectives of the training loop.
+        deadline = time.monotonic() + self.shard_timeout
+        while not self._complete(name):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.1)
+        return True
+
+    def save(self, state: Dict[str, Any], epoch: int, step: int) -> None:
+        """
+        Snapshot a state to CPU memory and write it in the background.
+
+        :param state: The state, e.g. model, optimizer and scheduler state dicts and the sampler position.
+        :param epoch: The epoch, part of the file name.
+        :param step: The global step, part of the file name.
+        """
+        if not self.writes:
+            return
+        self.wait()
+        snapshot = to_cpu(state)
+        self._thread = threading.Thread(target=self._write, args=(snapshot, epoch, step), name='checkpoint')
+        self._thread.start()
+
+    def _write(self, snapshot: Dict[str, Any], epoch: int, step: int) -> None:
+        try:
+            name = self._file_name(epoch, step)
+            path = os.path.join(self.directory, name)
+            tmp_path = f'{path}.tmp'
+            torch.save(snapshot, tmp_path)
+            os.replace(tmp_path, path)
+            if self.rank == 0 and not self._wait_for_shards(f'ckpt-e{epoch}-s{step}'):
+                print_log(f'[CHECKPOINT] Not all shards of ckpt-e{epoch}-s{step} were written within '
+                          f'{self.shard_timeout:.0f} s, latest is not advanced', logger=self.logger)
+            elif self.rank == 0:
+                latest_tmp = os.path.join(self.directory, f'{LATEST_FILE}.tmp')
+                with open(latest_tmp, 'w') as f:
+                    f.write(f'ckpt-e{epoch}-s{step}\n')
+                os.replace(latest_tmp, os.path.join(self.directory, LATEST_FILE))
+            self._prune()
+            print_log(f'[CHECKPOINT] Saved {path}', logger=self.logger)
+        except BaseException as e:
+            self._error = e
+
+    def _checkpoints(self) -> List[str]:
+        # Own checkpoint files, oldest first.
+        own = []
+        for name in os.listdir(self.directory):
+            match = CHECKPOINT_PATTERN.match(name)
+            if match and (match.group(3) is None) != self.sharded and \
+                    (not self.sharded or int(match.group(3)) == self.rank):
+                own.append((int(match.group(2)), int(match.group(1)), name))
+        return [name for _, _, name in sorted(own)]
+
+    def _prune(self) -> None:
+        if self.keep_last <= 0:
+            return
+        for name in self._checkpoints()[:-self.keep_last]:
+            os.remove(os.path.join(self.directory, name))
+
+    def wait(self) -> None:
+        """
+        Wait for the write in flight, and raise its error if it failed.
+        """
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError('Writing the checkpoint failed') from error
+
+    def latest(self) -> Optional[str]:
+        """
+        Path of the newest checkpoint of this process, or None: the one named by ``latest`` when all its
+        files exist, else the newest checkpoint whose files (all shards, when sharded) all exist.
+        """
+        names = []
+        latest_path = os.path.join(self.directory, LATEST_FILE)
+        if os.path.exists(latest_path):
+            with open(latest_path, 'r') as f:
+                names.append(f.read().strip())
+        found = set()
+        for file_name in os.listdir(self.directory):
+            match = CHECKPOINT_PATTERN.match(file_name)
+            if match and (match.group(3) is None) != self.sharded:
+                found.add((int(match.group(2)), int(match.group(1))))
+        names.extend(f'ckpt-e{epoch}-s{step}' for step, epoch in sorted(found, reverse=True))
+        for name in names:
+            if self._complete(name):
+                return self._files(name)[self.rank if self.sharded else 0]
+        return None
+
+    def load(self, path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Load a checkpoint to CPU memory.
+
+        :param path: Path of the checkpoint. Defaults to the newest one in the directory.
+        :return: The saved state.
+        """
+        path = path or self.latest()
+        if path is None:
+            raise FileNotFoundError(f'No checkpoint found in {self.directory}')
+        print_log(f'[CHECKPOINT] Loading {path}', logger=self.logger)
+        return torch.load(path, map_location='cpu', weights_only=False)
@@ -1,10 +1,22 @@
 import yaml
 import os
+import fcntl
+import pickle
+import hashlib
 import argparse
 
 from easydict import EasyDict
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Tuple
 from .logger import print_log
+from .misc import user_cache_dir
+
+
+# Use the libyaml C loader when PyYAML was built with it, it parses several times faster.
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+# Compiled configs are cached here, see compile_config. Override with the CONFIG_CACHE_DIR environment variable.
+CONFIG_CACHE_DIR = os.environ.get('CONFIG_CACHE_DIR', user_cache_dir('configs'))
+# Bump when the resolution semantics change, to invalidate existing snapshots.
+_SNAPSHOT_VERSION = 2
 
 
 def log_args_to_file(args: argparse.Namespace, pre: str='args', logger: Optional[str]=None) -> None:
@@ -36,34 +48,158 @@ def log_config_to_file(cfg: Dict, pre: str='cfg', logger: Optional[str]=None) ->
 
 def merge_new_config(cfg: Dict, new_cfg: Dict) -> Dict:
     """
-    Merges a new configuration dictionary into an existing one.
+    Deep-merges a new configuration dictionary into an existing one. Nested dictionaries are merged
+    key by key, any other value of new_cfg replaces the existing one. The files named by a ``_base_``
+    key (a path or a list of paths) are merged in first, so the other keys of new_cfg override them.
     
     :param cfg: Existing configuration dictionary.
     :param new_cfg: New configuration dictionary.
     :return: Merged configuration dictionary.
     """
+    if '_base_' in new_cfg:
+        bases = new_cfg['_base_']
+        for base in [bases] if isinstance(bases, str) else bases:
+            merge_new_config(cfg, _resolve_config(base, [], []))
     for key, val in new_cfg.items():
         if key == '_base_':
-            with open(new_cfg['_base_'], 'r') as f:
-                val = yaml.safe_load(f)
-                cfg[key] = EasyDict()
-                merge_new_config(cfg[key], val)
+            continue
+        if isinstance(val, dict) and isinstance(cfg.get(key), dict):
+            merge_new_config(cfg[key], val)
         else:
-                cfg[key] = val
+            cfg[key] = val
+    return cfg
+
+
+def _load_yaml(path: str) -> Tuple[Dict, bytes]:
+    """
+    Parses a YAML file with the C loader of libyaml when available.
+
+    :param path: Path of the YAML file.
+    :return: The parsed dictionary and the raw file content.
+    """
+    with open(path, 'rb') as f:
+        content = f.read()
+    return yaml.load(content, Loader=_YAML_LOADER) or {}, content
+
+
+def _expand_bases(node: Dict, chain: List[str], parent: str, files: List[Tuple[str, str]]) -> EasyDict:
+    """
+    Resolves the ``_base_`` keys of a parsed YAML node, at any depth: a nested section such as
+    ``train: {_base_: dataset.yaml, subset: train}`` becomes the base file with the section's keys merged over it.
+
+    :param node: The parsed node.
+    :param chain: The files currently being resolved, to detect cycles.
+    :param parent: Path of the file the node was read from.
+    :param files: Receives the (path, sha1) of every file that is read.
+    :return: The resolved node.
+    """
+    cfg = EasyDict()
+    bases = node.get('_base_', [])
+    for base in [bases] if isinstance(bases, str) else bases:
+        merge_new_config(cfg, _resolve_config(base, chain, files, parent=parent))
+    for key, val in node.items():
+        if key == '_base_':
+            continue
+        merge_new_config(cfg, {key: _expand_bases(val, chain, parent, files) if isinstance(val, dict) else val})
     return cfg
 
-def cfg_from_yaml_file(cfg_file: str) -> EasyDict:
+
+def _resolve_config(cfg_file: str, chain: List[str], files: List[Tuple[str, str]], parent: Optional[str]=None) -> EasyDict:
+    """
+    Loads a YAML file and recursively merges its ``_base_`` files into it.
+
+    Base paths are taken relative to the working directory, or else relative to the including file.
+
+    :param cfg_file: Path of the YAML file.
+    :param chain: The files currently being resolved, to detect cycles.
+    :param files: Receives the (path, sha1) of every file that is read.
+    :param parent: Path of the including file, if any.
+    :return: The resolved configuration.
+    """
+    if parent is not None and not os.path.exists(cfg_file):
+        cfg_file = os.path.join(os.path.dirname(parent), cfg_file)
+    cfg_file = os.path.abspath(cfg_file)
+    if cfg_file in chain:
+        raise ValueError(f'Circular _base_ chain: {" -> ".join(chain + [cfg_file])}')
+
+    new_cfg, content = _load_yaml(cfg_file)
+    files.append((cfg_file, hashlib.sha1(content).hexdigest()))
+    return _expand_bases(new_cfg, chain + [cfg_file], cfg_file, files)
+
+
+def _snapshot_is_valid(files: List[Tuple[str, str]]) -> bool:
+    # Hashing the files is much cheaper than parsing them.
+    for path, digest in files:
+        try:
+            with open(path, 'rb') as f:
+                if hashlib.sha1(f.read()).hexdigest() != digest:
+                    return False
+        except OSError:
+            return False
+    return True
+
+
+def compile_config(cfg_file: str, cache_dir: Optional[str]=CONFIG_CACHE_DIR, logger: Optional[str]=None) -> EasyDict:
+    """
+    Loads a YAML configuration with its ``_base_`` chain resolved, through a compiled snapshot cache.
+
+    The resolved configuration is pickled in cache_dir (by default in the user cache directory, so
+    no snapshot ends up in the repository) together with the content hash of every file
+    in its chain. Later loads, e.g. by the other ranks of a launch, only hash the files and unpickle
+    the snapshot. A file lock makes concurrent launches wait for the first one to compile. Snapshots
+    are keyed by the path of cfg_file and the working directory, which ``_base_`` paths are resolved against.
+
+    :param cfg_file: Path to the YAML configuration file.
+    :param cache_dir: Directory of the snapshots, or None to always parse the files.
+    :param logger: Optional logger name.
+    :return: Configuration as an EasyDict.
+    """
+    if cache_dir is None:
+        return _resolve_config(cfg_file, [], [])
+
+    key = f'{_SNAPSHOT_VERSION}:{os.path.abspath(cfg_file)}:{os.getcwd()}'
+    key = hashlib.sha1(key.encode()).hexdigest()[:16]
+    snapshot_path = os.path.join(cache_dir, f'{os.path.basename(cfg_file)}-{key}.pkl')
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        lock = open(f'{snapshot_path}.lock', 'a')
+    except OSError as e:
+        print_log(f'Config cache {cache_dir} is not writable ({e}), parsing {cfg_file}', logger=logger)
+        return _resolve_config(cfg_file, [], [])
+
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(snapshot_path, 'rb') as f:
+                snapshot = pickle.load(f)
+            if _snapshot_is_valid(snapshot['files']):
+                return EasyDict(snapshot['cfg'])
+        except (OSError, pickle.UnpicklingError, EOFError, KeyError):
+            pass
+
+        files = []
+        cfg = _resolve_config(cfg_file, [], files)
+        tmp_path = f'{snapshot_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'files': files, 'cfg': cfg}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, snapshot_path)
+        print_log(f'Compiled config {cfg_file} ({len(files)} files) to {snapshot_path}', logger=logger)
+        return cfg
+    finally:
+        # Closing the file releases the lock.
+        lock.close()
+
+
+def cfg_from_yaml_file(cfg_file: str, cache_dir: Optional[str]=CONFIG_CACHE_DIR, logger: Optional[str]=None) -> EasyDict:
     """
-    Loads and returns a configuration from a YAML file.
+    Loads and returns a configuration from a YAML file, with its ``_base_`` chain resolved.
     
     :param cfg_file: Path to the YAML configuration file.
+    :param cache_dir: Directory of the compiled snapshots, or None to disable the cache (see compile_config).
+    :param logger: Optional logger name.
     :return: Configuration as an EasyDict.
     """
-    cfg = EasyDict()
-    with open(cfg_file, 'r') as f:
-        new_cfg = yaml.safe_load(f)
-        merge_new_config(cfg, new_cfg)
-    return cfg
+    return compile_config(cfg_file, cache_dir=cache_dir, logger=logger)
 
 def get_cfg(args: argparse.Namespace, logger: Optional[str]=None) -> EasyDict:
     """
@@ -80,7 +216,7 @@ def get_cfg(args: argparse.Namespace, logger: Optional[str]=None) -> EasyDict:
             raise FileNotFoundError(f'Config file not found: {cfg_path}')
         print_log(f'Resume yaml from {cfg_path}', logger=logger)
         args.config = cfg_path
-    cfg = cfg_from_yaml_file(args.config)
+    cfg = compile_config(args.config, logger=logger)
     if not args.resume_training and args.local_rank == 0:
         save_experiment_config(args, logger)
     return cfg
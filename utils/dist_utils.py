@@ -0,0 +1,111 @@
+import os
+import torch
+import argparse
+import torch.distributed as dist
+
+from typing import Any, Dict, List, Tuple
+
+
+def init_dist(args: argparse.Namespace, backend: str = 'auto') -> None:
+    """
+    Initialize the default process group from torchrun-style environment variables (RANK, WORLD_SIZE,
+    LOCAL_RANK, MASTER_ADDR, MASTER_PORT). Runs without WORLD_SIZE, or with WORLD_SIZE 1, stay
+    single-process.
+
+    Sets args.distributed, args.rank, args.world_size and args.local_rank.
+
+    :param args: The arguments from the command line.
+    :param backend: The process group backend: nccl, gloo, or auto for nccl when CUDA is available and gloo otherwise.
+    """
+    args.world_size = int(os.environ.get('WORLD_SIZE', 1))
+    args.rank = int(os.environ.get('RANK', 0))
+    args.local_rank = int(os.environ.get('LOCAL_RANK', args.local_rank))
+    args.distributed = args.world_size > 1
+    if not args.distributed:
+        return
+
+    if backend == 'auto':
+        backend = 'nccl' if torch.cuda.is_available() else 'gloo'
+    if backend == 'nccl':
+        torch.cuda.set_device(args.local_rank)
+    dist.init_process_group(backend=backend)
+
+
+def get_dist_info() -> Tuple[int, int]:
+    """
+    Get the rank and world size of the current process, (0, 1) when not distributed.
+    """
+    if dist.is_available() and dist.is_initialized():
+        return dist.get_rank(), dist.get_world_size()
+    return 0, 1
+
+
+def all_reduce_sum(tensor: torch.Tensor) -> torch.Tensor:
+    """
+    Sum a tensor over all processes, in place. A no-op when not distributed.
+
+    :param tensor: The tensor.
+    :return: The summed tensor.
+    """
+    if dist.is_available() and dist.is_initialized():
+        dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor
+
+
+def broadcast_object(obj: Any, src: int = 0) -> Any:
+    """
+    Send a picklable object from one process to all others. A no-op when not distributed.
+
+    :param obj: The object, only used on the source rank.
+    :param src: The source rank.
+    :return: The object of the source rank.
+    """
+    if dist.is_available() and dist.is_initialized():
+        objects = [obj]
+        dist.broadcast_object_list(objects, src=src)
+        return objects[0]
+    return obj
+
+
+def all_gather_object(obj: Any) -> List[Any]:
+    """
+    Gather a picklable object from every process. Without distribution, a list of the object only.
+
+    :param obj: The object of this process.
+    :return: The objects of all processes, by rank.
+    """
+    if dist.is_available() and dist.is_initialized():
+        objects = [None] * dist.get_world_size()
+        dist.all_gather_object(objects, obj)
+        return objects
+    return [obj]
+
+
+def wrap_ddp(model: torch.nn.Module, args: argparse.Namespace, config: Dict[str, Any]) -> torch.nn.Module:
+    """
+    Wrap a model in DistributedDataParallel, tuned by the ``distributed`` section of the config:
+    bucket_cap_mb (gradient bucket size), gradient_as_bucket_view (gradients alias the buckets, saving
+    a copy), static_graph, find_unused_parameters and broadcast_buffers.
+
+    :param model: The model, already on its device.
+    :param args: The arguments from the command line.
+    :param config: The ``distributed`` section of the training config.
+    :return: The wrapped model.
+    """
+    device_ids = [args.local_rank] if next(model.parameters()).is_cuda else None
+    return torch.nn.parallel.DistributedDataParallel(
+        model,
+        device_ids=device_ids,
+        bucket_cap_mb=config.get('bucket_cap_mb', 25),
+        gradient_as_bucket_view=config.get('gradient_as_bucket_view', True),
+        static_graph=config.get('static_graph', False),
+        find_unused_parameters=config.get('find_unused_parameters', False),
+        broadcast_buffers=config.get('broadcast_buffers', True))
+
+
+def destroy_dist() -> None:
+    """
+    Tear down the default process group, if there is one.
+    """
+    if dist.is_available() and dist.is_initialized():
+        dist.destroy_process_group()
@@ -1,22 +1,56 @@
+import sys
+import time
+import queue
+import atexit
 import logging
-import torch.distributed as dist
+import threading
+import logging.handlers
 from typing import Optional, Union
 
 
 logger_initialized: dict[str, bool] = {}
+# Loggers resolved by name in print_log, so hot paths skip get_logger.
+_logger_cache: dict[str, logging.Logger] = {}
+# Listeners of queue-backed loggers; they write the records on a background thread.
+_queue_listeners: list[logging.handlers.QueueListener] = []
+# Per-key state for rate limited messages: [calls, time of the last emitted message, suppressed since then].
+_rate_limits: dict[str, list] = {}
+_rate_limits_lock = threading.Lock()
+
+def _get_rank() -> int:
+    """
+    Get the rank of the current process, or 0 if torch.distributed is not initialized.
+
+    torch is only imported by the modules that need it; if it is not loaded yet, no process group
+    can be initialized either, so the logger does not import it.
 
-def get_logger(name: str, log_file: Optional[str]=None, log_level: int=logging.INFO, file_mode: str='w') -> logging.Logger:
+    Returns:
+        int: The rank.
+    """
+    if 'torch' not in sys.modules:
+        return 0
+    import torch.distributed as dist
+    return dist.get_rank() if dist.is_available() and dist.is_initialized() else 0
+
+
+def get_logger(name: str, log_file: Optional[str]=None, log_level: int=logging.INFO, file_mode: str='w',
+               use_queue: bool=False) -> logging.Logger:
     """
     Initialize and get a logger with the given name.
 
     If a logger with the specified name has already been initialized,
     it returns the existing logger. Otherwise, it creates a new one.
+
+    With use_queue, the logger only puts records on a queue and a background listener thread writes
+    them to the stream and file, so logging never blocks the caller on I/O. Call flush_logs() to wait
+    until everything queued so far is written; shutdown_logging() runs at exit.
     
     Args:
         name (str): Name of the logger.
         log_file (Optional[str]): Path to the log file. If None, no file logging is done.
         log_level (int): Logging level.
         file_mode (str): File mode for the log file ('w' for write, 'a' for append, etc.).
+        use_queue (bool): Write the records on a background thread.
 
     Returns:
         logging.Logger: The initialized logger object.
@@ -39,7 +73,7 @@ def get_logger(name: str, log_file: Optional[str]=None, log_level: int=logging.I
     handlers = [stream_handler]
 
     # Determine the rank in a distributed setting; defaults to 0 if not available or initialized.
-    rank = dist.get_rank() if dist.is_available() and dist.is_initialized() else 0
+    rank = _get_rank()
 
     # File logging is only enabled for rank 0 in a distributed setting.
     if rank == 0 and log_file:
@@ -52,15 +86,25 @@ def get_logger(name: str, log_file: Optional[str]=None, log_level: int=logging.I
     for handler in handlers:
         handler.setFormatter(formatter)
         handler.setLevel(log_level)
-        logger.addHandler(handler)
-
-    logger.setLevel(log_level if rank == 0 else logging.error)
+        if not use_queue:
+            logger.addHandler(handler)
+
+    if use_queue:
+        # The caller only enqueues the record; the listener thread formats and writes it.
+        record_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(record_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        _queue_listeners.append(listener)
+        logger.addHandler(logging.handlers.QueueHandler(record_queue))
+
+    logger.setLevel(log_level if rank == 0 else logging.ERROR)
     logger_initialized[name] = True
 
     return logger
 
 
-def get_root_logger(log_file: Optional[str]=None, log_level: int=logging.INFO, name: str='main') -> logging.Logger:
+def get_root_logger(log_file: Optional[str]=None, log_level: int=logging.INFO, name: str='main',
+                    use_queue: bool=False) -> logging.Logger:
     """
     Get a root logger with an optional file handler.
 
@@ -70,23 +114,81 @@ def get_root_logger(log_file: Optional[str]=None, log_level: int=logging.INFO, n
         log_file (Optional[str]): Path to the log file. If None, no file logging is done.
         log_level (int): Logging level.
         name (str): Name of the logger, defaults to 'main'.
+        use_queue (bool): Write the records on a background thread, see get_logger.
 
     Returns:
         logging.Logger: The initialized root logger object.
     """
-    logger = get_logger(name, log_file, log_level)
+    logger = get_logger(name, log_file, log_level, use_queue=use_queue)
     logging_filter = logging.Filter(name)
     logger.addFilter(logging_filter)
 
     return logger
 
-def print_log(msg: str, logger: Union[None, str]=None, level: int=logging.INFO):
+
+def flush_logs() -> None:
+    """
+    Wait until all records queued by queue-backed loggers are written, and flush their handlers.
+    """
+    for listener in _queue_listeners:
+        # Stopping drains the queue and joins the thread; the listener is restarted right away.
+        listener.stop()
+        for handler in listener.handlers:
+            handler.flush()
+        listener.start()
+
+
+def shutdown_logging() -> None:
+    """
+    Write all queued records and stop the listener threads. Registered to run at exit.
+    """
+    while _queue_listeners:
+        listener = _queue_listeners.pop()
+        listener.stop()
+        for handler in listener.handlers:
+            handler.flush()
+
+
+atexit.register(shutdown_logging)
+
+
+def _rate_limited(key: str, every_n: Optional[int], interval: Optional[float]) -> tuple[bool, int]:
+    """
+    Decide whether a rate limited message is emitted.
+
+    Args:
+        key (str): Key identifying the message.
+        every_n (Optional[int]): Emit only every n-th call.
+        interval (Optional[float]): Emit at most once per this many seconds.
+
+    Returns:
+        tuple[bool, int]: Whether to emit the message, and how many calls were suppressed since the last one.
+    """
+    with _rate_limits_lock:
+        state = _rate_limits.get(key)
+        if state is None:
+            state = _rate_limits[key] = [0, float('-inf'), 0]
+        state[0] += 1
+        if (every_n is not None and (state[0] - 1) % every_n != 0) or \
+                (interval is not None and time.monotonic() - state[1] < interval):
+            state[2] += 1
+            return False, 0
+        suppressed, state[1], state[2] = state[2], time.monotonic(), 0
+        return True, suppressed
+
+
+def print_log(msg: str, logger: Union[None, str]=None, level: int=logging.INFO, key: Optional[str]=None,
+              every_n: Optional[int]=None, interval: Optional[float]=None):
     """
     Print a log message either to the console, to a specified logger, or silently.
 
     This function provides a flexible way of logging messages. It can print to the console, use a given logger,
     or silently ignore the message based on the `logger` argument.
 
+    Messages logged from hot paths can be rate limited per key: with every_n only every n-th call is
+    logged (sampling), with interval at most one message per interval seconds. An emitted message
+    reports how many calls with its key were suppressed before it.
+
     Args:
         msg (str): The message to log.
         logger (Union[None, str]): Specifies the logging behavior. It can be:
@@ -95,10 +197,19 @@ def print_log(msg: str, logger: Union[None, str]=None, level: int=logging.INFO):
             - 'silent': does nothing (silently ignores the message).
             - A string: assumes it's the name of a logger to fetch and use for logging.
         level (int): The logging level for the message (e.g., logging.INFO, logging.ERROR, etc.).
+        key (Optional[str]): Rate limiting key, e.g. 'train/step'. Required for every_n and interval.
+        every_n (Optional[int]): Log only every n-th message with this key.
+        interval (Optional[float]): Log at most one message with this key per this many seconds.
 
     Raises:
         TypeError: If the `logger` argument is not one of the expected types.
     """
+    if key is not None:
+        emit, suppressed = _rate_limited(key, every_n, interval)
+        if not emit:
+            return
+        if suppressed:
+            msg = f'{msg} ({suppressed} similar messages suppressed)'
 
     if logger is None:
         # Print the message to the console if no logger is specified.
@@ -111,7 +222,9 @@ def print_log(msg: str, logger: Union[None, str]=None, level: int=logging.INFO):
         pass
     elif isinstance(logger, str):
         # If a string is provided, treat it as the name of a logger to fetch and use.
-        _logger = get_logger(logger)
+        _logger = _logger_cache.get(logger)
+        if _logger is None:
+            _logger = _logger_cache[logger] = get_logger(logger)
         _logger.log(level=level, msg=msg)
     else:
         # Raise an error if the `logger` argument is not one of the expected types.
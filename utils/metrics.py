@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import queue
+import atexit
+import threading
+import torch
+import torch.distributed as dist
+
+from typing import Any, Dict, List, Optional, Union
+from .logger import print_log
+
+
+Scalar = Union[torch.Tensor, float, int]
+
+
+def get_rank() -> int:
+    """
+    Get the rank of the current process, from the process group or else the RANK environment variable.
+    """
+    if dist.is_available() and dist.is_initialized():
+        return dist.get_rank()
+    return int(os.environ.get('RANK', 0))
+
+
+class JSONLSink:
+    """
+    Append-only metrics file with one JSON record per line.
+
+    :param path: Path of the .jsonl file.
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._file = open(path, 'a')
+
+    def write(self, step: int, metrics: Dict[str, float]) -> None:
+        self._file.write(json.dumps({'step': step, 'time': time.time(), **metrics}) + '\n')
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class WandbSink:
+    """
+    Publishes metrics to a Weights and Biases run.
+
+    :param run: The run returned by wandb.init.
+    """
+    def __init__(self, run) -> None:
+        self.run = run
+
+    def write(self, step: int, metrics: Dict[str, float]) -> None:
+        self.run.log(metrics, step=step)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class MetricsLogger:
+    """
+    Asynchronous logger for per-step training metrics.
+
+    :meth:`log` only adds the values to running sums, on the device they live on, so it never waits
+    for the device. Every ``reduce_every`` steps the sums are stacked and copied to the host without
+    blocking, and a background thread waits for the copy, averages the values and writes them to the
+    sinks. Only rank 0 publishes; on other ranks :meth:`log` does nothing.
+
+    :param sinks: Where the averaged metrics are written, e.g. a JSONLSink and a WandbSink.
+    :param reduce_every: Number of steps averaged into one record.
+    :param rank: Rank of the process. Defaults to get_rank().
+    :param logger: Optional logger name.
+    """
+    def __init__(self, sinks: List[Any], reduce_every: int = 50, rank: Optional[int] = None,
+                 logger: Optional[str] = None) -> None:
+        self.sinks = sinks
+        self.reduce_every = reduce_every
+        self.rank = get_rank() if rank is None else rank
+        self.logger = logger
+
+        self._sums: Dict[str, Scalar] = {}
+        self._counts: Dict[str, int] = {}
+        self._steps = 0
+        self._step = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = None
+        self._closed = False
+        if self.rank == 0:
+            self._thread = threading.Thread(target=self._publish_loop, name='metrics', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def log(self, metrics: Dict[str, Scalar], step: int) -> None:
+        """
+        Accumulate the metrics of one step. Tensors are detached and summed on their device.
+
+        :param metrics: Scalar values, as 0-dim tensors or Python numbers.
+        :param step: The global step, used as the step of the record that completes here.
+        """
+        if self.rank != 0:
+            return
+        for name, value in metrics.items():
+            if isinstance(value, torch.Tensor):
+                value = value.detach()
+            self._sums[name] = self._sums[name] + value if name in self._sums else value
+            self._counts[name] = self._counts.get(name, 0) + 1
+        self._steps += 1
+        self._step = step
+        if self._steps >= self.reduce_every:
+            self.reduce(step)
+
+    def reduce(self, step: int) -> None:
+        """
+        Hand the accumulated sums to the background thread as one record, without waiting for the device.
+
+        :param step: The step of the record.
+        """
+        if self.rank != 0 or not self._sums:
+            return
+        names = list(self._sums)
+        tensors = {name: self._sums[name] for name in names if isinstance(self._sums[name], torch.Tensor)}
+        numbers = {name: float(self._sums[name]) for name in names if name not in tensors}
+
+        host, event = None, None
+        if tensors:
+            stacked = torch.stack([tensor.float().reshape(()) for tensor in tensors.values()])
+            if stacked.is_cuda:
+                # Copy into pinned memory asynchronously; the background thread waits for the event.
+                host = torch.empty(stacked.shape, dtype=stacked.dtype, pin_memory=True)
+                host.copy_(stacked, non_blocking=True)
+                event = torch.cuda.Event()
+                event.record()
+            else:
+                host = stacked
+
+        self._queue.put((step, list(tensors), host, event, numbers, dict(self._counts)))
+        self._sums, self._counts, self._steps = {}, {}, 0
+
+    def _publish_loop(self) -> None:
+        while True:
+            record = self._queue.get()
+            try:
+                if record is None:
+                    return
+                step, tensor_names, host, event, numbers, counts = record
+                if event is not None:
+                    event.synchronize()
+                sums = {**dict(zip(tensor_names, host.tolist() if host is not None else [])), **numbers}
+                metrics = {name: total / counts[name] for name, total in sums.items()}
+                for sink in self.sinks:
+                    try:
+                        sink.write(step, metrics)
+                    except Exception as e:
+                        print_log(f'[METRICS] {type(sink).__name__} failed: {e}', logger=self.logger)
+            finally:
+                self._queue.task_done()
+
+    def flush(self) -> None:
+        """
+        Wait until all reduced records are written, and flush the sinks. Values accumulated since the
+        last reduction stay pending; call :meth:`reduce` first to include them.
+        """
+        if self._thread is None:
+            return
+        self._queue.join()
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self) -> None:
+        """
+        Publish the pending values, stop the background thread and close the sinks.
+        """
+        if self._thread is None or self._closed:
+            return
+        self._closed = True
+        self.reduce(self._step)
+        self._queue.put(None)
+        self._thread.join()
+        for sink in self.sinks:
+            sink.flush()
+            sink.close()
@@ -1,11 +1,23 @@
 
-import wandb
-import torch
+import os
 import random
+import logging
 import argparse
-import numpy as np
 
-from typing import Dict, Union
+from typing import Dict, List, Optional, Union
+from .logger import print_log
+
+
+def user_cache_dir(name: str) -> str:
+    """
+    Directory for caches of this project in the user cache directory ($XDG_CACHE_HOME or ~/.cache),
+    for derived files that belong neither in the repository nor next to shared data.
+
+    :param name: Name of the cache, e.g. 'configs'.
+    :return: The path; it is not created.
+    """
+    root = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(root, 'deep-learning-template', name)
 
 
 def set_random_seed(logger: str, seed: int=42, deterministic=False) -> None:
@@ -15,6 +27,9 @@ def set_random_seed(logger: str, seed: int=42, deterministic=False) -> None:
     :param seed: The seed to be used.
     :param deterministic: Whether to set the deterministic option for CUDNN backend.
     """
+    import torch
+    import numpy as np
+
     random.seed(seed)
     np.random.seed(seed)
     torch.manual_seed(seed)
@@ -25,15 +40,97 @@ def set_random_seed(logger: str, seed: int=42, deterministic=False) -> None:
         logger.info(f'Random seed set to: {seed},'
                     f'Deterministic: {deterministic}')
     
-def initialize_wandb(args: argparse.Namespace, config: Dict[str, Union[int, float, str]], project_name: str) -> None:
+def initialize_wandb(args: argparse.Namespace, config: Dict[str, Union[int, float, str]], project_name: str):
     """
     Initialize Weights and Biases for logging and experiment tracking. 
 
     :param args: The arguments from the command line. 
     :param config: The configuration dictionary for the experiment.
     :param project_name: The name of the project on wandb.
+    :return: The wandb run.
     """
-    wandb.init(project=project_name,
+    # Imported here, so runs without tracking never load wandb.
+    import wandb
+    return wandb.init(project=project_name,
         name=args.exp_name,
         config={**vars(args), **config},
         dir=args.experiment_path)
+
+
+def initialize_metrics(args: argparse.Namespace, config: Dict[str, Union[int, float, str]], project_name: str,
+                       logger: Optional[str] = None):
+    """
+    Set up the metrics logger of the run. Metrics are always appended to metrics.jsonl in the experiment
+    directory; unless args.no_wandb is set, rank 0 also publishes them to Weights and Biases. When wandb
+    cannot be initialized (e.g. offline), the run continues with the local file only.
+
+    The number of steps averaged per record is read from config.metrics.reduce_every (default 50).
+
+    :param args: The arguments from the command line.
+    :param config: The configuration dictionary for the experiment.
+    :param project_name: The name of the project on wandb.
+    :param logger: Optional logger name.
+    :return: A MetricsLogger.
+    """
+    from .metrics import JSONLSink, MetricsLogger, WandbSink, get_rank
+
+    rank = get_rank()
+    sinks = []
+    if rank == 0:
+        sinks.append(JSONLSink(os.path.join(args.experiment_path, 'metrics.jsonl')))
+        if not args.no_wandb:
+            try:
+                sinks.append(WandbSink(initialize_wandb(args=args, config=config, project_name=project_name)))
+            except Exception as e:
+                print_log(f'Weights and Biases is unavailable ({e}), logging metrics to metrics.jsonl only',
+                          logger=logger, level=logging.WARNING)
+    reduce_every = config.get('metrics', {}).get('reduce_every', 50)
+    return MetricsLogger(sinks, reduce_every=reduce_every, rank=rank, logger=logger)
+
+
+def peak_rss_mb(pid: int) -> float:
+    """
+    Peak resident set size (VmHWM) of a process, from /proc.
+
+    :param pid: The process id.
+    :return: The peak RSS in megabytes, or 0 if the process is gone.
+    """
+    try:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except FileNotFoundError:
+        pass
+    return 0.0
+
+
+def memory_mb(pid: int) -> float:
+    """
+    Memory of a process, from /proc: the proportional set size (PSS), so pages shared with forked
+    children (e.g. DataLoader workers) are split between them instead of counted in every process.
+    Falls back to the resident set size on kernels without smaps_rollup.
+
+    :param pid: The process id.
+    :return: The memory in megabytes, or 0 if the process is gone.
+    """
+    for path, field in ((f'/proc/{pid}/smaps_rollup', 'Pss:'), (f'/proc/{pid}/status', 'VmRSS:')):
+        try:
+            with open(path, 'r') as f:
+                for line in f:
+                    if line.startswith(field):
+                        return int(line.split()[1]) / 1024
+        except (FileNotFoundError, PermissionError):
+            continue
+    return 0.0
+
+
+def child_pids() -> List[int]:
+    """
+    Ids of the child processes of the current process (e.g. DataLoader workers), from /proc.
+
+    :return: The child process ids.
+    """
+    pid = os.getpid()
+    with open(f'/proc/{pid}/task/{pid}/children', 'r') as f:
+        return [int(child) for child in f.read().split()]
@@ -21,6 +21,16 @@ def get_args() -> argparse.Namespace:
     parser.add_argument('--eval_at_ckpnt', type=str, default=None, help='Path of a checkpoint to evaluate the model')
     parser.add_argument('--resume_training', action='store_true', help='Flag to resume interruped training')
     parser.add_argument('--deterministic', action='store_true', help='whether to set deterministic options for CUDNN backend.')
+    parser.add_argument('--no_wandb', action='store_true', help='Disable Weights and Biases tracking')
+    parser.add_argument('--dist_backend', type=str, default='auto', choices=['auto', 'nccl', 'gloo'],
+                        help='Process group backend when launched with torchrun; auto picks nccl with CUDA, else gloo')
+    parser.add_argument('--profile', action='store_true',
+                        help='Time the data loading and training stages and log summaries, see utils/profiling.py')
+    parser.add_argument('--profile_every', type=int, default=100, help='Optimizer steps between profile summaries')
+    parser.add_argument('--profile_trace_steps', type=int, default=0,
+                        help='With --profile, record a torch.profiler Chrome trace of this many steps')
+    parser.add_argument('--autotune', action='store_true',
+                        help='Tune the DataLoader settings before training, see the autotune section of the config')
 
     
     args = parser.parse_args()
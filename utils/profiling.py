@@ -0,0 +1,306 @@
+import os
+import sys
+import json
+import glob
+import time
+import functools
+import threading
+import contextlib
+import multiprocessing.util
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from .logger import print_log
+
+
+# Directory of the per-process profiles. enable() sets it in the environment, where worker_init picks it
+# up in spawned DataLoader workers; forked workers inherit the enabled state.
+PROFILE_DIR_ENV = 'DLT_PROFILE_DIR'
+# Seconds between writes of the profile of a process.
+PUBLISH_INTERVAL = 2.0
+
+_enabled = False
+_directory: Optional[str] = None
+# Timers of this process: name -> [calls, total seconds, max seconds].
+_timers: Dict[str, list] = {}
+# Counters of this process: name -> value.
+_counters: Dict[str, float] = {}
+_last_publish = 0.0
+_finalizer_registered = False
+# (rank, DataLoader worker id or None) of this process, see _source.
+_identity: Optional[tuple] = None
+# Wall-clock time profiling was enabled; older profile files are from earlier runs.
+_start = 0.0
+# Whether timers also emit torch.profiler ranges, while a trace is recorded.
+_record_functions = False
+_NULL = contextlib.nullcontext()
+# Guards the timers and counters: read-ahead threads record 'io.get' next to the main thread.
+_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    # A forked worker starts with empty stats instead of a copy of its parent's.
+    global _timers, _counters, _last_publish, _finalizer_registered, _identity, _lock
+    _timers, _counters, _lock = {}, {}, threading.Lock()
+    _last_publish, _finalizer_registered, _identity = 0.0, False, None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def enable(directory: str) -> None:
+    """
+    Enable profiling in this process and in the DataLoader workers started after this call (spawned
+    workers through worker_init).
+
+    :param directory: Directory of the per-process profile files, e.g. ``profile`` in the experiment directory.
+    """
+    global _enabled, _directory, _start
+    os.makedirs(directory, exist_ok=True)
+    os.environ[PROFILE_DIR_ENV] = _directory = str(directory)
+    _enabled = True
+    _start = time.time()
+
+
+def worker_init(worker_id: int) -> None:
+    """
+    DataLoader worker_init_fn that enables profiling in a spawned worker when its parent enabled it.
+    """
+    directory = os.environ.get(PROFILE_DIR_ENV)
+    if directory and not _enabled:
+        enable(directory)
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def _source() -> tuple:
+    # (rank, DataLoader worker id or None) of this process, taken while the worker runs: the worker info
+    # is gone when the exit finalizer publishes. torch is only consulted when it is loaded.
+    global _identity
+    if _identity is None:
+        worker = None
+        if 'torch' in sys.modules:
+            from torch.utils.data import get_worker_info
+            worker_info = get_worker_info()
+            worker = worker_info.id if worker_info is not None else None
+        _identity = (int(os.environ.get('RANK', 0)), worker)
+    return _identity
+
+
+def publish() -> None:
+    """
+    Write the timers and counters of this process to its profile file.
+    """
+    global _last_publish
+    if _directory is None:
+        return
+    rank, worker = _source()
+    name = f'rank{rank}-main.json' if worker is None else f'rank{rank}-worker{worker}-{os.getpid()}.json'
+    path = os.path.join(_directory, name)
+    with _lock:
+        profile = json.dumps({'rank': rank, 'worker': worker, 'timers': _timers, 'counters': _counters})
+    tmp_path = f'{path}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(profile)
+    os.replace(tmp_path, path)
+    _last_publish = time.monotonic()
+
+
+def _maybe_publish() -> None:
+    global _finalizer_registered
+    if not _finalizer_registered:
+        # Worker processes leave through os._exit, which skips atexit but runs multiprocessing finalizers.
+        multiprocessing.util.Finalize(None, publish, exitpriority=10)
+        _finalizer_registered = True
+        _source()
+    if time.monotonic() - _last_publish >= PUBLISH_INTERVAL:
+        publish()
+
+
+def _record(name: str, elapsed: float) -> None:
+    with _lock:
+        stats = _timers.get(name)
+        if stats is None:
+            stats = _timers[name] = [0, 0.0, 0.0]
+        stats[0] += 1
+        stats[1] += elapsed
+        if elapsed > stats[2]:
+            stats[2] = elapsed
+    _maybe_publish()
+
+
+class _Timer:
+    __slots__ = ('name', 'sync', 'start', 'range')
+
+    def __init__(self, name: str, sync: Optional[Callable[[], Any]] = None) -> None:
+        self.name = name
+        self.sync = sync
+        self.range = None
+
+    def __enter__(self) -> '_Timer':
+        if self.sync is not None:
+            self.sync()
+        if _record_functions:
+            import torch
+            self.range = torch.profiler.record_function(self.name)
+            self.range.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self.sync is not None:
+            self.sync()
+        elapsed = time.perf_counter() - self.start
+        if self.range is not None:
+            self.range.__exit__(*exc_info)
+        _record(self.name, elapsed)
+
+
+def timer(name: str, sync: Optional[Callable[[], Any]] = None):
+    """
+    Context manager timing a named stage. When profiling is disabled it is a shared no-op context.
+
+    :param name: The stage name, e.g. 'train.forward'.
+    :param sync: Optional function called before the start and end, e.g. torch.cuda.synchronize, so
+                 asynchronous device work is attributed to the stage.
+    :return: The context manager.
+    """
+    if not _enabled:
+        return _NULL
+    return _Timer(name, sync)
+
+
+def timed(name: str):
+    """
+    Decorator timing every call of a function as a named stage, see timer.
+
+    :param name: The stage name, e.g. 'io.get'.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Timer(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name: str, value: float = 1) -> None:
+    """
+    Add to a named counter, e.g. the number of loaded samples.
+    """
+    if _enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + value
+
+
+def _timed_iter(name: str, iterable: Iterable):
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        _record(name, time.perf_counter() - start)
+        yield item
+
+
+def iterate(name: str, iterable: Iterable) -> Iterable:
+    """
+    Time the wait for every item of an iterable as a named stage, e.g. the wait for DataLoader batches.
+
+    :param name: The stage name.
+    :param iterable: The iterable, returned as is when profiling is disabled.
+    :return: The (timed) iterable.
+    """
+    if not _enabled:
+        return iterable
+    return _timed_iter(name, iterable)
+
+
+def collect() -> Dict[int, Dict[str, Any]]:
+    """
+    Merge the profiles of all processes of this run: every rank with its DataLoader workers.
+
+    The profiles are read from the files the processes wrote last, so worker stats lag behind by up
+    to PUBLISH_INTERVAL seconds.
+
+    :return: Per rank, the merged 'timers' and 'counters' and the number of 'workers'.
+    """
+    publish()
+    merged: Dict[int, Dict[str, Any]] = {}
+    for path in glob.glob(os.path.join(_directory, 'rank*.json')):
+        try:
+            if os.path.getmtime(path) < _start:
+                continue
+            with open(path, 'r') as f:
+                profile = json.load(f)
+        except (OSError, ValueError):
+            continue
+        rank = merged.setdefault(profile['rank'], {'timers': {}, 'counters': {}, 'workers': 0})
+        rank['workers'] += profile['worker'] is not None
+        for name, (calls, total, longest) in profile['timers'].items():
+            stats = rank['timers'].setdefault(name, [0, 0.0, 0.0])
+            stats[0] += calls
+            stats[1] += total
+            stats[2] = max(stats[2], longest)
+        for name, value in profile['counters'].items():
+            rank['counters'][name] = rank['counters'].get(name, 0) + value
+    return merged
+
+
+def report(logger: Optional[str] = None) -> None:
+    """
+    Log a summary of all stages of the run: per rank, the calls, total, mean and max time of every stage,
+    summed over the rank's main process and DataLoader workers, slowest stages first. Every rank
+    writes its own profile; rank 0 logs the summary.
+
+    :param logger: Optional logger name.
+    """
+    if not _enabled:
+        return
+    if _source()[0] != 0:
+        publish()
+        return
+    for rank, profile in sorted(collect().items()):
+        prefix = f'[PROFILE] rank {rank} (main + {profile["workers"]} worker processes)'
+        for name, (calls, total, longest) in sorted(profile['timers'].items(), key=lambda item: -item[1][1]):
+            print_log(f'{prefix} {name}: {calls} calls, {total:.3f} s, {total / max(calls, 1) * 1e3:.3f} ms mean, '
+                      f'{longest * 1e3:.3f} ms max', logger=logger)
+        if profile['counters']:
+            print_log(f'{prefix} counters: ' + ', '.join(f'{name} {value:g}' for name, value in
+                                                        sorted(profile['counters'].items())), logger=logger)
+
+
+def trace_profiler(path: str, steps: int, cuda: bool = False, skip_first: int = 5, logger: Optional[str] = None):
+    """
+    A torch.profiler profile recording a Chrome trace of a few training steps. Call ``step()`` after
+    every batch. While it records, the stage timers also appear as ranges in the trace.
+
+    :param path: Path of the trace file, e.g. ``trace-rank0.json`` in the experiment directory.
+    :param steps: Number of steps to record.
+    :param cuda: Also record CUDA activity.
+    :param skip_first: Number of steps before recording starts, so start-up is not traced.
+    :param logger: Optional logger name.
+    :return: The profile, to start and stop around the training loop.
+    """
+    import torch
+
+    global _record_functions
+    activities = [torch.profiler.ProfilerActivity.CPU]
+    if cuda:
+        activities.append(torch.profiler.ProfilerActivity.CUDA)
+
+    def export(profile) -> None:
+        global _record_functions
+        _record_functions = False
+        profile.export_chrome_trace(path)
+        print_log(f'[PROFILE] Wrote the trace of {steps} steps to {path}', logger=logger)
+
+    _record_functions = True
+    return torch.profiler.profile(activities=activities, on_trace_ready=export,
+                                  schedule=torch.profiler.schedule(wait=skip_first, warmup=1, active=steps, repeat=1))
@@ -1,4 +1,6 @@
+import sys
 import inspect
+import importlib
 from functools import partial
 from utils import config
 
@@ -7,6 +9,9 @@ class Registry:
     A registry to map strings to classes.
     Registered object could be built from registry.
 
+    Modules can also be registered lazily by dotted import path with :meth:`register_lazy`. The
+    module is imported when the key is first looked up, so only the modules a config uses are loaded.
+
     :param name: Registry name.
     :param build_func: Build function to construct instance from Registry.
     :param parent: Parent registry.
@@ -16,12 +21,16 @@ class Registry:
     def __init__(self, name: str, build_func=None, parent=None, scope=None):
         self._name = name
         self._module_dict = dict()
+        # Lazily registered modules: key -> 'package.module.ClassName'.
+        self._lazy_dict = dict()
+        # Resolved lookups, including keys resolved through other registries of the tree.
+        self._lookup_cache = dict()
         self._children = dict()
         self._scope = self.infer_scope() if scope is None else scope
 
-        self.build_func = build_func or (parent.build_func if parent else build_from_cfg)
+        self.build_func = build_func or (parent.build_func if parent is not None else build_from_cfg)
         self.parent = parent
-        if parent:
+        if parent is not None:
             assert isinstance(parent, Registry)
             parent._add_children(self)
 
@@ -29,15 +38,18 @@ class Registry:
         return len(self._module_dict)
 
     def __contains__(self, key: str) -> bool:
-        return self.get(key) is not None
+        # Does not import lazily registered modules.
+        registry, real_key = self._locate(key)
+        return registry is not None
 
     def __repr__(self) -> str:
-        return f'{self.__class__.__name__}(name={self._name}, items={self._module_dict})'
+        return f'{self.__class__.__name__}(name={self._name}, items={self._module_dict}, lazy={self._lazy_dict})'
 
     @staticmethod
     def infer_scope() -> str:
-        filename = inspect.getmodule(inspect.stack()[2][0]).__name__
-        return filename.split('.')[0]
+        # Only the frame of the module constructing the registry is needed: infer_scope <- __init__ <- caller.
+        module_name = sys._getframe(2).f_globals.get('__name__', '')
+        return module_name.split('.')[0]
 
     @staticmethod
     def split_scope_key(key: str) -> tuple:
@@ -60,11 +72,60 @@ class Registry:
     def children(self) -> dict:
         return self._children
 
-    def get(self, key: str):
+    def _get_root(self) -> 'Registry':
+        root = self
+        while root.parent is not None:
+            root = root.parent
+        return root
+
+    def _locate(self, key: str) -> tuple:
+        """
+        Find the registry holding a key, without importing anything.
+
+        Keys scoped to this registry or unscoped are looked up here, then (unscoped) in the parents.
+        Keys scoped to a child are looked up in that child, other scopes are resolved from the root.
+
+        :param key: The key, optionally prefixed with a scope as in 'scope.key'.
+        :return: The registry and the key without scope, or (None, None).
+        """
         scope, real_key = self.split_scope_key(key)
-        if scope in {None, self._scope} and real_key in self._module_dict:
-            return self._module_dict[real_key]
-        return self._children.get(scope, self._get_root().get(key))
+        if scope is None or scope == self._scope:
+            if real_key in self._module_dict or real_key in self._lazy_dict:
+                return self, real_key
+            if scope is None and self.parent is not None:
+                return self.parent._locate(key)
+            return None, None
+        if scope in self._children:
+            return self._children[scope]._locate(real_key)
+        root = self._get_root()
+        return root._locate(key) if root is not self else (None, None)
+
+    def _import_lazy(self, key: str) -> None:
+        module_path, _, class_name = self._lazy_dict[key].rpartition('.')
+        module = importlib.import_module(module_path)
+        # Importing the module usually registers the class through its decorator.
+        if key not in self._module_dict:
+            self._register_module(getattr(module, class_name), module_name=key, force=True)
+        self._lazy_dict.pop(key, None)
+
+    def get(self, key: str):
+        """
+        Get the module registered under a key, importing it first if it was registered lazily.
+        Lookups are memoized.
+
+        :param key: The key, optionally prefixed with a scope as in 'scope.key'.
+        :return: The registered class, or None.
+        """
+        module_class = self._lookup_cache.get(key)
+        if module_class is not None:
+            return module_class
+        registry, real_key = self._locate(key)
+        if registry is None:
+            return None
+        if real_key not in registry._module_dict:
+            registry._import_lazy(real_key)
+        module_class = self._lookup_cache[key] = registry._module_dict[real_key]
+        return module_class
 
     def build(self, *args, **kwargs):
         return self.build_func(*args, **kwargs, registry=self)
@@ -74,12 +135,36 @@ class Registry:
         assert registry.scope and registry.scope not in self.children
         self.children[registry.scope] = registry
 
+    def _clear_lookup_cache(self) -> None:
+        # Lookups may be cached anywhere in the tree.
+        registries = [self._get_root()]
+        while registries:
+            registry = registries.pop()
+            registry._lookup_cache.clear()
+            registries.extend(registry.children.values())
+
     def _register_module(self, module_class, module_name=None, force=False):
         assert inspect.isclass(module_class)
         module_name = module_name or module_class.__name__
         if not force and module_name in self._module_dict:
             raise KeyError(f'{module_name} is already registered in {self.name}')
+        # A new or replaced key can shadow a lookup cached anywhere in the tree, e.g. a parent's module.
+        self._clear_lookup_cache()
         self._module_dict[module_name] = module_class
+        self._lazy_dict.pop(module_name, None)
+        return module_class
+
+    def register_lazy(self, name: str, import_path: str) -> None:
+        """
+        Register a module by dotted import path without importing it. The module is imported on the
+        first lookup of name.
+
+        :param name: The key to register.
+        :param import_path: Path of the class, e.g. 'dataset.part_net.ShapeNet'.
+        """
+        if name in self._module_dict or name in self._lazy_dict:
+            raise KeyError(f'{name} is already registered in {self.name}')
+        self._lazy_dict[name] = import_path
 
     def register_module(self, name=None, force=False, module=None):
         if module:
@@ -95,6 +180,8 @@ def build_from_cfg(cfg: dict, registry: Registry, default_args: dict = None):
     cfg = config.merge_new_config(cfg, default_args)
     obj_type = cfg.get('NAME')
     obj_cls = registry.get(obj_type) if isinstance(obj_type, str) else obj_type
+    if obj_cls is None:
+        raise KeyError(f'{obj_type} is not registered in {registry.name}')
     assert inspect.isclass(obj_cls)
     try:
         return obj_cls(cfg)